@@ -1,18 +1,39 @@
-from openai import OpenAI
+import asyncio
 import json
 import os
 from dotenv import load_dotenv
-import requests
+import httpx
+import time
+from collections import OrderedDict
+
+from model_router import create_router
 
 # Load environment variables from a .env file
 load_dotenv()
 
-openai_api_key = os.getenv("OPENAI_API_KEY")
-client = OpenAI(api_key=openai_api_key)
+# Each LLM call goes to the backend that meets the latency/cost target (see model_router.py)
+router = create_router()
 
 # --- CONFIGURATION ---
-# Try changing this to "junior-agent-secret" to see the Refund fail!
+# A signed JWT from `python token_auth.py mint ...`; mint one with only read:orders to see the Refund fail!
 API_TOKEN = os.getenv("API_TOKEN")
+API_BASE_URL = os.getenv("API_BASE_URL", "http://localhost:8000")
+
+# Tool execution limits
+TOOL_TIMEOUT_S = float(os.getenv("TOOL_TIMEOUT_S", "5"))
+TOOL_MAX_RETRIES = int(os.getenv("TOOL_MAX_RETRIES", "2"))
+RETRY_BACKOFF_S = 0.2
+RETRYABLE_STATUS = {502, 503, 504}
+MAX_AGENT_STEPS = 5
+# Conditional-GET cache for order lookups (bodies kept per URL, revalidated with ETags)
+ETAG_CACHE_MAX_ENTRIES = int(os.getenv("ETAG_CACHE_MAX_ENTRIES", "256"))
+
+# Opt-in (SEMANTIC_CACHE=1): repeat questions skip the LLM round trip. semantic_cache.py
+# (and with it chromadb and the embedding model) is only imported when the cache is on.
+cache = None
+if os.getenv("SEMANTIC_CACHE", "0") == "1":
+    from semantic_cache import SemanticCache, cache_context
+    cache = SemanticCache()
 
 # Base Headers that include the Security Token
 HEADERS = {
@@ -22,7 +43,7 @@ HEADERS = {
 
 
 # 1. Define the Tools (The Schema)
-# We now include BOTH "get_order" and "process_refund"
+# We now include "get_order", a bulk "get_orders" and "process_refund"
 tools = [
     {
         "type": "function",
@@ -38,6 +59,20 @@ tools = [
             }
         }
     },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_orders",
+            "description": "Get status and details of several orders in one call. Prefer this over repeated get_order calls.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "order_ids": {"type": "array", "items": {"type": "string"}}
+                },
+                "required": ["order_ids"]
+            }
+        }
+    },
     {
         "type": "function",
         "function": {
@@ -56,66 +91,218 @@ tools = [
 ]
 
 # 2. Define the Execution Logic (The "Glue" Code)
-def execute_tool_call(tool_call):
-    fn_name = tool_call.function.name
-    args = json.loads(tool_call.function.arguments)
-    
+def create_http_client() -> httpx.AsyncClient:
+    """One pooled, keep-alive client for every tool call the agent makes."""
+    return httpx.AsyncClient(
+        base_url=API_BASE_URL,
+        headers=HEADERS,
+        timeout=TOOL_TIMEOUT_S,
+        limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+    )
+
+class ETagCache:
+    """
+    Remembers the last tool result and ETag per GET URL. Repeat lookups send
+    If-None-Match, and a 304 reuses the stored result without downloading or
+    parsing the body again.
+    """
+
+    def __init__(self, max_entries: int = ETAG_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()   # url -> (etag, tool_result)
+        self.revalidated = 0
+        self.fetched = 0
+
+    def validators(self, url: str) -> dict:
+        entry = self._entries.get(url)
+        return {"If-None-Match": entry[0]} if entry else {}
+
+    def get(self, url: str):
+        entry = self._entries.get(url)
+        if entry is None:
+            return None
+        self._entries.move_to_end(url)
+        self.revalidated += 1
+        return entry[1]
+
+    def store(self, response: httpx.Response, result: str):
+        self.fetched += 1
+        etag = response.headers.get("ETag")
+        if response.status_code != 200 or not etag:
+            return
+        url = str(response.request.url)
+        self._entries[url] = (etag, result)
+        self._entries.move_to_end(url)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {"not_modified": self.revalidated, "full_fetches": self.fetched, "entries": len(self._entries)}
+
+etag_cache = ETagCache()
+
+async def send_with_retries(http: httpx.AsyncClient, method: str, url: str, idempotent: bool, **kwargs):
+    """
+    Sends a request with bounded retries and exponential backoff.
+
+    Connection failures are always retried because the request never reached the
+    server. Timeouts and 5xx gateway errors are only retried for idempotent calls,
+    so a refund can never be issued twice.
+    """
+    for attempt in range(TOOL_MAX_RETRIES + 1):
+        last_attempt = attempt == TOOL_MAX_RETRIES
+        try:
+            response = await http.request(method, url, **kwargs)
+        except httpx.ConnectError:
+            if last_attempt:
+                raise
+        except httpx.TimeoutException:
+            if last_attempt or not idempotent:
+                raise
+        else:
+            if response.status_code not in RETRYABLE_STATUS or last_attempt or not idempotent:
+                return response
+        await asyncio.sleep(RETRY_BACKOFF_S * 2 ** attempt)
+
+async def conditional_get(http: httpx.AsyncClient, url: str, params: dict = None) -> tuple:
+    """GET through the ETag cache. Returns (response, cached_result or None)."""
+    full_url = str(http.build_request("GET", url, params=params).url)
+    response = await send_with_retries(
+        http, "GET", url, idempotent=True, params=params, headers=etag_cache.validators(full_url)
+    )
+    if response.status_code == 304:
+        cached = etag_cache.get(full_url)
+        if cached is not None:
+            return response, cached
+        # Evicted by a concurrent lookup in the meantime: fetch the full body
+        response = await send_with_retries(http, "GET", url, idempotent=True, params=params)
+    return response, None
+
+async def execute_tool_call(http: httpx.AsyncClient, tool_call: dict) -> str:
+    fn_name = tool_call["function"]["name"]
+    args = json.loads(tool_call["function"]["arguments"])
+
     print(f"🔌 Executing API Call: {fn_name} with args {args}")
 
     try:
+        cached = None
         if fn_name == "get_order":
-            # Pass HEADERS here
-            response = requests.get(
-                f"http://localhost:8000/orders/{args.get('order_id')}",
-                headers=HEADERS 
+            response, cached = await conditional_get(http, f"/orders/{args.get('order_id')}")
+
+        elif fn_name == "get_orders":
+            # One round-trip for every order, instead of one request per order
+            response, cached = await conditional_get(
+                http, "/orders", params={"ids": ",".join(args.get("order_ids", []))}
             )
-        
+
         elif fn_name == "process_refund":
-            # Pass HEADERS here
-            response = requests.post(
-                f"http://localhost:8000/refunds", 
-                json=args,
-                headers=HEADERS
+            response = await send_with_retries(
+                http, "POST", "/refunds", idempotent=False, json=args
             )
-        
+
+        else:
+            return f"Error: Unknown tool {fn_name}"
+
+        # 304 Not Modified: the order hasn't changed since we last fetched it
+        if cached is not None:
+            return cached
+
         # Handle Security Errors nicely for the LLM
         if response.status_code == 401:
             return "Error: Authentication Failed. Check your token."
         if response.status_code == 403:
             return "Error: Permission Denied. You do not have the scope to perform this action."
-            
-        return response.json()
-            
+        if response.status_code >= 500:
+            return f"Error: {fn_name} failed with HTTP {response.status_code}. Try again later."
+
+        result = json.dumps(response.json())
+        etag_cache.store(response, result)
+        return result
+
+    except httpx.TimeoutException:
+        return f"Error: {fn_name} timed out after {TOOL_TIMEOUT_S}s."
     except Exception as e:
         return str(e)
 
 # 3. The Agent Loop
-def run_agent(user_query):
+def to_message_dict(message) -> dict:
+    """Plain-dict copy of an SDK assistant message, so it can be cached and replayed."""
+    result = {"role": "assistant", "content": message.content}
+    if message.tool_calls:
+        result["tool_calls"] = [
+            {"id": tc.id, "type": "function",
+             "function": {"name": tc.function.name, "arguments": tc.function.arguments}}
+            for tc in message.tool_calls
+        ]
+    return result
+
+async def ask_llm(messages: list) -> dict:
+    """One LLM step, answered from the semantic cache when a near-identical question was seen."""
+    if cache:
+        # Keyed by model: look up under the backend the router would pick now
+        ordered, _ = router.ranked()
+        context = cache_context(ordered[0].model if ordered else None, tools, messages, user_index=0)
+        hit = await asyncio.to_thread(cache.lookup, messages[0]["content"], context)
+        if hit:
+            message, similarity = hit
+            print(f"⚡ Semantic cache hit (similarity {similarity:.3f})")
+            return message
+
+    async def complete(backend):
+        response = await backend.client.chat.completions.create(
+            model=backend.model,
+            messages=messages,
+            tools=tools,
+            tool_choice="auto"
+        )
+        return backend.model, response
+
+    start_ts = time.perf_counter()
+    model, response = await router.run(complete, usage=lambda result: result[1].usage)
+    message = to_message_dict(response.choices[0].message)
+    if cache:
+        # ...and store under the one that actually answered
+        await asyncio.to_thread(cache.store, messages[0]["content"],
+                                cache_context(model, tools, messages, user_index=0), message,
+                                time.perf_counter() - start_ts)
+    return message
+
+async def run_agent(user_query, http: httpx.AsyncClient):
     print(f"👤 User: {user_query}")
-    
-    # Step A: Ask LLM what to do
     messages = [{"role": "user", "content": user_query}]
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=messages,
-        tools=tools,
-        tool_choice="auto" 
-    )
-    
-    # Step B: Check if LLM wants to use a tool
-    message = response.choices[0].message
-    if message.tool_calls:
-        tool_call = message.tool_calls[0]
-        print(f"🤖 LLM Thought: I need to call {tool_call.function.name}")
-        
-        # Step C: Execute the tool (Hit the API)
-        api_result = execute_tool_call(tool_call)
-        print(f"✅ API Result: {api_result}")
-    else:
-        print("🤖 LLM Response:", message.content)
+
+    for _ in range(MAX_AGENT_STEPS):
+        # Step A: Ask LLM what to do
+        message = await ask_llm(messages)
+
+        # Step B: Check if LLM wants to use tools
+        if not message.get("tool_calls"):
+            print("🤖 LLM Response:", message["content"])
+            return message["content"]
+
+        print(f"🤖 LLM Thought: I need to call {[tc['function']['name'] for tc in message['tool_calls']]}")
+        messages.append(message)
+
+        # Step C: Execute every tool call concurrently (Hit the API) and feed the results back
+        api_results = await asyncio.gather(*(execute_tool_call(http, tc) for tc in message["tool_calls"]))
+        for tool_call, api_result in zip(message["tool_calls"], api_results):
+            print(f"✅ API Result: {api_result}")
+            messages.append({"role": "tool", "tool_call_id": tool_call["id"], "content": api_result})
+
+    print("🤖 LLM Response: Stopped after reaching the tool-call step limit.")
 
 # Test Run
+async def main():
+    async with create_http_client() as http:
+        await run_agent("Can you check the status of order ORD-123?", http)
+        print("-" * 20)
+        await run_agent("I need a refund for ORD-123 because it arrived damaged.", http)
+    if cache:
+        print(f"💾 Semantic cache: {cache.stats()}")
+    print(f"🏷️ ETag cache: {etag_cache.stats()}")
+    print(f"🧭 Router: {json.dumps(router.stats(), indent=2)}")
+    for decision in router.recent_decisions():
+        print(f"   -> {decision['backend']}: {decision['reason']}")
+
 if __name__ == "__main__":
-    run_agent("Can you check the status of order ORD-123?")
-    print("-" * 20)
-    run_agent("I need a refund for ORD-123 because it arrived damaged.")
+    asyncio.run(main())
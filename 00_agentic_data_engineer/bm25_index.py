@@ -0,0 +1,280 @@
+import os
+import re
+import zipfile
+from array import array
+from collections import Counter
+
+import numpy as np
+
+# Keeps snake_case policy terms such as 'lost_in_transit' together as one token
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:_[a-z0-9]+)*")
+
+# Too common to help ranking; left out of the index and of queries
+STOPWORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being below between both
+but by can could did do does doing down during each few for from further had has have having he her here hers
+him his how i if in into is it its itself just me more most my no nor not now of off on once only or other our
+ours out over own same she should so some such than that the their theirs them then there these they this those
+through to too under until up very was we were what when where which while who whom why will with would you
+your yours
+""".split())
+
+MAX_TF = np.iinfo(np.uint16).max
+
+
+def tokenize(text: str) -> list:
+    """
+    Lowercases and splits text into terms, dropping STOPWORDS.
+
+    Compound terms are indexed both whole and by their parts, so 'lost_in_transit'
+    matches exact-keyword queries and also 'lost in transit'.
+    """
+    tokens = []
+    for token in TOKEN_RE.findall(text.lower()):
+        if "_" in token:
+            tokens.append(token)
+            tokens.extend(part for part in token.split("_") if part and part not in STOPWORDS)
+        elif token not in STOPWORDS:
+            tokens.append(token)
+    return tokens
+
+
+def reciprocal_rank_fusion(rankings: list, k: int = 60) -> list:
+    """Fuses several ranked id lists into one: score(id) = sum(1 / (k + rank))."""
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+def _pack_strings(strings: list) -> tuple:
+    """Strings -> (utf-8 blob, offsets), so a million ids cost one buffer instead of a million objects."""
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(e) for e in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8).copy(), offsets
+
+
+class BM25Index:
+    """
+    Compact in-memory Okapi BM25 inverted index over the knowledge-base chunks.
+
+    Postings are stored CSR-style in flat numpy arrays: the chunks containing term
+    id t are post_docs[post_offsets[t]:post_offsets[t+1]] (ascending row numbers)
+    with their term frequencies in post_tfs. Only term frequencies are kept (the
+    chunk text stays in Chroma), and the arrays are persisted as one .npz file next
+    to the Chroma collection, so the MCP server loads them without parsing anything.
+
+    add()/remove() only record the change; the arrays are rebuilt once, on the next
+    search() or save(), so an ingest run pays for one rebuild however many chunks it
+    touches.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._terms = []                                   # term id -> term
+        self._vocab = {}                                   # term -> term id
+        self._post_offsets = np.zeros(1, dtype=np.int64)
+        self._post_docs = np.empty(0, dtype=np.int32)
+        self._post_tfs = np.empty(0, dtype=np.uint16)
+        self._doc_len = np.empty(0, dtype=np.int32)        # row -> number of terms
+        self._id_blob, self._id_offsets = _pack_strings([])
+        self._alive = np.empty(0, dtype=bool)              # False once a row is removed
+        self._rows = None                                  # doc_id -> row, built on first add/remove
+        # Chunks added since the arrays were last rebuilt
+        self._new_ids = {}                                 # doc_id -> position in the lists below
+        self._new_terms, self._new_tfs = [], []
+        self._removed = 0
+        self.changed = False                               # anything to save since load()
+        self._prepare()
+
+    def __len__(self):
+        return len(self._doc_len) - self._removed + len(self._new_ids)
+
+    def __contains__(self, doc_id):
+        return doc_id in self._new_ids or doc_id in self._row_index()
+
+    def doc_ids(self) -> list:
+        packed = [self._doc_id(row) for row in np.flatnonzero(self._alive)]
+        return packed + list(self._new_ids)
+
+    def has_term(self, term: str) -> bool:
+        self._pack()
+        return term in self._vocab
+
+    def _doc_id(self, row: int) -> str:
+        return self._id_blob[self._id_offsets[row]:self._id_offsets[row + 1]].tobytes().decode("utf-8")
+
+    def _row_index(self) -> dict:
+        if self._rows is None:
+            self._rows = {self._doc_id(row): int(row) for row in np.flatnonzero(self._alive)}
+        return self._rows
+
+    def add(self, doc_id: str, text: str):
+        """Indexes a chunk, replacing any previous version with the same id."""
+        self.remove(doc_id)
+        terms = Counter(tokenize(text))
+        for term in terms:
+            if term not in self._vocab:
+                self._vocab[term] = len(self._terms)
+                self._terms.append(term)
+        self._new_ids[doc_id] = len(self._new_terms)
+        self._new_terms.append(array("i", (self._vocab[term] for term in terms)))
+        self._new_tfs.append(array("H", (min(tf, MAX_TF) for tf in terms.values())))
+        self.changed = True
+
+    def remove(self, doc_id: str):
+        if doc_id in self._new_ids:
+            # Dropped from the pending set; its slot in the lists is skipped when packing
+            self._new_terms[self._new_ids.pop(doc_id)] = None
+            self.changed = True
+            return
+        row = self._row_index().pop(doc_id, None)
+        if row is not None:
+            self._alive[row] = False
+            self._removed += 1
+            self.changed = True
+
+    def _pack(self):
+        """Folds pending adds and removes into the posting arrays."""
+        if not self._new_ids and not self._removed:
+            return
+        # Surviving postings, renumbered to close the gaps left by removed rows
+        kept_rows = np.flatnonzero(self._alive)
+        renumber = np.cumsum(self._alive, dtype=np.int64) - 1
+        entry_terms = np.repeat(np.arange(len(self._post_offsets) - 1), np.diff(self._post_offsets))
+        keep = self._alive[self._post_docs]
+        terms = [entry_terms[keep]]
+        docs = [renumber[self._post_docs[keep]]]
+        tfs = [self._post_tfs[keep]]
+        doc_len = [self._doc_len[kept_rows]]
+        id_lengths = np.diff(self._id_offsets)
+        ids = [self._id_blob[np.repeat(self._alive, id_lengths)]]
+        id_lengths = [id_lengths[kept_rows]]
+
+        new_ids, slots = list(self._new_ids), list(self._new_ids.values())
+        if slots:
+            counts = np.array([len(self._new_terms[s]) for s in slots], dtype=np.int64)
+            terms.append(np.concatenate([np.frombuffer(self._new_terms[s], dtype=np.int32) for s in slots]))
+            tfs.append(np.concatenate([np.frombuffer(self._new_tfs[s], dtype=np.uint16) for s in slots]))
+            docs.append(np.repeat(np.arange(len(kept_rows), len(kept_rows) + len(slots)), counts))
+            doc_len.append(np.array([sum(self._new_tfs[s]) for s in slots], dtype=np.int32))
+            blob, offsets = _pack_strings(new_ids)
+            ids.append(blob)
+            id_lengths.append(np.diff(offsets))
+
+        terms, docs, tfs = np.concatenate(terms), np.concatenate(docs), np.concatenate(tfs)
+        # Terms no chunk uses any more are dropped from the vocabulary
+        used = np.bincount(terms, minlength=len(self._terms)) > 0
+        term_map = np.cumsum(used) - 1
+        self._terms = [term for term, keep_term in zip(self._terms, used) if keep_term]
+        self._vocab = {term: i for i, term in enumerate(self._terms)}
+        order = np.lexsort((docs, term_map[terms]))
+        self._post_docs = docs[order].astype(np.int32)
+        self._post_tfs = tfs[order]
+        self._post_offsets = np.zeros(len(self._terms) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_map[terms], minlength=len(self._terms)), out=self._post_offsets[1:])
+        self._doc_len = np.concatenate(doc_len).astype(np.int32)
+        self._id_blob = np.concatenate(ids)
+        self._id_offsets = np.zeros(len(self._doc_len) + 1, dtype=np.int64)
+        np.cumsum(np.concatenate(id_lengths), out=self._id_offsets[1:])
+        self._alive = np.ones(len(self._doc_len), dtype=bool)
+        self._rows = None
+        self._new_ids, self._new_terms, self._new_tfs = {}, [], []
+        self._removed = 0
+        self._prepare()
+
+    def _prepare(self):
+        """Per-document length norms and per-term score upper bounds used by search()."""
+        n_docs = len(self._doc_len)
+        avg_len = self._doc_len.mean() if n_docs else 1.0
+        self._norm = (self.k1 * (1 - self.b + self.b * self._doc_len / avg_len)).astype(np.float32)
+        df = np.diff(self._post_offsets)
+        self._idf = np.log(1 + (n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+        # A term's contribution grows with tf and shrinks with the length norm, so its
+        # largest tf over the shortest chunk's norm bounds every score it can add
+        if len(self._post_tfs):
+            max_tf = np.maximum.reduceat(self._post_tfs, self._post_offsets[:-1]).astype(np.float32)
+            self._upper = self._idf * max_tf * (self.k1 + 1) / (max_tf + self._norm.min())
+        else:
+            self._upper = np.empty(0, dtype=np.float32)
+
+    def _impacts(self, tfs: np.ndarray, rows: np.ndarray, idf: float) -> np.ndarray:
+        tf = tfs.astype(np.float32)
+        return idf * tf * (self.k1 + 1) / (tf + self._norm[rows])
+
+    def search(self, query: str, k: int = 10) -> list:
+        """
+        Returns [(doc_id, score)] for the top-k chunks, best first.
+
+        Max-score evaluation: query terms are scored in order of their upper bounds.
+        Once the bounds of the terms still to come add up to less than the current
+        k-th best score, no chunk that has not been seen yet can make the top-k, so
+        the remaining (usually long, common-term) postings are only probed for the
+        surviving candidates instead of being scanned.
+        """
+        self._pack()
+        term_ids = sorted({self._vocab[t] for t in tokenize(query) if t in self._vocab},
+                          key=lambda t: -self._upper[t])
+        if not term_ids or k <= 0:
+            return []
+        remaining = np.cumsum([self._upper[t] for t in reversed(term_ids)])[::-1].tolist() + [0.0]
+        scores = np.zeros(len(self._doc_len), dtype=np.float32)
+        candidates = np.empty(0, dtype=np.int64)
+        pruned = False
+        for i, term_id in enumerate(term_ids):
+            lo, hi = self._post_offsets[term_id], self._post_offsets[term_id + 1]
+            rows = self._post_docs[lo:hi]
+            if not pruned:
+                scores[rows] += self._impacts(self._post_tfs[lo:hi], rows, self._idf[term_id])
+                candidates = np.union1d(candidates, rows)
+            else:
+                pos = np.minimum(np.searchsorted(rows, candidates), len(rows) - 1)
+                hit = rows[pos] == candidates
+                scores[candidates[hit]] += self._impacts(self._post_tfs[lo + pos[hit]], candidates[hit],
+                                                        self._idf[term_id])
+            if len(candidates) > k:
+                threshold = np.partition(scores[candidates], -k)[-k]
+                if pruned or remaining[i + 1] < threshold:
+                    pruned = True
+                    candidates = candidates[scores[candidates] + remaining[i + 1] >= threshold]
+        top = candidates[np.argsort(-scores[candidates], kind="stable")[:k]]
+        return [(self._doc_id(row), float(scores[row])) for row in top]
+
+    def save(self, path: str):
+        self._pack()
+        # Write-then-rename so the server never loads a half-written index
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        term_blob, term_offsets = _pack_strings(self._terms)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, params=np.array([self.k1, self.b]), term_blob=term_blob, term_offsets=term_offsets,
+                     post_offsets=self._post_offsets, post_docs=self._post_docs, post_tfs=self._post_tfs,
+                     doc_len=self._doc_len, id_blob=self._id_blob, id_offsets=self._id_offsets)
+        os.replace(tmp_path, path)
+        self.changed = False
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        """Loads a saved index, or returns an empty one if none exists yet."""
+        try:
+            with np.load(path) as data:
+                arrays = {name: data[name] for name in data.files}
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            return cls()
+        k1, b = arrays["params"].tolist()
+        index = cls(k1=k1, b=b)
+        term_blob, term_offsets = arrays["term_blob"].tobytes(), arrays["term_offsets"]
+        index._terms = [term_blob[term_offsets[i]:term_offsets[i + 1]].decode("utf-8")
+                        for i in range(len(term_offsets) - 1)]
+        index._vocab = {term: i for i, term in enumerate(index._terms)}
+        index._post_offsets = arrays["post_offsets"]
+        index._post_docs = arrays["post_docs"]
+        index._post_tfs = arrays["post_tfs"]
+        index._doc_len = arrays["doc_len"]
+        index._id_blob, index._id_offsets = arrays["id_blob"], arrays["id_offsets"]
+        index._alive = np.ones(len(index._doc_len), dtype=bool)
+        index._prepare()
+        return index
@@ -0,0 +1,158 @@
+import json
+
+try:
+    import tiktoken
+except ImportError:  # fall back to a ~4 characters/token estimate
+    tiktoken = None
+
+# --- CONFIGURATIONS ---
+DEFAULT_TOKEN_BUDGET = 6000       # history tokens sent with every LLM call
+DEFAULT_KEEP_RECENT_TURNS = 3     # turns that are always kept verbatim
+DEFAULT_MAX_TOOL_OUTPUT_TOKENS = 300
+DEFAULT_MAX_SUMMARY_TOKENS = 800
+SUMMARY_SNIPPET_CHARS = 160
+MESSAGE_OVERHEAD_TOKENS = 4       # role/separator tokens OpenAI adds per message
+
+
+class TokenCounter:
+    def __init__(self, model: str):
+        self._encoding = None
+        if tiktoken is not None:
+            try:
+                self._encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                self._encoding = tiktoken.get_encoding("o200k_base")
+
+    def count_text(self, text: str) -> int:
+        if not text:
+            return 0
+        if self._encoding is None:
+            return len(text) // 4 + 1
+        return len(self._encoding.encode(text))
+
+    def count_message(self, message: dict) -> int:
+        tokens = MESSAGE_OVERHEAD_TOKENS + self.count_text(message.get("content") or "")
+        for call in message.get("tool_calls") or []:
+            tokens += self.count_text(call["function"]["name"]) + self.count_text(call["function"]["arguments"])
+        return tokens
+
+    def count_messages(self, messages: list) -> int:
+        return sum(self.count_message(m) for m in messages)
+
+
+def _snippet(text: str, limit: int = SUMMARY_SNIPPET_CHARS) -> str:
+    text = " ".join((text or "").split())
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+class ConversationMemory:
+    """
+    Token-budgeted chat history for the host's agent loop.
+
+    The system prompt and the most recent turns are always sent verbatim. When the
+    history goes over `token_budget`, the oldest turns are folded into a short
+    running summary, and bulky tool outputs from earlier turns are trimmed, so the
+    prompt size stays roughly flat over a long support session instead of growing
+    with every turn.
+
+    Usage per turn:
+        messages = memory.begin_turn(user_query)   # prompt to send, extend it in place
+        ... run the tool loop on `messages` ...
+        memory.end_turn(messages)
+    """
+
+    def __init__(
+        self,
+        system_prompt: str,
+        model: str,
+        token_budget: int = DEFAULT_TOKEN_BUDGET,
+        keep_recent_turns: int = DEFAULT_KEEP_RECENT_TURNS,
+        max_tool_output_tokens: int = DEFAULT_MAX_TOOL_OUTPUT_TOKENS,
+        max_summary_tokens: int = DEFAULT_MAX_SUMMARY_TOKENS,
+    ):
+        self.system_prompt = system_prompt
+        self.token_budget = token_budget
+        self.keep_recent_turns = keep_recent_turns
+        self.max_tool_output_tokens = max_tool_output_tokens
+        self.max_summary_tokens = max_summary_tokens
+        self.counter = TokenCounter(model)
+        self._turns = []           # [[message, ...], ...], each turn starts with the user message
+        self._summary_lines = []   # one line per compacted turn, oldest first
+        self._prefix_len = 0
+
+    # --- prompt assembly ---
+
+    def _base_messages(self) -> list:
+        messages = [{"role": "system", "content": self.system_prompt}]
+        if self._summary_lines:
+            messages.append({
+                "role": "system",
+                "content": "Summary of earlier conversation:\n" + "\n".join(self._summary_lines),
+            })
+        for turn in self._turns:
+            messages.extend(turn)
+        return messages
+
+    def begin_turn(self, user_query: str) -> list:
+        """Returns the prompt for a new turn: system prompt, summary, recent history, user query."""
+        messages = self._base_messages()
+        self._prefix_len = len(messages)
+        messages.append({"role": "user", "content": user_query})
+        return messages
+
+    def end_turn(self, messages: list):
+        """Records everything the turn added (user query, tool calls, answer) and compacts."""
+        self._turns.append(messages[self._prefix_len:])
+        self._compact()
+
+    def prompt_tokens(self, messages: list = None) -> int:
+        return self.counter.count_messages(messages if messages is not None else self._base_messages())
+
+    # --- compaction ---
+
+    def _compact(self):
+        # 1. Bulky tool outputs only matter on the turn that fetched them, so trim
+        #    the previous turn's outputs now that a newer turn has been recorded
+        if len(self._turns) > 1:
+            for message in self._turns[-2]:
+                if message["role"] == "tool":
+                    self._trim_tool_output(message)
+
+        # 2. Fold the oldest turns into the summary until we fit the budget
+        while len(self._turns) > self.keep_recent_turns and self.prompt_tokens() > self.token_budget:
+            self._summary_lines.append(self._summarize_turn(self._turns.pop(0)))
+
+        # 3. Keep the summary itself bounded: the oldest lines go first
+        while len(self._summary_lines) > 1 and \
+                self.counter.count_text("\n".join(self._summary_lines)) > self.max_summary_tokens:
+            self._summary_lines.pop(0)
+
+    def _trim_tool_output(self, message: dict):
+        content = message.get("content") or ""
+        tokens = self.counter.count_text(content)
+        if tokens > self.max_tool_output_tokens:
+            keep_chars = self.max_tool_output_tokens * 4
+            message["content"] = f"{content[:keep_chars]}\n…[trimmed {tokens - self.max_tool_output_tokens} tokens]"
+
+    @staticmethod
+    def _summarize_turn(turn: list) -> str:
+        """One extractive line per turn; cheap and deterministic, no extra LLM call."""
+        parts = []
+        for message in turn:
+            if message["role"] == "user":
+                parts.append(f"User: {_snippet(message['content'])}")
+            elif message["role"] == "assistant":
+                for call in message.get("tool_calls") or []:
+                    raw_args = call["function"].get("arguments") or "{}"
+                    try:
+                        args = json.loads(raw_args)
+                    except json.JSONDecodeError:
+                        args = None
+                    # Models sometimes emit truncated or invalid arguments; summarize them as sent
+                    args_text = json.dumps(args) if isinstance(args, dict) else raw_args
+                    parts.append(f"Called {call['function']['name']}({_snippet(args_text, 80)})")
+                if message.get("content"):
+                    parts.append(f"Assistant: {_snippet(message['content'])}")
+            elif message["role"] == "tool":
+                parts.append(f"-> {_snippet(message['content'], 80)}")
+        return "- " + " | ".join(parts)
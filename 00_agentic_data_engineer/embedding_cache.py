@@ -0,0 +1,258 @@
+import fcntl
+import hashlib
+import os
+import threading
+import time
+
+import numpy as np
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
+from chromadb.utils import embedding_functions
+
+# --- CONFIGURATIONS ---
+EMBED_MODEL = "all-MiniLM-L6-v2"
+CACHE_DIR = os.getenv("EMBED_CACHE_DIR", "./embedding_cache")
+CACHE_MAX_ENTRIES = int(os.getenv("EMBED_CACHE_MAX_ENTRIES", "100000"))
+
+# Index layout (one uint64 memmap of 3 columns):
+#   row 0         -> [capacity, dim, generation]
+#   row 1         -> [changes_written, CHANGE_LOG_ROWS, 0]
+#   change log    -> CHANGE_LOG_ROWS rows of [slot, generation, 0], a ring buffer of written slots
+#   slots         -> capacity rows of [key_hi, key_lo, last_used_ns]   (key == 0,0 means the slot is empty)
+CHANGE_LOG_ROWS = 8192
+_HEADER_ROWS = 2
+_SLOTS_START = _HEADER_ROWS + CHANGE_LOG_ROWS
+
+
+def cache_key(model_name: str, text: str) -> tuple:
+    """Content address of a vector: 128 bits of sha256(model, text) split into two uint64s."""
+    digest = hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:16], "little")
+
+
+class CachedEmbeddingFunction(EmbeddingFunction[Documents]):
+    """
+    Wraps SentenceTransformerEmbeddingFunction with a persistent, content-addressed cache.
+
+    Vectors live in a memory-mapped float32 file and their keys/recency in a uint64
+    index file, so a text that was embedded once (by ingestion or by a query) is never
+    sent through the model again, even across restarts. Once `max_entries` is reached
+    the least recently used slot is overwritten. The model itself is only loaded on
+    the first cache miss.
+
+    Several processes (e.g. ingest_knowledge.py and mcp_server.py) can share one cache
+    directory: slot allocation happens under an exclusive file lock and every hit is
+    verified against the key stored in the slot. Each write also records its slots in
+    a change log, so the other processes update their key -> slot maps from the log
+    instead of rescanning the whole index.
+    """
+
+    def __init__(self, model_name: str = EMBED_MODEL, cache_dir: str = CACHE_DIR,
+                 max_entries: int = CACHE_MAX_ENTRIES):
+        self.model_name = model_name
+        self.max_entries = max_entries
+        os.makedirs(cache_dir, exist_ok=True)
+        base = os.path.join(cache_dir, model_name.replace("/", "__"))
+        self._vectors_path = base + ".f32"
+        self._index_path = base + ".index"
+        self._lock_path = base + ".lock"
+
+        self._model = None
+        self._vectors = None
+        self._index = None
+        self._slots = {}            # (key_hi, key_lo) -> slot, kept in step via the change log
+        self._slot_keys = {}        # slot -> (key_hi, key_lo), to drop keys whose slot was reused
+        self._generation = -1
+        self._changes_seen = None   # change-log entries applied to self._slots, None before the first scan
+        self._lock = threading.Lock()
+        self._model_lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if os.path.exists(self._index_path):
+            self._open()
+
+    # --- storage ---
+
+    def _open(self, dim: int = None):
+        """Maps the cache files, creating (or resetting) them if `dim` is given and they don't match."""
+        if os.path.exists(self._index_path):
+            header = np.fromfile(self._index_path, dtype=np.uint64, count=2 * 3).reshape(-1, 3)
+            capacity, stored_dim = int(header[0, 0]), int(header[0, 1])
+            # Files from before the change log have a different layout and are started afresh
+            current_layout = (len(header) == 2 and int(header[1, 1]) == CHANGE_LOG_ROWS and
+                              os.path.getsize(self._index_path) == (capacity + _SLOTS_START) * 3 * 8)
+            if current_layout and capacity == self.max_entries and (dim is None or stored_dim == dim):
+                self._index = np.memmap(self._index_path, dtype=np.uint64, mode="r+",
+                                        shape=(capacity + _SLOTS_START, 3))
+                self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r+",
+                                          shape=(capacity, stored_dim))
+                self._refresh_slots()
+                return
+        if dim is None:
+            return
+
+        # New cache (or the model/capacity changed): start from an empty, sparse file
+        self._index = np.memmap(self._index_path, dtype=np.uint64, mode="w+",
+                                shape=(self.max_entries + _SLOTS_START, 3))
+        self._index[0] = (self.max_entries, dim, 0)
+        self._index[1] = (0, CHANGE_LOG_ROWS, 0)
+        self._index.flush()
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="w+",
+                                  shape=(self.max_entries, dim))
+        self._slots = {}
+        self._slot_keys = {}
+        self._generation = 0
+        self._changes_seen = 0
+
+    def _set_slot(self, slot: int, key: tuple):
+        old_key = self._slot_keys.pop(slot, None)
+        if old_key is not None and self._slots.get(old_key) == slot:
+            del self._slots[old_key]
+        if key != (0, 0):
+            self._slots[key] = slot
+            self._slot_keys[slot] = key
+
+    def _refresh_slots(self):
+        """Applies writes made by other processes to the in-memory key -> slot map."""
+        # Writers update slots, then the log, then changes_written, then the generation,
+        # so every logged slot below `written` is complete by the time we read it
+        generation = int(self._index[0, 2])
+        if generation == self._generation:
+            return
+        written = int(self._index[1, 0])
+        if self._changes_seen is not None and 0 <= written - self._changes_seen <= CHANGE_LOG_ROWS:
+            positions = np.arange(self._changes_seen, written) % CHANGE_LOG_ROWS
+            changed = np.unique(self._index[_HEADER_ROWS + positions, 0].astype(np.int64))
+            rows = self._index[_SLOTS_START + changed]
+            for slot, (key_hi, key_lo, _) in zip(changed.tolist(), rows.tolist()):
+                self._set_slot(slot, (key_hi, key_lo))
+        else:
+            # First look, or so far behind that the ring buffer has wrapped: full scan
+            entries = self._index[_SLOTS_START:]
+            used = np.nonzero(entries[:, 0] | entries[:, 1])[0]
+            self._slots, self._slot_keys = {}, {}
+            for slot in used.tolist():
+                self._set_slot(slot, (int(entries[slot, 0]), int(entries[slot, 1])))
+        self._generation = generation
+        self._changes_seen = written
+
+    def _lookup(self, key: tuple):
+        slot = self._slots.get(key)
+        if slot is None:
+            return None
+        row = self._index[_SLOTS_START + slot]
+        if int(row[0]) != key[0] or int(row[1]) != key[1]:
+            # Another process reused this slot since we last looked
+            self._set_slot(slot, (int(row[0]), int(row[1])))
+            return None
+        row[2] = time.time_ns()
+        vector = np.array(self._vectors[slot])
+        if int(row[0]) != key[0] or int(row[1]) != key[1]:
+            # ...or is rewriting it right now, so the copy may be half old, half new
+            return None
+        return vector
+
+    def _store(self, keys: list, vectors: np.ndarray):
+        with open(self._lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                if self._index is None or self._vectors.shape[1] != vectors.shape[1]:
+                    self._open(dim=vectors.shape[1])
+                self._refresh_slots()
+                entries = self._index[_SLOTS_START:]
+                new = [(key, vector) for key, vector in zip(keys, vectors) if key not in self._slots]
+                new = new[-self.max_entries:]
+                if new:
+                    # Empty slots have last_used == 0, so they are picked before any LRU victim
+                    if len(new) < self.max_entries:
+                        targets = np.argpartition(entries[:, 2], len(new) - 1)[:len(new)]
+                    else:
+                        targets = np.arange(self.max_entries)
+                    for slot, (key, vector) in zip(targets.tolist(), new):
+                        if entries[slot, 0] or entries[slot, 1]:
+                            self.evictions += 1
+                        entries[slot] = (0, 0, 0)  # invalidate before the vector is rewritten
+                        self._vectors[slot] = vector
+                        entries[slot] = (key[0], key[1], time.time_ns())
+                        self._set_slot(slot, key)
+                    written = int(self._index[1, 0])
+                    positions = np.arange(written, written + len(targets)) % CHANGE_LOG_ROWS
+                    self._index[_HEADER_ROWS + positions, 0] = targets
+                    self._index[_HEADER_ROWS + positions, 1] = int(self._index[0, 2]) + 1
+                    self._index[1, 0] = written + len(targets)
+                self._index[0, 2] += 1
+                self._generation = int(self._index[0, 2])
+                self._changes_seen = int(self._index[1, 0])
+                self._vectors.flush()
+                self._index.flush()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    # --- embedding ---
+
+    def load_model(self, device: str = None):
+        """
+        Loads the model now rather than on the first cache miss, e.g. to warm up a server.
+        `device` (e.g. "cpu") only applies to the first load; None lets the model pick.
+        """
+        with self._model_lock:
+            if self._model is None:
+                kwargs = {"device": device} if device else {}
+                self._model = embedding_functions.SentenceTransformerEmbeddingFunction(
+                    model_name=self.model_name, **kwargs)
+        return self._model
+
+    def _embed(self, texts: list) -> np.ndarray:
+        return np.asarray(self.load_model()(texts), dtype=np.float32)
+
+    def __call__(self, input: Documents) -> Embeddings:
+        keys = [cache_key(self.model_name, text) for text in input]
+        results = [None] * len(input)
+
+        with self._lock:
+            if self._index is not None:
+                self._refresh_slots()
+                for i, key in enumerate(keys):
+                    results[i] = self._lookup(key)
+            missing = [i for i, vector in enumerate(results) if vector is None]
+            self.hits += len(input) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            # Embed each distinct text once, even if it repeats within the batch. The model
+            # runs outside self._lock, so other threads' cache hits are not held up behind it.
+            unique = {}
+            for i in missing:
+                unique.setdefault(keys[i], input[i])
+            vectors = self._embed(list(unique.values()))
+            with self._lock:
+                self._store(list(unique.keys()), vectors)
+            by_key = dict(zip(unique.keys(), vectors))
+            for i in missing:
+                results[i] = by_key[keys[i]]
+
+        return results
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._slots),
+            "capacity": self.max_entries,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+_shared = None
+
+
+def get_embedding_function() -> CachedEmbeddingFunction:
+    """Process-wide cached embedding function, so every caller shares one model and one cache."""
+    global _shared
+    if _shared is None:
+        _shared = CachedEmbeddingFunction()
+    return _shared
@@ -0,0 +1,103 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from embedding_cache import get_embedding_function
+
+# Tokenizers' own thread pool doesn't survive fork() and would warn in every worker
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+# --- CONFIGURATIONS ---
+THREADS_PER_WORKER = int(os.getenv("EMBED_THREADS_PER_WORKER", "1"))
+
+# Per-process counters, only meaningful inside a worker
+_worker = {"batches": 0, "texts": 0, "busy_s": 0.0}
+
+
+def _init_worker(threads: int):
+    # One intra-op thread per worker, so N workers use N cores instead of fighting over them
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+
+def _ping(_) -> int:
+    return os.getpid()
+
+
+def _embed_in_worker(texts: list) -> tuple:
+    """Runs in a worker: embed through the inherited (already loaded) model and shared cache."""
+    start_ts = time.perf_counter()
+    embed_fn = get_embedding_function()
+    vectors = np.asarray(embed_fn(texts), dtype=np.float32)
+    _worker["batches"] += 1
+    _worker["texts"] += len(texts)
+    _worker["busy_s"] += time.perf_counter() - start_ts
+    return vectors, {"pid": os.getpid(), **_worker, "cache": embed_fn.stats()}
+
+
+class EmbeddingPool:
+    """
+    Embeds queries in N forked worker processes that share one preloaded model.
+
+    start() loads the MiniLM model in the parent, on the CPU, then forks the workers,
+    so they inherit the weights copy-on-write instead of each loading its own copy.
+    (GPU/MPS state does not survive fork(), hence the CPU.) All SSE sessions feed the
+    same pool, so query embedding scales with cores while the server's event loop
+    stays in one process. Workers share the on-disk embedding cache, which is safe
+    across processes.
+
+    Call start() from the main thread, before other threads are started and before the
+    model has run: fork() only copies the calling thread, so a lock held elsewhere
+    (including torch's intra-op thread pool) would stay locked in the workers.
+    """
+
+    def __init__(self, workers: int, threads_per_worker: int = THREADS_PER_WORKER):
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker
+        self._executor = None
+        self._per_worker = {}    # pid -> latest counters reported by that worker
+        self._lock = threading.Lock()
+
+    def start(self) -> "EmbeddingPool":
+        get_embedding_function().load_model(device="cpu")
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("fork"),
+            initializer=_init_worker,
+            initargs=(self.threads_per_worker,),
+        )
+        # With fork, every worker is started on the first submit; wait for them here,
+        # at a known-safe moment, rather than on the first user query
+        pids = set(self._executor.map(_ping, range(self.workers)))
+        with self._lock:
+            for pid in pids:
+                self._per_worker.setdefault(pid, {"pid": pid, "batches": 0, "texts": 0, "busy_s": 0.0})
+        return self
+
+    def embed(self, texts: list) -> list:
+        """Blocking: returns one vector per text. Call it from a worker thread, not the event loop."""
+        vectors, worker_stats = self._executor.submit(_embed_in_worker, list(texts)).result()
+        with self._lock:
+            self._per_worker[worker_stats["pid"]] = worker_stats
+        return vectors.tolist()
+
+    def stats(self) -> dict:
+        with self._lock:
+            per_worker = [dict(s, busy_s=round(s["busy_s"], 3)) for s in self._per_worker.values()]
+        return {
+            "workers": self.workers,
+            "batches": sum(s["batches"] for s in per_worker),
+            "texts": sum(s["texts"] for s in per_worker),
+            "per_worker": per_worker,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
@@ -1,57 +1,422 @@
+import argparse
+import hashlib
+import json
+import os
+import queue
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
 import chromadb
-from chromadb.utils import embedding_functions
+
+from bm25_index import BM25Index
+from embedding_cache import EMBED_MODEL, get_embedding_function
 
 # --CONFIGURATIONS ---
 DB_PATH = "./chroma_db"
 COLLECTION_NAME = "company_policies"
+# The manifest lives next to the vector DB so the two are always wiped/copied together
+MANIFEST_FILE = "ingest_manifest.json"
+BM25_FILE = "bm25_index.npz"
+UPSERT_BATCH_SIZE = 256
+CHUNK_SIZE = 1000       # characters per chunk
+CHUNK_OVERLAP = 200     # characters shared between neighbouring chunks
+QUEUE_MAX_CHUNKS = 4096 # bounds memory between the chunkers and the embedder
+PROGRESS_EVERY_S = 2.0
+SUPPORTED_EXTENSIONS = (".md", ".markdown", ".txt")
+BUILTIN_ID_RE = re.compile(r"policy_\d+")
+
+# Raw Knowledge Base
+# Used when no --source directory is given, so the demo still works out of the box.
+DOCUMENTS = [
+    "Full refunds are only allowed if the item is 'lost_in_transit' or 'totally_destroyed'.",
+    "Cosmetic damage (scratches/dents) is NOT eligible for a full refund.",
+    "For cosmetic damage, a maximum of 10% partial refund is allowed. The customer must provide a photo.",
+    "All refund requests must be made within 30 days of delivery.",
+    "Electronics have a 1-year warranty for functional defects."
+]
+
+
+def fingerprint(text: str) -> str:
+    """Content hash used to decide whether a chunk needs to be re-embedded."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def load_manifest(path: str) -> dict:
+    """Returns {"model": ..., "chunks": {chunk_id: content_hash}} from the last run."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"model": EMBED_MODEL, "chunks": {}}
+
+
+def save_manifest(manifest: dict, path: str):
+    # Write-then-rename so a crash mid-write never leaves a truncated manifest behind
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, path)
+
+
+# --- LOADING & CHUNKING (runs inside the worker processes) ---
+
+def chunk_text(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> list:
+    """Splits text into ~chunk_size character windows, preferring to break on whitespace."""
+    text = text.strip()
+    if len(text) <= chunk_size:
+        return [text] if text else []
+
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + chunk_size, len(text))
+        if end < len(text):
+            # Back off to the last paragraph, line or word break so we don't cut words in half
+            for separator in ("\n\n", "\n", " "):
+                split = text.rfind(separator, start + overlap + 1, end)
+                if split != -1:
+                    end = split
+                    break
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return chunks
+
+
+def source_id(root: str) -> str:
+    """
+    Short, stable name for a source root, e.g. 'policies-3f2a9c1e'. It prefixes chunk ids
+    (and so manifest keys), so 'a/faq.md' under two different --source roots stays two chunks.
+    """
+    root = os.path.abspath(root)
+    return f"{os.path.basename(root) or 'root'}-{hashlib.sha256(root.encode('utf-8')).hexdigest()[:8]}"
+
+
+def load_and_chunk(path: str, root: str, chunk_size: int, overlap: int) -> list:
+    """Worker task: read one file and return [(chunk_id, text, content_hash, metadata)]."""
+    rel_path = os.path.relpath(path, root).replace(os.sep, "/")
+    source = f"{source_id(root)}:{rel_path}"
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        text = f.read()
+    records = []
+    for i, chunk in enumerate(chunk_text(text, chunk_size, overlap)):
+        records.append((
+            f"{source}#{i}",
+            chunk,
+            fingerprint(chunk),
+            {"category": "policy", "source": source, "chunk": i},
+        ))
+    return records
+
+
+def iter_source_files(sources: list):
+    """Lazily walks the source directories so we never hold the full file list in memory."""
+    for source in sources:
+        if os.path.isfile(source):
+            yield source, os.path.dirname(os.path.abspath(source))
+            continue
+        for dirpath, dirnames, filenames in os.walk(source):
+            dirnames.sort()
+            for name in sorted(filenames):
+                if name.lower().endswith(SUPPORTED_EXTENSIONS):
+                    yield os.path.join(dirpath, name), source
+
+
+def scanned_scope(sources: list):
+    """
+    Returns a predicate telling whether a chunk id comes from `sources` (the built-in
+    DOCUMENTS when empty), i.e. whether this run is the authority on its existence.
+    """
+    if not sources:
+        return lambda chunk_id: BUILTIN_ID_RE.fullmatch(chunk_id) is not None
+    prefixes = []
+    for source in sources:
+        if os.path.isfile(source):
+            # A single file only speaks for itself, not for its siblings under the same root
+            root = os.path.dirname(os.path.abspath(source))
+            prefixes.append(f"{source_id(root)}:{os.path.basename(source)}#")
+        else:
+            prefixes.append(f"{source_id(source)}:")
+    prefixes = tuple(prefixes)
+    return lambda chunk_id: chunk_id.startswith(prefixes)
+
+
+def iter_builtin_records():
+    for i, doc in enumerate(DOCUMENTS):
+        yield [(f"policy_{i}", doc, fingerprint(doc), {"category": "refund_policy"})]
+
+
+def iter_file_records(sources: list, workers: int, chunk_size: int, overlap: int):
+    """
+    Streams per-file chunk lists out of a process pool.
+
+    Only a bounded number of files are in flight at once, so a slow embedder
+    applies backpressure all the way to the directory walk.
+    """
+    files = iter_source_files(sources)
+    if workers <= 1:
+        for path, root in files:
+            yield load_and_chunk(path, root, chunk_size, overlap)
+        return
+
+    max_in_flight = workers * 4
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        exhausted = False
+        while pending or not exhausted:
+            while not exhausted and len(pending) < max_in_flight:
+                try:
+                    path, root = next(files)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending.add(pool.submit(load_and_chunk, path, root, chunk_size, overlap))
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+# --- WRITER (runs on a thread in the main process) ---
+
+def _upsert_worker(collection, chunk_queue: queue.Queue, batch_size: int, errors: list):
+    """Drains the bounded queue into batched upserts until it sees the None sentinel."""
+    batch = []
+
+    def flush():
+        if not batch:
+            return
+        collection.upsert(
+            ids=[r[0] for r in batch],
+            documents=[r[1] for r in batch],
+            # Metadata (Optional but recomended for filtering)
+            metadatas=[{**r[3], "content_hash": r[2]} for r in batch],
+        )
+        batch.clear()
+
+    try:
+        while True:
+            record = chunk_queue.get()
+            if record is None:
+                break
+            batch.append(record)
+            if len(batch) >= batch_size:
+                flush()
+        flush()
+    except Exception as e:
+        errors.append(e)
+        # Keep draining so the producer never blocks forever on a full queue
+        while chunk_queue.get() is not None:
+            pass
+
+
+def ingest_data(
+    sources: list = None,
+    full_rebuild: bool = False,
+    workers: int = None,
+    chunk_size: int = CHUNK_SIZE,
+    overlap: int = CHUNK_OVERLAP,
+    batch_size: int = UPSERT_BATCH_SIZE,
+    db_path: str = DB_PATH,
+    prune: bool = False,
+) -> dict:
+    """
+    Syncs the knowledge base into the vector DB.
+
+    `sources` is a list of directories (or files) of Markdown/text policies; without
+    it the built-in DOCUMENTS are ingested. Chunks from earlier runs of the same sources
+    that are no longer present get deleted; chunks from sources not scanned this time are
+    kept, unless prune=True makes the collection mirror exactly what was passed.
+
+    Files are read and chunked in a process pool and streamed through a bounded queue
+    into batched upserts, so memory stays flat regardless of corpus size. By default
+    the sync is incremental: only new or changed chunks are embedded and unchanged
+    ones are skipped. Pass full_rebuild=True to drop the collection and re-embed everything.
+    """
+    if overlap >= chunk_size:
+        raise ValueError("overlap must be smaller than chunk_size")
+    workers = workers or os.cpu_count() or 1
 
-def ingest_data():
     print("🚀 Starting Knowledge Ingestion...")
+    start_ts = time.perf_counter()
 
     # 1. Initialize Vector DB (persistent)
-    client = chromadb.PersistentClient(path=DB_PATH)
+    client = chromadb.PersistentClient(path=db_path)
+    manifest_path = os.path.join(db_path, MANIFEST_FILE)
+    bm25_path = os.path.join(db_path, BM25_FILE)
 
     #2. Select Embedding Model (Runs locally on CPU/M4 Neural Engine)
-    # This automatically handles tokenization and vectorization.
-    embed_fn = embedding_functions.SentenceTransformerEmbeddingFunction(model_name="all-MiniLM-L6-v2")
+    # This automatically handles tokenization and vectorization. Vectors are cached on
+    # disk, so text we have embedded before never goes through the model again.
+    embed_fn = get_embedding_function()
 
-    # 3. Create/Reset Collection
-    # We delete existing data to ensure a fresh start (idempotency)
-    print("Deleting existing collection...")
-    try:
-        client.delete_collection(COLLECTION_NAME)
-        print("Cleared old data.")
-    except:
-        pass # Collection doesn't exist yet
+    # 3. Open the Collection
+    # A full rebuild deletes existing data first. The incremental path never does,
+    # so search_knowledge_base keeps serving the old chunks while we sync.
+    manifest = load_manifest(manifest_path)
+    if full_rebuild:
+        print("Deleting existing collection...")
+        try:
+            client.delete_collection(COLLECTION_NAME)
+            print("Cleared old data.")
+        except Exception:
+            pass # Collection doesn't exist yet
+        manifest = {"model": EMBED_MODEL, "chunks": {}}
 
     collection = client.get_or_create_collection(name=COLLECTION_NAME, embedding_function=embed_fn)
 
-    # 4. Raw Knowledge Base
-    # In real life, you'd load these from PDF/Markdown files.ArithmeticError
-    documents = [
-        "Full refunds are only allowed if the item is 'lost_in_transit' or 'totally_destroyed'.",
-        "Cosmetic damage (scratches/dents) is NOT eligible for a full refund.",
-        "For cosmetic damage, a maximum of 10% partial refund is allowed. The customer must provide a photo.",
-        "All refund requests must be made within 30 days of delivery.",
-        "Electronics have a 1-year warranty for functional defects."
-    ]
-
-    # 5. Metadata (Optional but recomended for filtering)
-    metadatas = [{"category": "refund_policy"} for _ in documents]
-    ids = [f"policy_{i}" for i in range(len(documents))]
-
-    # 6. Embed & Store
-    print(f"🧠 Embedding {len(documents)} documents...")
-
-    collection.add(
-        documents=documents,
-        metadatas=metadatas,
-        ids=ids
+    # The manifest is only trustworthy if it describes this collection and this model
+    if manifest.get("model") != EMBED_MODEL or (manifest["chunks"] and collection.count() == 0):
+        print("Manifest is stale, re-embedding every chunk.")
+        manifest = {"model": EMBED_MODEL, "chunks": {}}
+    previous = manifest["chunks"]
+
+    # The lexical (BM25) index is kept in step with the collection for hybrid search.
+    # If it does not cover exactly the manifest's chunks (missing, older format, or a
+    # run that died between the two saves), it is rebuilt from the unchanged chunks too.
+    bm25 = BM25Index.load(bm25_path) if previous else BM25Index()
+    backfill = len(bm25) != len(previous)
+    if backfill:
+        bm25 = BM25Index()
+
+    # 4. Start the writer; it embeds & stores whatever the chunkers hand it
+    chunk_queue = queue.Queue(maxsize=QUEUE_MAX_CHUNKS)
+    writer_errors = []
+    writer = threading.Thread(
+        target=_upsert_worker, args=(collection, chunk_queue, batch_size, writer_errors), daemon=True
     )
+    writer.start()
 
-    print(f"✅ Success! Knowledge base saved to '{DB_PATH}'")
+    # 5. Stream chunks from the process pool and diff them against the last run
+    if sources:
+        print(f"📂 Reading {', '.join(sources)} with {workers} worker(s)...")
+        record_stream = iter_file_records(sources, workers, chunk_size, overlap)
+    else:
+        record_stream = iter_builtin_records()
 
-if __name__ == "__main__":
-    ingest_data()    
-    
+    hashes = {}
+    added = updated = skipped = docs_done = 0
+    last_report = time.perf_counter()
+    for records in record_stream:
+        docs_done += 1
+        for chunk_id, text, content_hash, metadata in records:
+            hashes[chunk_id] = content_hash
+            old_hash = previous.get(chunk_id)
+            if old_hash == content_hash:
+                skipped += 1
+                if backfill:
+                    bm25.add(chunk_id, text)
+                continue
+            bm25.add(chunk_id, text)
+            if old_hash is None:
+                added += 1
+            else:
+                updated += 1
+            chunk_queue.put((chunk_id, text, content_hash, metadata))  # blocks when the embedder falls behind
+        if writer_errors:
+            break
+
+        now = time.perf_counter()
+        if now - last_report >= PROGRESS_EVERY_S:
+            elapsed = now - start_ts
+            print(f"   ⏱️ {docs_done} docs ({docs_done / elapsed:.1f} docs/s), "
+                  f"{len(hashes)} chunks ({len(hashes) / elapsed:.1f} chunks/s), "
+                  f"{added + updated} queued for embedding")
+            last_report = now
+
+    chunk_queue.put(None)
+    writer.join()
+    if writer_errors:
+        raise writer_errors[0]
+
+    # 6. Delete chunks that no longer exist in the sources we scanned. Chunks of other
+    #    sources (e.g. a --source directory when re-running the demo) stay unless pruning.
+    in_scope = scanned_scope(sources)
+    deleted, kept = [], {}
+    for chunk_id, content_hash in previous.items():
+        if chunk_id in hashes:
+            continue
+        if prune or in_scope(chunk_id):
+            deleted.append(chunk_id)
+        else:
+            kept[chunk_id] = content_hash
+    if kept:
+        print(f"📌 Keeping {len(kept)} chunks from sources not scanned in this run (--prune removes them).")
+        if backfill:
+            for i in range(0, len(kept), batch_size):
+                page = collection.get(ids=list(kept)[i:i + batch_size], include=["documents"])
+                for chunk_id, text in zip(page["ids"], page["documents"]):
+                    bm25.add(chunk_id, text)
+    if deleted:
+        print(f"🗑️ Removing {len(deleted)} stale chunks{' (pruning)' if prune else ''}...")
+        for i in range(0, len(deleted), batch_size):
+            collection.delete(ids=deleted[i:i + batch_size])
+    for chunk_id in deleted:
+        bm25.remove(chunk_id)
 
+    # 7. Record what is now in the collection (the manifest goes last, it is our commit point).
+    #    A run that changed nothing leaves the BM25 file alone, so the server keeps its copy.
+    if bm25.changed:
+        bm25.save(bm25_path)
+    save_manifest({"model": EMBED_MODEL, "chunks": {**kept, **hashes}}, manifest_path)
+
+    wall_time = time.perf_counter() - start_ts
+    stats = {
+        "documents": docs_done,
+        "chunks": len(hashes),
+        "added": added,
+        "updated": updated,
+        "deleted": len(deleted),
+        "kept": len(kept),
+        "skipped": skipped,
+        "wall_time_s": round(wall_time, 3),
+        "docs_per_s": round(docs_done / wall_time, 1) if wall_time else 0.0,
+        "chunks_per_s": round(len(hashes) / wall_time, 1) if wall_time else 0.0,
+        "embedding_cache": embed_fn.stats(),
+    }
+    print(
+        f"✅ Success! Knowledge base saved to '{db_path}' "
+        f"(added={stats['added']}, updated={stats['updated']}, deleted={stats['deleted']}, "
+        f"skipped={stats['skipped']}) in {stats['wall_time_s']}s "
+        f"[{stats['docs_per_s']} docs/s, {stats['chunks_per_s']} chunks/s]"
+    )
+    cache = stats["embedding_cache"]
+    print(f"   💾 Embedding cache: {cache['hits']} hits, {cache['misses']} misses, "
+          f"{cache['evictions']} evictions ({cache['entries']}/{cache['capacity']} entries)")
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest company policies into the vector DB.")
+    parser.add_argument("--source", action="append", default=[],
+                        help="Directory (or file) of Markdown/text policies. Repeatable. "
+                             "Defaults to the built-in demo policies.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Processes used to read and chunk files (default: CPU count).")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Characters per chunk.")
+    parser.add_argument("--overlap", type=int, default=CHUNK_OVERLAP, help="Characters shared between chunks.")
+    parser.add_argument("--batch-size", type=int, default=UPSERT_BATCH_SIZE, help="Chunks per upsert call.")
+    parser.add_argument("--db-path", default=DB_PATH, help="Where the Chroma DB (and manifest) lives.")
+    parser.add_argument("--full-rebuild", action="store_true",
+                        help="Drop the collection and re-embed everything instead of syncing incrementally.")
+    parser.add_argument("--prune", action="store_true",
+                        help="Also delete chunks from sources not passed in this run, so the collection "
+                             "mirrors exactly these sources.")
+    args = parser.parse_args()
+    ingest_data(
+        sources=args.source,
+        full_rebuild=args.full_rebuild,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        overlap=args.overlap,
+        batch_size=args.batch_size,
+        db_path=args.db_path,
+        prune=args.prune,
+    )
@@ -0,0 +1,135 @@
+import asyncio
+import os
+import re
+import threading
+
+from bm25_index import BM25Index, reciprocal_rank_fusion, tokenize
+from query_batcher import QueryBatcher
+
+QUOTED_RE = re.compile(r"(?<!\w)['\"`]([^'\"`]+)['\"`](?!\w)")
+
+
+class KnowledgeBase:
+    """
+    Hybrid (BM25 + vector) retrieval over the Chroma policy collection.
+
+    This is the logic behind the `search_knowledge_base` MCP tool, kept separate from
+    the server so benchmarks can drive it against any collection.
+    """
+
+    def __init__(
+        self,
+        collection,
+        bm25_path: str,
+        top_k: int = 2,
+        candidates: int = 10,
+        rrf_k: int = 60,
+        batch_size: int = 16,
+        window_ms: float = 5.0,
+        workers: int = 4,
+        query_embedder=None,
+        vector_index=None,
+    ):
+        self.collection = collection
+        self.bm25_path = bm25_path
+        self.top_k = top_k
+        # Hybrid search: each retriever contributes this many candidates before rank fusion
+        self.candidates = candidates
+        self.rrf_k = rrf_k
+        # Optional callable texts -> vectors (e.g. EmbeddingPool.embed); by default the
+        # collection embeds queries itself, in this process
+        self.query_embedder = query_embedder
+        # Optional in-process index (e.g. QuantizedIndex) searched instead of the collection's
+        # own HNSW index; it needs query_embedder, because it only sees vectors
+        if vector_index is not None and query_embedder is None:
+            raise ValueError("vector_index needs a query_embedder")
+        self.vector_index = vector_index
+        self._bm25 = BM25Index()
+        self._bm25_mtime = None
+        self._bm25_lock = threading.Lock()
+        # Concurrent searches arriving within window_ms are embedded and queried together
+        self.batcher = QueryBatcher(self.vector_search_batch, max_batch_size=batch_size,
+                                    window_ms=window_ms, workers=workers)
+
+    # --- lexical side ---
+
+    def lexical_index(self) -> BM25Index:
+        """
+        Returns the BM25 index, reloading it if ingest_knowledge.py has rewritten it.
+        A reload reads the whole file, so call this off the event loop.
+        """
+        try:
+            mtime = os.stat(self.bm25_path).st_mtime_ns
+        except FileNotFoundError:
+            return self._bm25
+        if mtime != self._bm25_mtime:
+            # One thread reloads; concurrent searches wait for it rather than loading it again
+            with self._bm25_lock:
+                if mtime != self._bm25_mtime:
+                    self._bm25 = BM25Index.load(self.bm25_path)
+                    self._bm25_mtime = mtime
+        return self._bm25
+
+    def _lexical_search(self, query: str) -> tuple:
+        index = self.lexical_index()
+        return index, index.search(query, self.candidates)
+
+    @staticmethod
+    def exact_keywords(query: str, index: BM25Index) -> list:
+        """Identifier-like terms (quoted or snake_case, e.g. 'lost_in_transit') that the index knows."""
+        terms = [t for phrase in QUOTED_RE.findall(query) for t in tokenize(phrase)]
+        terms += [t for t in tokenize(query) if "_" in t]
+        return [t for t in dict.fromkeys(terms) if index.has_term(t)]
+
+    # --- vector side (runs on worker threads) ---
+
+    def vector_search_batch(self, queries: list) -> list:
+        """One embedding pass + one vector query for the whole batch. Returns [[(id, doc)]]."""
+        if self.vector_index is not None:
+            hits = self.vector_index.search(self.query_embedder(queries), self.candidates)
+            texts = self.fetch_documents(list(dict.fromkeys(doc_id for row in hits for doc_id, _ in row)))
+            return [[(doc_id, texts[doc_id]) for doc_id, _ in row if doc_id in texts] for row in hits]
+        if self.query_embedder is not None:
+            results = self.collection.query(
+                query_embeddings=self.query_embedder(queries),
+                n_results=self.candidates
+            )
+        else:
+            results = self.collection.query(
+                query_texts=queries,
+                n_results=self.candidates
+            )
+        return [list(zip(ids, docs)) for ids, docs in zip(results['ids'], results['documents'])]
+
+    def fetch_documents(self, ids: list) -> dict:
+        """Looks chunks up by id. This never touches the embedding model."""
+        results = self.collection.get(ids=ids, include=["documents"])
+        return dict(zip(results['ids'], results['documents']))
+
+    # --- hybrid search ---
+
+    async def search(self, query: str) -> tuple:
+        """Returns (mode, documents) where mode is "keyword" or "hybrid"."""
+        # The mtime check and any reload after a re-ingest run on the worker thread too
+        index, lexical_hits = await asyncio.to_thread(self._lexical_search, query)
+        lexical_ids = [doc_id for doc_id, _ in lexical_hits]
+        texts = {}
+
+        if lexical_ids and self.exact_keywords(query, index):
+            # Fast path: exact policy terms are best served by BM25 alone, no embedding needed
+            mode = "keyword"
+            top_ids = lexical_ids[:self.top_k]
+        else:
+            # Retrieve the most relevant chunks from both retrievers and fuse the rankings.
+            # The blocking embedding + query runs off the event loop, batched with any
+            # searches from other sessions that arrive in the same few milliseconds.
+            mode = "hybrid"
+            vector_hits = await self.batcher.submit(query)
+            texts.update(vector_hits)
+            vector_ids = [doc_id for doc_id, _ in vector_hits]
+            top_ids = reciprocal_rank_fusion([vector_ids, lexical_ids], k=self.rrf_k)[:self.top_k]
+
+        missing = [doc_id for doc_id in top_ids if doc_id not in texts]
+        if missing:
+            texts.update(await asyncio.to_thread(self.fetch_documents, missing))
+        return mode, [texts[doc_id] for doc_id in top_ids if doc_id in texts]
@@ -1,40 +1,98 @@
-from fastapi import FastAPI, HTTPException, Depends, Security
+from fastapi import FastAPI, HTTPException, Depends, Security, Query, Request, Response
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from pydantic import BaseModel, Field
-from typing import Optional, List
+from starlette.datastructures import MutableHeaders
+from pydantic import BaseModel
+from typing import List
+import hashlib
+import os
 import uvicorn
 
+from order_store import MAX_BATCH_IDS, AlreadyRefundedError, create_order_store
+from token_auth import InvalidToken, TokenVerifier, scope_mask
+
 app = FastAPI(title = "Enterprise CRM API")
 
+# --- HTTP CACHING & COMPRESSION ---
+# Responses at least this large are gzipped for clients that send "Accept-Encoding: gzip"
+GZIP_MIN_BYTES = int(os.getenv("GZIP_MIN_BYTES", "1000"))
+app.add_middleware(GZipMiddleware, minimum_size=GZIP_MIN_BYTES)
+
+class VaryAcceptEncoding:
+    """
+    Adds "Vary: Accept-Encoding" to every response. GZipMiddleware only adds it to the
+    bodies it compresses, so a shared cache could otherwise hand an uncompressed small
+    response or a 304 to a client of the other kind. Added after GZipMiddleware, so it
+    wraps it and sees its headers.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        async def send_with_vary(message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                if "accept-encoding" not in headers.get("vary", "").lower():
+                    headers.add_vary_header("Accept-Encoding")
+            await send(message)
+
+        await self.app(scope, receive, send_with_vary)
+
+app.add_middleware(VaryAcceptEncoding)
+# Clients may keep responses, but must revalidate them (If-None-Match) before every use
+CACHE_CONTROL = "private, no-cache"
+
+def order_etag(order_ids: list, orders: dict) -> str:
+    """
+    ETag from order versions: it changes exactly when one of the orders changes. It is weak
+    because GZipMiddleware may send the same JSON gzipped, i.e. with different bytes.
+    """
+    versions = ",".join(f"{i}:{orders[i]['version'] if i in orders else 0}" for i in order_ids)
+    return 'W/"' + hashlib.sha256(versions.encode("utf-8")).hexdigest()[:32] + '"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """If-None-Match uses weak comparison: tags match if they are equal without their W/ prefixes."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    opaque_tag = etag.removeprefix("W/")
+    return opaque_tag in (tag.strip().removeprefix("W/") for tag in header.split(","))
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
 # --- SECURITY CONFIGURATION ---
 # We use HTTPBearer to extract the "Authorization: Bearer <token>" header
 security = HTTPBearer()
 
-# SIMULATED IDENTITY PROVIDER (IdP)
-# In real life, this is Auth0/Okta checking a JWT signature.
-# Here, we map tokens to permissions (Scopes).
-VALID_TOKENS = {
-    "super-agent-secret": {
-        "user": "Agent-007",
-        "scopes": ["read:orders", "write:refunds"]  # Can do everything
-    },
-    "junior-agent-secret": {
-        "user": "Intern-Bot",
-        "scopes": ["read:orders"]  # Can look, but CANNOT refund
-    }
-}
-
-def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    """Extracts the token and verifies it exists."""
-    token = credentials.credentials
-    if token not in VALID_TOKENS:
+# IDENTITY PROVIDER
+# Tokens are signed JWTs (HS256, or RS256 with `cryptography` installed) checked against
+# the local keyset in jwt_keys.json. Mint them with token_auth.py, e.g.
+#   python token_auth.py mint --user Agent-007 --scopes read:orders,write:refunds
+#   python token_auth.py mint --user Intern-Bot --scopes read:orders   # can look, but CANNOT refund
+# Verified tokens are cached until they expire, and keys can be rotated without a restart.
+token_verifier = TokenVerifier()
+
+async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """Extracts the token and verifies its signature and expiry."""
+    try:
+        return token_verifier.verify(credentials.credentials)
+    except InvalidToken:
         raise HTTPException(status_code=401, detail="Invalid Authentication Token")
-    return VALID_TOKENS[token]
 
 def has_scope(required_scope: str):
     """Dependency that checks if the user has the specific permission."""
-    def scope_checker(user_data: dict = Depends(verify_token)):
-        if required_scope not in user_data["scopes"]:
+    # Compiled once per endpoint; each request is then a single bitmask AND
+    required_mask = scope_mask([required_scope])
+
+    async def scope_checker(user_data: dict = Depends(verify_token)):
+        if user_data["scope_mask"] & required_mask != required_mask:
             raise HTTPException(
                 status_code=403, 
                 detail=f"Not Authorized. Missing scope: {required_scope}"
@@ -42,16 +100,20 @@ def has_scope(required_scope: str):
         return user_data
     return scope_checker
 
-# --- DATABASE MOCK ---
-orders_db = {
-    "ORD-123": {"status": "shipped", "customer": "Sreeram", "total": 150.00},
-}
+# --- DATABASE ---
+# SQLite by default (ORDER_STORE=memory for the old in-process dict), shared with mcp_server.py
+order_store = create_order_store()
 
 # --- PYDANTIC MODELS (TYpe Safety) ---
 class OrderResponse(BaseModel):
     order_id: str
     status: str
     total: float
+    version: int
+
+class BatchOrdersResponse(BaseModel):
+    orders: List[OrderResponse]
+    missing: List[str]
 
 class RefundRequest(BaseModel):
     order_id: str
@@ -63,17 +125,49 @@ class RefundResponse(BaseModel):
     refunded_amount: float
 
 # --- ENDPOINTS ---
+@app.get("/orders", response_model=BatchOrdersResponse)
+async def get_orders(
+    request: Request,
+    response: Response,
+    ids: str = Query(..., description="Comma-separated order IDs, e.g. ORD-123,ORD-456"),
+    user: dict = Security(has_scope("read:orders")) # <--- THE GUARD
+):
+    """Retrieves many orders in one round-trip. Unknown IDs are listed in `missing`."""
+    order_ids = list(dict.fromkeys(i.strip() for i in ids.split(",") if i.strip()))
+    if len(order_ids) > MAX_BATCH_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_IDS} ids per request")
+
+    orders = await order_store.get_many(order_ids)
+    etag = order_etag(order_ids, orders)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+    return BatchOrdersResponse(
+        orders=[OrderResponse(order_id=i, **orders[i]) for i in order_ids if i in orders],
+        missing=[i for i in order_ids if i not in orders],
+    )
+
 @app.get("/orders/{order_id}", response_model=OrderResponse)
 async def get_order(
     order_id: str, 
+    request: Request,
+    response: Response,
     user: dict = Security(has_scope("read:orders")) # <--- THE GUARD
 ):
     print(f"🔒 Access granted to {user['user']}")
     
     """Retrieves order details. Used by the Agent to check status."""
-    order = orders_db.get(order_id)
+    order = await order_store.get(order_id)
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
+
+    # Conditional GET: an unchanged order costs a header exchange, not a re-serialized body
+    etag = order_etag([order_id], {order_id: order})
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
     return OrderResponse(order_id=order_id, **order)
 
 # Requires "write:refunds" scope
@@ -84,11 +178,13 @@ async def process_refund(
 ):
     print(f"💰 Refund authorized by {user['user']}")
     """Processes a refund. The Agent calls this to take action."""
-    if request.order_id not in orders_db:
+    # Persist the refund and mark the order refunded
+    try:
+        order = await order_store.refund(request.order_id, request.reason)
+    except AlreadyRefundedError:
+        raise HTTPException(status_code=409, detail="Order already refunded")
+    if not order:
         raise HTTPException(status_code=404, detail="Order not found")
-    
-    # Simulate business logic
-    order = orders_db[request.order_id]
 
     return RefundResponse(
         success=True, 
@@ -1,10 +1,17 @@
 import asyncio
 import os
 import json
-from openai import OpenAI
+import re
+import time
+import uuid
+from mcp import types
 from mcp.client.sse import sse_client
 from mcp.client.session import ClientSession
 from dotenv import load_dotenv
+from openai import APIConnectionError, APIStatusError
+
+from conversation_memory import ConversationMemory
+from model_router import Backend, ModelRouter, StreamInterruptedError, create_router
 
 # ============================================================================
 # 1. SYSTEM PROMPT
@@ -24,117 +31,437 @@ You must follow this order: `search_knowledge_base` -> (Decision) -> `process_re
 # Load environment variables from a .env file
 load_dotenv()
 
+# ============================================================================
+# 2. CONFIGURATION
+# ============================================================================
+# Used for token counting; each call goes to the backend model_router.py picks
+MODEL = "gpt-4o-mini"
+# Opt-in: repeat questions skip the LLM. semantic_cache.py (and chromadb) is only imported when on.
+SEMANTIC_CACHE = os.getenv("SEMANTIC_CACHE", "0") == "1"
+# Tool calls from one assistant turn run concurrently, at most this many at a time
+MAX_PARALLEL_TOOLS = int(os.getenv("MAX_PARALLEL_TOOLS", "4"))
+# Upper bound on LLM <-> tool round-trips per user turn (search -> decide -> refund needs 3)
+MAX_TOOL_STEPS = int(os.getenv("MAX_TOOL_STEPS", "6"))
+# History sent with each LLM call; older turns are summarized once it is exceeded
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "6000"))
+# Speculatively search the knowledge base for refund-like queries while the LLM plans
+KB_PREFETCH = os.getenv("KB_PREFETCH", "1") == "1"
+# Share of the model's search terms that must appear in the user query to reuse the prefetch
+KB_PREFETCH_MIN_OVERLAP = float(os.getenv("KB_PREFETCH_MIN_OVERLAP", "0.5"))
+KB_SEARCH_TOOL = "search_knowledge_base"
+REFUND_LIKE_RE = re.compile(r"\b(refund|return|money back|damaged|broken|defective|cancel)", re.IGNORECASE)
+STOPWORDS = {"a", "an", "the", "for", "of", "to", "in", "on", "is", "it", "my", "i", "and", "or",
+             "can", "do", "does", "what", "with", "about", "be", "was", "me", "you", "this", "that"}
+
+
+class ToolSchemaCache:
+    """
+    MCP tool definitions converted to OpenAI's format once, not on every turn.
+    The cache is only rebuilt after the server sends a tools/list_changed notification.
+    """
+
+    def __init__(self):
+        self._tools = None
+
+    def invalidate(self):
+        self._tools = None
+
+    async def message_handler(self, message):
+        """Pass to ClientSession(message_handler=...) to hear about tool-list changes."""
+        if isinstance(message, types.ServerNotification) and \
+                isinstance(message.root, types.ToolListChangedNotification):
+            print("🔄 MCP tool list changed, refreshing schemas.")
+            self.invalidate()
+
+    async def get(self, session: ClientSession) -> list:
+        if self._tools is None:
+            mcp_tools = await session.list_tools()
+            self._tools = [
+                {
+                    "type": "function",
+                    "function": {
+                        "name": tool.name,
+                        "description": tool.description,
+                        "parameters": tool.inputSchema  # MCP schema is compatible with OpenAI
+                    }
+                }
+                for tool in mcp_tools.tools
+            ]
+        return self._tools
+
+
+async def call_mcp_tool(session: ClientSession, semaphore: asyncio.Semaphore, tool_call: dict) -> tuple:
+    """Executes one tool call on the MCP Server. Returns (tool_output, seconds)."""
+    func_name = tool_call["function"]["name"]
+    func_args = json.loads(tool_call["function"]["arguments"] or "{}")
+
+    async with semaphore:
+        print(f"   Executing: {func_name}({func_args})")
+        start_ts = time.perf_counter()
+        result = await session.call_tool(func_name, arguments=func_args)
+        elapsed = time.perf_counter() - start_ts
+
+    # Extract the text result; a tool may return no content, or only non-text content
+    texts = [item.text for item in result.content or [] if getattr(item, "text", None)]
+    tool_output = "\n".join(texts) if texts else f"{func_name} returned no text output."
+    print(f"   Result ({elapsed:.2f}s): {tool_output[:100]}...")
+    return tool_output, elapsed
+
+
+def _terms(text: str) -> set:
+    return {t for t in re.findall(r"[a-z0-9_]+", text.lower()) if t not in STOPWORDS}
+
+
+class KnowledgePrefetcher:
+    """
+    Starts `search_knowledge_base(user_query)` alongside the first LLM call of a turn.
+
+    The system prompt makes the model search before any refund decision, so for
+    refund-like queries that search is almost always the first tool call. If the
+    model asks for a search whose terms mostly come from the user's query, the
+    prefetched result is used instead of a second round trip. Otherwise it is
+    thrown away.
+
+    Counters (over the whole session):
+      hits   - a search tool call was answered by the prefetch
+      misses - the model searched for something else; the prefetch went unused
+      wasted - prefetches that were never used (misses + turns with no search)
+    """
+
+    def __init__(self, min_overlap: float = KB_PREFETCH_MIN_OVERLAP):
+        self.min_overlap = min_overlap
+        self._query = None
+        self._task = None
+        self.started = 0
+        self.hits = 0
+        self.misses = 0
+        self.wasted = 0
+        self.saved_s = 0.0
+
+    def start(self, session: ClientSession, semaphore: asyncio.Semaphore, user_query: str, openai_tools: list):
+        available = any(t["function"]["name"] == KB_SEARCH_TOOL for t in openai_tools)
+        if not available or not REFUND_LIKE_RE.search(user_query):
+            return
+        self._query = user_query
+        tool_call = {"function": {"name": KB_SEARCH_TOOL, "arguments": json.dumps({"query": user_query})}}
+        self._task = asyncio.create_task(call_mcp_tool(session, semaphore, tool_call))
+        self.started += 1
+
+    def matches(self, tool_call: dict) -> bool:
+        if tool_call["function"]["name"] != KB_SEARCH_TOOL:
+            return False
+        try:
+            query = json.loads(tool_call["function"]["arguments"] or "{}").get("query", "")
+        except json.JSONDecodeError:
+            return False
+        wanted = _terms(query)
+        if not wanted:
+            return False
+        return len(wanted & _terms(self._query)) / len(wanted) >= self.min_overlap
+
+    def claim(self, tool_call: dict):
+        """Returns the prefetch task if it answers `tool_call` (each prefetch is used once), else None."""
+        if self._task is None or tool_call["function"]["name"] != KB_SEARCH_TOOL:
+            return None
+        task, self._task = self._task, None
+        if self.matches(tool_call):
+            self.hits += 1
+            print("   ⚡ Using prefetched knowledge-base result")
+            return task
+        self.misses += 1
+        self._discard(task)
+        return None
+
+    async def run(self, task, session: ClientSession, semaphore: asyncio.Semaphore, tool_call: dict) -> tuple:
+        """Awaits a claimed prefetch. Falls back to a real call if the prefetch failed."""
+        wait_start = time.perf_counter()
+        try:
+            tool_output, elapsed = await task
+        except Exception:
+            return await call_mcp_tool(session, semaphore, tool_call)
+        # Whatever part of the search ran while the LLM was planning is latency saved
+        self.saved_s += max(elapsed - (time.perf_counter() - wait_start), 0.0)
+        return tool_output, elapsed
+
+    def finish_turn(self):
+        """Drops a prefetch the turn never asked for."""
+        if self._task is not None:
+            self._discard(self._task)
+            self._task = None
+
+    def _discard(self, task):
+        self.wasted += 1
+        if not task.done():
+            task.cancel()
+        # Retrieve the outcome so a failed or cancelled prefetch doesn't log "never retrieved"
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    def stats(self) -> dict:
+        return {"started": self.started, "hits": self.hits, "misses": self.misses,
+                "wasted": self.wasted, "saved_s": round(self.saved_s, 3)}
+
+
+async def stream_completion(router: ModelRouter, messages: list, tools: list, tool_choice: str) -> tuple:
+    """
+    Streams one LLM call on the backend the router picks (falling back to the next
+    one if it fails before any answer text was shown). Answer text is printed token
+    by token as it arrives, while tool-call fragments are stitched back together.
+    Returns (assistant_message_dict, seconds_to_first_visible_token or None, usage or None,
+    model that answered).
+    """
+    start_ts = time.perf_counter()
+    return await router.run(
+        lambda backend: _stream_from(backend, messages, tools, tool_choice, start_ts),
+        usage=lambda result: result[2],
+    )
+
+
+async def _stream_from(backend: Backend, messages: list, tools: list, tool_choice: str, start_ts: float) -> tuple:
+    first_token_s = None
+    usage = None
+    content = []
+    tool_calls = {}   # index -> {"id", "type", "function": {"name", "arguments"}}
+
+    stream = await backend.client.chat.completions.create(
+        model=backend.model,
+        messages=messages,
+        tools=tools,
+        tool_choice=tool_choice,
+        stream=True,
+        stream_options={"include_usage": True}
+    )
+    try:
+        async for chunk in stream:
+            if chunk.usage:
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if delta.content:
+                if first_token_s is None:
+                    first_token_s = time.perf_counter() - start_ts
+                    print("\n🤖 Answer: ", end="", flush=True)
+                print(delta.content, end="", flush=True)
+                content.append(delta.content)
+            for tc in delta.tool_calls or []:
+                call = tool_calls.setdefault(tc.index, {"id": None, "type": "function",
+                                                        "function": {"name": "", "arguments": ""}})
+                if tc.id:
+                    call["id"] = tc.id
+                if tc.function and tc.function.name:
+                    call["function"]["name"] += tc.function.name
+                if tc.function and tc.function.arguments:
+                    call["function"]["arguments"] += tc.function.arguments
+    except (APIConnectionError, APIStatusError) as e:
+        if not content:
+            raise   # nothing shown yet, the router can still fall back
+        print()
+        raise StreamInterruptedError(f"{backend.name} stream broke after the answer started") from e
+    if content:
+        print()
+
+    message = {"role": "assistant", "content": "".join(content) or None}
+    if tool_calls:
+        message["tool_calls"] = [tool_calls[i] for i in sorted(tool_calls)]
+    return message, first_token_s, usage, backend.model
+
+
+async def cached_completion(cache, router: ModelRouter, messages: list, openai_tools: list,
+                            tool_choice: str, user_index: int) -> tuple:
+    """
+    stream_completion behind the (optional) semantic cache.
+    Returns (assistant_message_dict, seconds_to_first_visible_token, usage, from_cache).
+    """
+    if cache is None:
+        message, first_token_s, usage, _ = await stream_completion(router, messages, openai_tools, tool_choice)
+        return message, first_token_s, usage, False
+
+    from semantic_cache import cache_context
+
+    start_ts = time.perf_counter()
+    user_query = messages[user_index]["content"]
+    tools = openai_tools if tool_choice == "auto" else []
+    # Answers are keyed by model: look up under the backend the router would pick now,
+    # store under the one that actually answered
+    ordered, _ = router.ranked()
+    context = cache_context(ordered[0].model if ordered else None, tools, messages, user_index)
+    hit = await asyncio.to_thread(cache.lookup, user_query, context)
+    if hit:
+        message, similarity = hit
+        print(f"⚡ Semantic cache hit (similarity {similarity:.3f})")
+        if message.get("tool_calls"):
+            # Fresh ids, so replayed calls never collide with earlier ones in the history
+            message["tool_calls"] = [{**call, "id": f"call_{uuid.uuid4().hex[:24]}"}
+                                     for call in message["tool_calls"]]
+        first_token_s = None
+        if message.get("content"):
+            first_token_s = time.perf_counter() - start_ts
+            print(f"\n🤖 Answer: {message['content']}")
+        return message, first_token_s, None, True
+
+    llm_start = time.perf_counter()
+    message, first_token_s, usage, model = await stream_completion(router, messages, openai_tools, tool_choice)
+    context = cache_context(model, tools, messages, user_index)
+    await asyncio.to_thread(cache.store, user_query, context, message, time.perf_counter() - llm_start)
+    if first_token_s is not None:
+        first_token_s += llm_start - start_ts
+    return message, first_token_s, usage, False
+
+
+async def run_turn(session: ClientSession, router: ModelRouter, messages: list, openai_tools: list,
+                   tool_semaphore: asyncio.Semaphore, cache=None, prefetcher=None) -> dict:
+    """
+    Runs one user turn: LLM -> tools -> LLM ... until the model stops calling tools
+    (or MAX_TOOL_STEPS is hit), streaming the final answer to the terminal.
+    `messages` is extended in place and must end with the user's query.
+    Returns the turn's timing stats.
+    """
+    turn_start = time.perf_counter()
+    user_index = len(messages) - 1
+    stats = {"llm_s": 0.0, "tool_s": 0.0, "tool_serial_s": 0.0, "llm_calls": 0, "tool_calls": 0,
+             "first_token_s": None, "prompt_tokens": 0, "completion_tokens": 0, "cache_hits": 0}
+
+    if prefetcher:
+        # The knowledge-base search runs while the LLM decides whether it needs it
+        prefetcher.start(session, tool_semaphore, messages[user_index]["content"], openai_tools)
+    try:
+        for step in range(MAX_TOOL_STEPS + 1):
+            # On the last step tools are withheld, forcing the model to answer with what it has
+            tool_choice = "auto" if step < MAX_TOOL_STEPS else "none"
+
+            llm_start = time.perf_counter()
+            message, first_token_s, usage, from_cache = await cached_completion(
+                cache, router, messages, openai_tools, tool_choice, user_index
+            )
+            stats["llm_s"] += time.perf_counter() - llm_start
+            if from_cache:
+                stats["cache_hits"] += 1
+            else:
+                stats["llm_calls"] += 1
+            if usage:
+                stats["prompt_tokens"] += usage.prompt_tokens
+                stats["completion_tokens"] += usage.completion_tokens
+            if first_token_s is not None and stats["first_token_s"] is None:
+                # Time-to-first-visible-token, measured from when the user hit enter
+                stats["first_token_s"] = llm_start - turn_start + first_token_s
+
+            # OpenAI requires us to append the assistant's "thought" message first
+            messages.append(message)
+            tool_calls = message.get("tool_calls")
+            if not tool_calls:
+                break
+
+            print(f"🤖 Agent decided to use {len(tool_calls)} tool(s)...")
+            # Execute all tools on the MCP Server concurrently, so the step
+            # costs as much as the slowest call rather than the sum of them
+            tools_start = time.perf_counter()
+            calls = []
+            for tc in tool_calls:
+                prefetched = prefetcher.claim(tc) if prefetcher else None
+                if prefetched:
+                    calls.append(prefetcher.run(prefetched, session, tool_semaphore, tc))
+                else:
+                    calls.append(call_mcp_tool(session, tool_semaphore, tc))
+            # One failing tool must not throw away its siblings' results or end the turn:
+            # its error goes back to the model as that call's output instead
+            results = await asyncio.gather(*calls, return_exceptions=True)
+            for i, (tc, result) in enumerate(zip(tool_calls, results)):
+                if isinstance(result, Exception):
+                    print(f"   ⚠️ {tc['function']['name']} failed: {type(result).__name__}: {result}")
+                    results[i] = (f"Error: {tc['function']['name']} failed ({type(result).__name__}: {result}).", 0.0)
+                elif isinstance(result, BaseException):
+                    raise result    # cancellation, KeyboardInterrupt: stop the turn
+            stats["tool_s"] += time.perf_counter() - tools_start
+            stats["tool_serial_s"] += sum(elapsed for _, elapsed in results)
+            stats["tool_calls"] += len(tool_calls)
+
+            for tool_call, (tool_output, _) in zip(tool_calls, results):
+                # Feed the result back to OpenAI
+                messages.append({
+                    "role": "tool",
+                    "tool_call_id": tool_call["id"],
+                    "content": tool_output
+                })
+    finally:
+        if prefetcher:
+            prefetcher.finish_turn()
+
+    stats["total_s"] = time.perf_counter() - turn_start
+    return stats
+
+
 async def run_agent():
-    # Ensure we have an API key
-    if not os.getenv("OPENAI_API_KEY"):
-        print("❌ Error: OPENAI_API_KEY environment variable is not set.")
+    # Ensure we have at least one LLM backend (OpenAI ones need OPENAI_API_KEY)
+    router = create_router()
+    if not router.backends:
+        print("❌ Error: No LLM backend available. Set OPENAI_API_KEY or ROUTER_BACKENDS.")
         return
 
     print("🔌 Connecting to MCP Server...")
 
     # Connect to the MCP Server
     async with sse_client("http://localhost:8000/sse") as (read, write):
-        async with ClientSession(read, write) as session:
+        tool_cache = ToolSchemaCache()
+        async with ClientSession(read, write, message_handler=tool_cache.message_handler) as session:
             await session.initialize()
             
-            # List available tools
-            mcp_tools = await session.list_tools()
-            print(f"✅ Connected! Found {len(mcp_tools.tools)} tools: {[t.name for t in mcp_tools.tools]}")
+            # List available tools (converted to OpenAI's format once and cached)
+            openai_tools = await tool_cache.get(session)
+            print(f"✅ Connected! Found {len(openai_tools)} tools: {[t['function']['name'] for t in openai_tools]}")
 
-            # Initialize OpenAI Client
-            client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+            # LLM calls are async (so they don't freeze the SSE session) and routed per call
+            print(f"🧭 LLM backends: {[b.name for b in router.backends]} ({router.policy} policy)")
+            tool_semaphore = asyncio.Semaphore(MAX_PARALLEL_TOOLS)
+            cache = None
+            if SEMANTIC_CACHE:
+                from semantic_cache import SemanticCache
+                cache = SemanticCache()
+            prefetcher = KnowledgePrefetcher() if KB_PREFETCH else None
             
             # Start Chat Loop
-            # We keep the history to maintain context
-            messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+            # We keep the history to maintain context, within a token budget
+            memory = ConversationMemory(SYSTEM_PROMPT, model=MODEL, token_budget=HISTORY_TOKEN_BUDGET)
 
             while True:
                 try:
-                    user_query = input("\n👤 Query (or 'q' to quit): ")
+                    # input() blocks, so read it on a thread to keep the SSE session alive
+                    user_query = await asyncio.to_thread(input, "\n👤 Query (or 'q' to quit): ")
                     if user_query.lower() in ['q', 'quit']:
+                        if cache:
+                            print(f"💾 Semantic cache: {cache.stats()}")
+                        if prefetcher:
+                            print(f"🔮 KB prefetch: {prefetcher.stats()}")
+                        print(f"🧭 Router: {json.dumps(router.stats(), indent=2)}")
                         break
 
-                    # Add user message to history
-                    messages.append({"role": "user", "content": user_query})
+                    # Build the prompt: system prompt + summary + recent turns + user message
+                    messages = memory.begin_turn(user_query)
+                    history_tokens = memory.prompt_tokens(messages)
 
                     # ---------------------------------------------------------
-                    # STEP A: Format Tools for OpenAI
+                    # STEP A: Get Tools for OpenAI (cached until the tool list changes)
                     # ---------------------------------------------------------
-                    openai_tools = []
-                    for tool in mcp_tools.tools:
-                        openai_tools.append({
-                            "type": "function",
-                            "function": {
-                                "name": tool.name,
-                                "description": tool.description,
-                                "parameters": tool.inputSchema  # MCP schema is compatible with OpenAI
-                            }
-                        })
+                    openai_tools = await tool_cache.get(session)
 
                     # ---------------------------------------------------------
-                    # STEP B: Call LLM (First Pass)
+                    # STEP B: Tool loop (LLM <-> MCP tools) with a streamed answer
                     # ---------------------------------------------------------
-                    response = client.chat.completions.create(
-                        model="gpt-4o-mini", 
-                        messages=messages,
-                        tools=openai_tools,
-                        tool_choice="auto"
-                    )
+                    stats = await run_turn(session, router, messages, openai_tools, tool_semaphore,
+                                           cache, prefetcher)
+                    memory.end_turn(messages)
 
-                    # Get the message object
-                    response_message = response.choices[0].message
-                    tool_calls = response_message.tool_calls
-
-                    # ---------------------------------------------------------
-                    # STEP C: Handle Tool Use
-                    # ---------------------------------------------------------
-                    if tool_calls:
-                        print(f"🤖 Agent decided to use {len(tool_calls)} tool(s)...")
-                        
-                        # OpenAI requires us to append the assistant's "thought" message first
-                        messages.append(response_message)
-
-                        for tool_call in tool_calls:
-                            func_name = tool_call.function.name
-                            func_args = json.loads(tool_call.function.arguments)
-                            call_id = tool_call.id
-
-                            print(f"   Executing: {func_name}({func_args})")
-
-                            # Execute the tool on the MCP Server
-                            result = await session.call_tool(func_name, arguments=func_args)
-                            
-                            # Extract text result
-                            tool_output = result.content[0].text
-                            print(f"   Result: {tool_output[:100]}...")
-
-                            # Feed the result back to OpenAI
-                            messages.append({
-                                "role": "tool",
-                                "tool_call_id": call_id,
-                                "content": tool_output
-                            })
-
-                        # -----------------------------------------------------
-                        # STEP D: Call LLM (Second Pass) - Get Final Answer
-                        # -----------------------------------------------------
-                        final_response = client.chat.completions.create(
-                            model="gpt-4o-mini",
-                            messages=messages
-                        )
-                        
-                        final_text = final_response.choices[0].message.content
-                        print(f"\n🤖 Answer: {final_text}")
-                        messages.append({"role": "assistant", "content": final_text})
-
-                    else:
-                        # No tool used, just print response
-                        final_text = response_message.content
-                        print(f"\n🤖 Answer: {final_text}")
-                        messages.append({"role": "assistant", "content": final_text})
+                    first_token = f"{stats['first_token_s']:.2f}s" if stats["first_token_s"] is not None else "n/a"
+                    print(f"⏱️ Turn: {stats['total_s']:.2f}s, first token {first_token} "
+                          f"({stats['llm_calls']} LLM calls + {stats['cache_hits']} cache hits {stats['llm_s']:.2f}s, "
+                          f"{stats['tool_calls']} tool calls {stats['tool_s']:.2f}s wall / "
+                          f"{stats['tool_serial_s']:.2f}s if run serially)")
+                    print(f"🧭 Routed to: {[d['backend'] for d in router.recent_decisions(stats['llm_calls'])]}")
+                    print(f"🧾 Tokens: history {history_tokens} at turn start, "
+                          f"{stats['prompt_tokens']} prompt / {stats['completion_tokens']} completion billed this turn")
 
                 except Exception as e:
+                    # The half-finished turn is never recorded, so dangling tool calls can't poison the history
                     print(f"\n❌ Error in loop: {e}")
 
 if __name__ == "__main__":
-    asyncio.run(run_agent())
\ No newline at end of file
+    asyncio.run(run_agent())
@@ -1,6 +1,19 @@
+import time
+_process_start = time.perf_counter()
+
+import argparse
+import asyncio
+import json
+import os
+import threading
+
 from mcp.server.fastmcp import FastMCP
-import chromadb
-import chromadb.utils.embedding_functions
+
+# chromadb and the embedding model are heavy, so they are imported by the background
+# warm-up below instead of here; get_order/process_refund are served without them
+from knowledge_base import KnowledgeBase
+from order_store import AlreadyRefundedError, create_order_store
+from tool_cache import ToolResultCache, file_version
 
 # 1. Initialize FastMCP
 # This automatically creates the FastAPI app and SSE endpoint internally.
@@ -9,58 +22,171 @@ mcp = FastMCP("enterprise-crm")
 # ---CONFIGURATIONS ---
 DB_PATH = "./chroma_db"
 COLLECTION_NAME = "company_policies"
+# Concurrent searches arriving within SEARCH_BATCH_WINDOW_MS are embedded and queried together
+SEARCH_BATCH_SIZE = int(os.getenv("SEARCH_BATCH_SIZE", "16"))
+SEARCH_BATCH_WINDOW_MS = float(os.getenv("SEARCH_BATCH_WINDOW_MS", "5"))
+SEARCH_WORKERS = int(os.getenv("SEARCH_WORKERS", "4"))
+SEARCH_TOP_K = 2
+# Hybrid search: each retriever contributes this many candidates before rank fusion
+SEARCH_CANDIDATES = int(os.getenv("SEARCH_CANDIDATES", "10"))
+RRF_K = 60
+BM25_PATH = os.path.join(DB_PATH, "bm25_index.npz")
+# ingest_knowledge.py rewrites the manifest last, so its mtime marks a finished re-ingest
+MANIFEST_PATH = os.path.join(DB_PATH, "ingest_manifest.json")
+# Load the knowledge base in the background at startup (0 = on the first search instead)
+KB_WARMUP = os.getenv("KB_WARMUP", "1") == "1"
+# How long a search waits for a knowledge base that is still loading
+KB_READY_TIMEOUT_S = float(os.getenv("KB_READY_TIMEOUT_S", "30"))
+WARMUP_QUERY = "refund policy for damaged items"
+# Embedding worker processes (--workers); 0 embeds queries in the server process
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "0"))
+# "chroma" (the collection's HNSW index) or "quantized" (int8 scan + exact rerank, quantized_index.py)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+QUANTIZED_INDEX_PATH = os.path.join(DB_PATH, "quantized_index")
+
+# Read-only tool results are reused for TOOL_CACHE_TTL_S (default 30s), see tool_cache.py
+tool_cache = ToolResultCache()
+_manifest_version = file_version(MANIFEST_PATH)
+
+# ---DATABASE CONNECTION (Read Only, loaded in the background)---
+knowledge_base = None
+embedding_pool = None
+kb_state = "loading"             # -> "ready" | "unavailable"
+kb_ready = threading.Event()     # set once kb_state is final
+startup_timings = {}             # seconds: imports, kb_connect, model_load, warmup_query, first_query
+_kb_thread = None
+_kb_thread_lock = threading.Lock()
+
+def start_embedding_pool():
+    """
+    Loads the model and forks the embedding workers. Must run in the main thread before
+    any other thread (the KB warm-up, uvicorn) starts, since fork() copies only the
+    calling thread and any lock another thread holds would stay locked in the workers.
+    """
+    global embedding_pool
+    from embedding_pool import EmbeddingPool
+
+    start_ts = time.perf_counter()
+    embedding_pool = EmbeddingPool(EMBED_WORKERS).start()
+    startup_timings["model_load_and_fork"] = time.perf_counter() - start_ts
+    print(f"🧵 {EMBED_WORKERS} embedding workers sharing one preloaded model.")
+
+def load_knowledge_base():
+    """Connects to Chroma, loads the embedding model and runs one warm-up query, timing each step."""
+    global knowledge_base, kb_state
+    try:
+        start_ts = time.perf_counter()
+        import chromadb
+        from embedding_cache import get_embedding_function
+
+        client = chromadb.PersistentClient(path=DB_PATH)
+        #We must use the same embedding function we used in the ingest script.
+        # It shares the on-disk vector cache with ingestion, so repeated queries skip the model.
+        embed_fn = get_embedding_function()
+        collection = client.get_collection(
+            name=COLLECTION_NAME,
+            embedding_function=embed_fn
+        )
+        print(f"📚 Connected to Knowledge Base: {collection.count()} docs loaded.")
+        startup_timings["kb_connect"] = time.perf_counter() - start_ts
+
+        if embedding_pool is None:
+            start_ts = time.perf_counter()
+            embed_fn.load_model()
+            startup_timings["model_load"] = time.perf_counter() - start_ts
+
+        vector_index = None
+        if VECTOR_BACKEND == "quantized":
+            # Rebuilt from the collection whenever the ingest manifest or the collection count
+            # has changed since the last build, at startup and while the server runs
+            from quantized_index import RefreshingIndex
 
-# ---DATABASE CONNECTION (Read Only)---
-try:
-    client = chromadb.PersistentClient(path=DB_PATH)
-    #We must use the same embedding function we used in the ingest script
-    embed_fn = chromadb.utils.embedding_functions.SentenceTransformerEmbeddingFunction(model_name="all-MiniLM-L6-v2")
-    collection = client.get_collection(
-        name=COLLECTION_NAME,
-        embedding_function=embed_fn
-    )
-    print(f"📚 Connected to Knowledge Base: {collection.count()} docs loaded.")
-
-except Exception as e:
-    print(f"⚠️ WARNING: Could not connect to Vector DB. Did you run ingest_knowledge.py? Error: {e}")
-    collection = None
-
-# --- DATABASE MOCK ---
-orders_db = {
-    "ORD-123": {"status": "shipped", "customer": "Sreeram", "total": 150.00},
-}
+            start_ts = time.perf_counter()
+            vector_index = RefreshingIndex(collection, QUANTIZED_INDEX_PATH, source_version=_manifest_version)
+            startup_timings["vector_index"] = time.perf_counter() - start_ts
+            print(f"🗜️ Quantized vector index: {vector_index.memory_bytes()}")
+        elif VECTOR_BACKEND != "chroma":
+            raise ValueError(f"Unknown VECTOR_BACKEND: {VECTOR_BACKEND}")
+
+        kb = KnowledgeBase(
+            collection,
+            bm25_path=BM25_PATH,
+            top_k=SEARCH_TOP_K,
+            candidates=SEARCH_CANDIDATES,
+            rrf_k=RRF_K,
+            batch_size=SEARCH_BATCH_SIZE,
+            window_ms=SEARCH_BATCH_WINDOW_MS,
+            # Enough search threads to keep every embedding worker busy
+            workers=max(SEARCH_WORKERS, EMBED_WORKERS),
+            query_embedder=embedding_pool.embed if embedding_pool else (embed_fn if vector_index else None),
+            vector_index=vector_index,
+        )
+        # The first query pays for opening the vector index and the BM25 file
+        start_ts = time.perf_counter()
+        kb.lexical_index()
+        kb.vector_search_batch([WARMUP_QUERY])
+        startup_timings["warmup_query"] = time.perf_counter() - start_ts
+
+        knowledge_base = kb
+        kb_state = "ready"
+        print("✅ Knowledge base ready. Startup: " +
+              " | ".join(f"{name} {seconds:.2f}s" for name, seconds in startup_timings.items()))
+
+    except Exception as e:
+        print(f"⚠️ WARNING: Could not connect to Vector DB. Did you run ingest_knowledge.py? Error: {e}")
+        kb_state = "unavailable"
+    finally:
+        kb_ready.set()
+
+def ensure_knowledge_base_loading():
+    """Starts the background load once. Cheap to call from every search."""
+    global _kb_thread
+    with _kb_thread_lock:
+        if _kb_thread is None:
+            _kb_thread = threading.Thread(target=load_knowledge_base, name="kb-warmup", daemon=True)
+            _kb_thread.start()
+
+# --- ORDER DATABASE ---
+# The same store as main.py (SQLite by default), so both servers see the same orders and refunds
+order_store = create_order_store()
 
 # --- 2. DEFINE TOOLS ---
 # ZERO GLUE CODE: We just write Python functions with Type Hints.
 # FastMCP inspects 'order_id: str' and builds the tool definition automatically.
+# Read-only tools are cached; mutating tools invalidate the entries they affect.
 
 @mcp.tool()
-def get_order(order_id: str) -> str:
+@tool_cache.read_only(tags=lambda order_id: [f"order:{order_id}"])
+async def get_order(order_id: str) -> str:
     """Get the status and details of an order by ID."""
-    order = orders_db.get(order_id)
+    order = await order_store.get(order_id)
     if not order:
         return "Order not found."
     return str(order)
 
 @mcp.tool()
+# kb_state is part of the version, so "still loading" answers are never served once it's ready
+@tool_cache.read_only(version=lambda: (_manifest_version(), kb_state))
 async def search_knowledge_base(query: str) -> str:
     """
     Searches the ingested internal documentation. 
     Use this tool IMMEDIATELY if the user asks about refunds, return policies, 
     or specific company guidelines. Do not answer from memory.
     """
-    if not collection:
+    ensure_knowledge_base_loading()
+    if not kb_ready.is_set():
+        print("⏳ Search is waiting for the knowledge base to finish loading...")
+        await asyncio.to_thread(kb_ready.wait, KB_READY_TIMEOUT_S)
+    if kb_state == "loading":
+        return "Error: Knowledge base is still loading. Try again in a few seconds."
+    if not knowledge_base:
         return "Error: Knowledge base is offline."
 
-    print(f"🔍 Vector Search for: '{query}'")
-    
-    # RAG: Retrieve Top 2 most relevant chunks
-    results = collection.query(
-        query_texts=[query],
-        n_results=2
-    )
-    
-    found_rules = results['documents'][0]
+    # RAG: Retrieve the Top 2 most relevant chunks (BM25 + vector, rank-fused)
+    start_ts = time.perf_counter()
+    mode, found_rules = await knowledge_base.search(query)
+    startup_timings.setdefault("first_query", time.perf_counter() - start_ts)
+    print(f"{'⚡ Keyword' if mode == 'keyword' else '🔍 Hybrid'} Search for: '{query}'")
     
     if not found_rules:
         return "No relevant policy found."
@@ -68,13 +194,52 @@ async def search_knowledge_base(query: str) -> str:
     return "RELAVANT POLICY RULES:\n" + "\n- ".join(found_rules)
 
 @mcp.tool()
-def process_refund(order_id: str, reason: str) -> str:
+@tool_cache.mutating(invalidates=lambda order_id, reason: [f"order:{order_id}"])
+async def process_refund(order_id: str, reason: str) -> str:
     """Issue a refund. Requires order ID and a reason."""
-    if order_id not in orders_db:
-        return "Order not found."
+    try:
+        if not await order_store.refund(order_id, reason):
+            return "Order not found."
+    except AlreadyRefundedError:
+        return f"Order {order_id} was already refunded."
     return f"Refund processed for {order_id}. Reason: {reason}"
 
-# --- 3. RUN ---
+# --- 3. STATS ---
+@mcp.resource("stats://tool-cache")
+def tool_cache_stats() -> str:
+    """Per-tool hit/miss/invalidation counts of the read-only tool cache."""
+    return json.dumps(tool_cache.stats(), indent=2)
+
+@mcp.resource("stats://workers")
+def worker_stats() -> str:
+    """Per-worker batches, texts, busy seconds and embedding-cache counters (multi-worker mode)."""
+    if embedding_pool is None:
+        return json.dumps({"workers": 0, "note": "Queries are embedded in the server process."}, indent=2)
+    return json.dumps(embedding_pool.stats(), indent=2)
+
+@mcp.resource("status://readiness")
+def readiness() -> str:
+    """Whether the knowledge base is loading, ready or unavailable, plus startup timings in seconds."""
+    return json.dumps({
+        "knowledge_base": kb_state,
+        "startup_timings_s": {name: round(seconds, 3) for name, seconds in startup_timings.items()},
+    }, indent=2)
+
+startup_timings["imports"] = time.perf_counter() - _process_start
+
+# --- 4. RUN ---
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Enterprise CRM MCP server (SSE on port 8000).")
+    parser.add_argument("--workers", type=int, default=EMBED_WORKERS,
+                        help="Embedding worker processes sharing one preloaded model (0 = in-process).")
+    EMBED_WORKERS = parser.parse_args().workers
+
+    print(f"⏱️ Imports done in {startup_timings['imports']:.2f}s; order tools are available now.")
+    if EMBED_WORKERS > 0:
+        # Forked here, before any thread exists, not from the warm-up thread
+        start_embedding_pool()
+    if KB_WARMUP:
+        # Model + index load in the background while the server already accepts connections
+        ensure_knowledge_base_loading()
     # This single line runs the Uvicorn server on port 8000
     mcp.run(transport='sse')
\ No newline at end of file
@@ -0,0 +1,317 @@
+import argparse
+import json
+import os
+import statistics
+import time
+from collections import deque
+
+from openai import APIConnectionError, APIStatusError, AsyncOpenAI, RateLimitError
+
+from pricing import price
+
+# --- CONFIGURATIONS ---
+# "latency": cheapest backend whose p95 meets ROUTER_P95_TARGET_S
+# "cost":    fastest backend whose mean cost per request meets ROUTER_MAX_COST_USD
+ROUTER_POLICY = os.getenv("ROUTER_POLICY", "latency")
+ROUTER_P95_TARGET_S = float(os.getenv("ROUTER_P95_TARGET_S", "8.0"))
+ROUTER_MAX_COST_USD = float(os.getenv("ROUTER_MAX_COST_USD", "0.002"))
+# Comma-separated names from BACKENDS, in order of preference when nothing is known yet
+ROUTER_BACKENDS = os.getenv("ROUTER_BACKENDS", "gpt-4o-mini,gpt-4o,gpt-oss:20b")
+# JSON written by `llm_benchmark.py --output`; seeds the stats before live traffic arrives
+ROUTER_BENCHMARK_PATH = os.getenv("ROUTER_BENCHMARK_PATH", "./llm_benchmark.json")
+ROUTER_WINDOW = 100             # live calls kept per backend
+ROUTER_MIN_SAMPLES = 5          # live calls needed before they replace the benchmark seed
+ROUTER_FAILURES_TO_OPEN = 2     # consecutive failures before a backend is taken out of rotation
+ROUTER_COOLDOWN_S = float(os.getenv("ROUTER_COOLDOWN_S", "30"))
+# Every ROUTER_PROBE_EVERY-th request goes to a backend that has not been tried for
+# ROUTER_REPROBE_S (or ever), so unknown, slow or recovered backends get fresh stats
+ROUTER_PROBE_EVERY = int(os.getenv("ROUTER_PROBE_EVERY", "20"))
+ROUTER_REPROBE_S = float(os.getenv("ROUTER_REPROBE_S", "300"))
+ROUTER_TIMEOUT_S = float(os.getenv("ROUTER_TIMEOUT_S", "60"))
+ROUTER_DECISION_LOG = 200       # recent routing decisions kept for inspection
+
+# Prices come from pricing.py, keyed by model; the local model is free
+BACKENDS = {
+    "gpt-4o-mini": {"model": "gpt-4o-mini", "base_url": None, "api_key_env": "OPENAI_API_KEY",
+                    "max_concurrency": 16},
+    "gpt-4o": {"model": "gpt-4o", "base_url": None, "api_key_env": "OPENAI_API_KEY",
+               "max_concurrency": 16},
+    "gpt-oss:20b": {"model": "gpt-oss:20b", "base_url": os.getenv("OLLAMA_BASE_URL", "http://localhost:11434/v1"),
+                    "api_key_env": None, "max_concurrency": 2},
+}
+
+
+class StreamInterruptedError(Exception):
+    """
+    Raised (from the original API error) by a call that failed after it had already
+    shown part of its answer. The router counts the failure but does not fall back,
+    because the next backend would print the answer again from the start.
+    """
+
+
+class Backend:
+    """One OpenAI-compatible endpoint + model, with rolling stats from its live calls."""
+
+    def __init__(self, name: str, model: str, client: AsyncOpenAI, pricing: tuple = (0.0, 0.0),
+                 max_concurrency: int = 16):
+        self.name = name
+        self.model = model
+        self.client = client
+        self.pricing = pricing
+        self.max_concurrency = max_concurrency
+        self.seed = {}                                 # p95_s / tokens_per_s / cost_usd from a benchmark
+        self.samples = deque(maxlen=ROUTER_WINDOW)     # (latency_s, completion_tokens, cost_usd)
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self.last_attempt = None                       # time.monotonic() of the last call, None if never
+
+    def cost(self, usage) -> float:
+        if usage is None:
+            return 0.0
+        input_price, output_price = self.pricing
+        return (usage.prompt_tokens * input_price + usage.completion_tokens * output_price) / 1_000_000
+
+    def _live(self) -> bool:
+        return len(self.samples) >= ROUTER_MIN_SAMPLES
+
+    def p95_s(self):
+        if self._live():
+            return statistics.quantiles([s[0] for s in self.samples], n=20)[18]
+        return self.seed.get("p95_s")
+
+    def tokens_per_s(self):
+        if self._live():
+            busy = sum(s[0] for s in self.samples)
+            return sum(s[1] for s in self.samples) / busy if busy else None
+        return self.seed.get("tokens_per_s")
+
+    def cost_usd(self):
+        """Mean cost per request."""
+        if self._live():
+            return sum(s[2] for s in self.samples) / len(self.samples)
+        return self.seed.get("cost_usd")
+
+    def available(self, now: float) -> bool:
+        return now >= self.cooldown_until and self.in_flight < self.max_concurrency
+
+    def stats(self) -> dict:
+        p95, tps, cost = self.p95_s(), self.tokens_per_s(), self.cost_usd()
+        return {
+            "model": self.model,
+            "source": "live" if self._live() else ("benchmark" if self.seed else "none"),
+            "p95_s": round(p95, 3) if p95 is not None else None,
+            "tokens_per_s": round(tps, 1) if tps is not None else None,
+            "cost_usd_per_request": round(cost, 6) if cost is not None else None,
+            "requests": self.requests,
+            "failures": self.failures,
+            "in_flight": self.in_flight,
+            "cooling_down_s": round(max(self.cooldown_until - time.monotonic(), 0.0), 1),
+        }
+
+
+class ModelRouter:
+    """
+    Sends each LLM request to the backend that best meets the configured target.
+
+    With policy "latency" the cheapest backend whose p95 is within `p95_target_s`
+    wins; with "cost" the fastest one whose mean cost per request is within
+    `max_cost_usd`. Backends that miss the target come next (fastest or cheapest
+    first), then backends nothing is known about, in configured order. Until a
+    backend has ROUTER_MIN_SAMPLES live calls, its stats come from the benchmark seed.
+
+    A backend at max_concurrency is saturated and moved to the back of the order.
+    Connection errors, timeouts, 429s and 5xx fall through to the next backend, and
+    ROUTER_FAILURES_TO_OPEN consecutive failures take a backend out of rotation
+    for ROUTER_COOLDOWN_S. After the cooldown it is tried again; one more failure
+    sends it straight back. Since the ranking only ever uses what is already known,
+    every ROUTER_PROBE_EVERY-th request probes the backend that has gone longest
+    without a call (if that is more than ROUTER_REPROBE_S, or it was never tried).
+    Recent decisions are kept for inspection.
+    """
+
+    def __init__(self, backends: list, policy: str = ROUTER_POLICY, p95_target_s: float = ROUTER_P95_TARGET_S,
+                 max_cost_usd: float = ROUTER_MAX_COST_USD):
+        if policy not in ("latency", "cost"):
+            raise ValueError(f"Unknown ROUTER_POLICY: {policy}")
+        self.backends = backends
+        self.policy = policy
+        self.p95_target_s = p95_target_s
+        self.max_cost_usd = max_cost_usd
+        self.decisions = deque(maxlen=ROUTER_DECISION_LOG)
+        self.routed = 0
+
+    def seed_from_benchmark(self, path: str = ROUTER_BENCHMARK_PATH) -> int:
+        """Seeds backends from llm_benchmark.py results (matched on model name). Returns how many were seeded."""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                results = json.load(f)
+        except FileNotFoundError:
+            return 0
+        seeded = set()
+        for result in results:
+            for backend in self.backends:
+                if backend.model != result["model_name"]:
+                    continue
+                # Load runs have percentiles; prefer them over a single-shot run of the same model
+                if result.get("p99_latency") is not None:
+                    p90, p99 = result["p90_latency"], result["p99_latency"]
+                    p95 = p90 + (p99 - p90) * 5 / 9
+                elif "p95_s" in backend.seed:
+                    continue
+                else:
+                    p95 = result["latency"]
+                # Per-request throughput, like the live stats; a load run's eval_rate is the
+                # aggregate over all its concurrent requests
+                requests = result.get("requests") or 1
+                backend.seed = {
+                    "p95_s": p95,
+                    "tokens_per_s": result["output_tokens"] / (result["latency"] * requests),
+                    "cost_usd": result["cost_usd"] / requests,
+                }
+                seeded.add(backend.name)
+        return len(seeded)
+
+    def ranked(self, probe: bool = False) -> tuple:
+        """
+        Backends in the order the next request would try them, plus the reason for the
+        first one. With `probe`, a ready backend due for a re-probe is moved to the front.
+        """
+        now = time.monotonic()
+        if self.policy == "latency":
+            target, metric, key = self.p95_target_s, Backend.p95_s, Backend.cost_usd
+        else:
+            target, metric, key = self.max_cost_usd, Backend.cost_usd, Backend.p95_s
+
+        def sort_key(item):
+            position, backend = item
+            value = metric(backend)
+            if value is None:
+                return (2, 0.0, position)
+            if value <= target:
+                tie_break = key(backend)
+                return (0, tie_break if tie_break is not None else float("inf"), position)
+            return (1, value, position)
+
+        preferred = [b for _, b in sorted(enumerate(self.backends), key=sort_key)]
+        ready = [b for b in preferred if b.available(now)]
+        ordered = ready + [b for b in preferred if b not in ready]
+        if not ordered:
+            return [], "no backends configured"
+
+        if probe:
+            due = [b for b in ready[1:] if b.last_attempt is None or now - b.last_attempt >= ROUTER_REPROBE_S]
+            if due:
+                probed = min(due, key=lambda b: b.last_attempt if b.last_attempt is not None else -1.0)
+                ordered.remove(probed)
+                ordered.insert(0, probed)
+                idle = ("never tried" if probed.last_attempt is None
+                        else f"idle {now - probed.last_attempt:.0f}s")
+                return ordered, f"probing {probed.name} ({idle})"
+
+        first = ordered[0]
+        value = metric(first)
+        label = "p95" if self.policy == "latency" else "cost"
+        if first not in ready:
+            reason = "every backend is saturated or cooling down"
+        elif value is None:
+            reason = f"{first.name}: no stats yet, configured order"
+        elif value <= target:
+            reason = f"{first.name} meets {label} target ({value:.4g} <= {target:.4g})"
+        else:
+            reason = f"no backend meets the {label} target, {first.name} is best at {value:.4g}"
+        skipped = [b.name for b in preferred[:preferred.index(first)]]
+        if skipped:
+            reason += f"; skipped {', '.join(skipped)} (saturated or cooling down)"
+        return ordered, reason
+
+    async def run(self, call, usage=lambda result: getattr(result, "usage", None)):
+        """
+        Runs `call(backend)` (an async function making one LLM request) on the best
+        backend, falling back to the next one on connection errors, timeouts, 429s and 5xx.
+        `usage(result)` extracts the token usage used for the cost and throughput stats.
+        """
+        self.routed += 1
+        ordered, reason = self.ranked(probe=ROUTER_PROBE_EVERY > 0 and self.routed % ROUTER_PROBE_EVERY == 0)
+        if not ordered:
+            raise RuntimeError("No LLM backends configured (check ROUTER_BACKENDS and API keys)")
+        decision = {"ts": time.time(), "backend": None, "reason": reason, "order": [b.name for b in ordered],
+                    "fallbacks": []}
+        self.decisions.append(decision)
+
+        last_error = None
+        for backend in ordered:
+            backend.in_flight += 1
+            backend.requests += 1
+            backend.last_attempt = time.monotonic()
+            start_ts = time.perf_counter()
+            try:
+                result = await call(backend)
+            except (APIConnectionError, APIStatusError, StreamInterruptedError) as e:   # includes timeouts
+                backend.failures += 1
+                error = e.__cause__ if isinstance(e, StreamInterruptedError) else e
+                if (isinstance(error, APIStatusError) and error.status_code < 500
+                        and not isinstance(error, RateLimitError)):
+                    raise   # our request is wrong; another backend won't fix it
+                backend.consecutive_failures += 1
+                if isinstance(error, RateLimitError) or backend.consecutive_failures >= ROUTER_FAILURES_TO_OPEN:
+                    backend.cooldown_until = time.monotonic() + ROUTER_COOLDOWN_S
+                decision["fallbacks"].append(f"{backend.name}: {type(error).__name__}")
+                if isinstance(e, StreamInterruptedError):
+                    raise error   # part of the answer is already on screen
+                print(f"↪️ {backend.name} failed ({type(e).__name__}), trying the next backend...")
+                last_error = e
+                continue
+            finally:
+                backend.in_flight -= 1
+
+            latency = time.perf_counter() - start_ts
+            result_usage = usage(result)
+            backend.consecutive_failures = 0
+            backend.samples.append((latency, result_usage.completion_tokens if result_usage else 0,
+                                    backend.cost(result_usage)))
+            decision["backend"] = backend.name
+            decision["latency_s"] = round(latency, 3)
+            return result
+        raise last_error
+
+    def stats(self) -> dict:
+        return {
+            "policy": self.policy,
+            "target": self.p95_target_s if self.policy == "latency" else self.max_cost_usd,
+            "backends": {b.name: b.stats() for b in self.backends},
+        }
+
+    def recent_decisions(self, n: int = 10) -> list:
+        return list(self.decisions)[-n:] if n > 0 else []
+
+
+def create_router(names: str = ROUTER_BACKENDS, benchmark_path: str = ROUTER_BENCHMARK_PATH,
+                  **kwargs) -> ModelRouter:
+    """Router over the BACKENDS listed in `names`. Backends whose API key is not set are left out."""
+    backends = []
+    for name in (n.strip() for n in names.split(",") if n.strip()):
+        config = BACKENDS[name]
+        api_key = os.getenv(config["api_key_env"]) if config["api_key_env"] else "ollama"
+        if not api_key:
+            continue
+        # The router does the falling back, so don't let the SDK retry for long first
+        client = AsyncOpenAI(base_url=config["base_url"], api_key=api_key, timeout=ROUTER_TIMEOUT_S, max_retries=1)
+        backends.append(Backend(name, config["model"], client, price(config["model"]), config["max_concurrency"]))
+    router = ModelRouter(backends, **kwargs)
+    router.seed_from_benchmark(benchmark_path)
+    return router
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show how requests would be routed right now.")
+    parser.add_argument("--benchmark", default=ROUTER_BENCHMARK_PATH, help="llm_benchmark.py --output JSON.")
+    args = parser.parse_args()
+
+    router = create_router(benchmark_path=args.benchmark)
+    ordered, reason = router.ranked()
+    print(json.dumps(router.stats(), indent=2))
+    print(f"🧭 Next request -> {ordered[0].name if ordered else None} ({reason}); "
+          f"fallback order: {[b.name for b in ordered]}")
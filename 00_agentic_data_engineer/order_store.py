@@ -0,0 +1,229 @@
+import asyncio
+import os
+import queue
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+
+# --- CONFIGURATIONS ---
+ORDER_STORE = os.getenv("ORDER_STORE", "sqlite")          # "sqlite" or "memory"
+ORDER_DB_PATH = os.getenv("ORDER_DB_PATH", "./orders.db")
+ORDER_DB_POOL_SIZE = int(os.getenv("ORDER_DB_POOL_SIZE", "8"))
+MAX_BATCH_IDS = 100     # SQLite's default limit on "?" parameters is far higher; this bounds response size
+
+# The demo data both servers (main.py and mcp_server.py) start from
+SEED_ORDERS = {
+    "ORD-123": {"status": "shipped", "customer": "Sreeram", "total": 150.00},
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    order_id TEXT PRIMARY KEY,
+    status   TEXT NOT NULL,
+    customer TEXT NOT NULL,
+    total    REAL NOT NULL,
+    version  INTEGER NOT NULL DEFAULT 1
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS refunds (
+    refund_id  INTEGER PRIMARY KEY AUTOINCREMENT,
+    order_id   TEXT NOT NULL REFERENCES orders(order_id),
+    reason     TEXT NOT NULL,
+    amount     REAL NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS refunds_by_order ON refunds(order_id);
+"""
+
+
+class AlreadyRefundedError(Exception):
+    """Raised by OrderStore.refund() for an order that has already been refunded."""
+
+
+class OrderStore(ABC):
+    """
+    Storage interface shared by the REST API (main.py) and the MCP server.
+    Orders are plain dicts: {"status", "customer", "total", "version"}. The version
+    goes up by one on every change, which is what the API's ETags are built from.
+    """
+
+    async def get(self, order_id: str):
+        """Returns the order dict, or None if it doesn't exist."""
+        return (await self.get_many([order_id])).get(order_id)
+
+    @abstractmethod
+    async def get_many(self, order_ids: list) -> dict:
+        """Returns {order_id: order} for the ids that exist."""
+
+    @abstractmethod
+    async def refund(self, order_id: str, reason: str):
+        """
+        Records a refund of the order total and marks the order refunded. Returns the
+        order, or None if it doesn't exist. Raises AlreadyRefundedError if it was
+        refunded before; nothing is recorded then.
+        """
+
+    @abstractmethod
+    async def add_orders(self, orders: dict):
+        """Inserts or updates orders, e.g. to seed a load test."""
+
+    def close(self):
+        pass
+
+
+class MemoryOrderStore(OrderStore):
+    """The original in-process dict. Nothing is shared between processes or survives a restart."""
+
+    def __init__(self, orders: dict = None):
+        self._orders = {}
+        self.refunds = []
+        self._upsert(orders or SEED_ORDERS)
+
+    def _upsert(self, orders: dict):
+        for order_id, order in orders.items():
+            version = self._orders[order_id]["version"] + 1 if order_id in self._orders else 1
+            self._orders[order_id] = {"status": order["status"], "customer": order["customer"],
+                                      "total": order["total"], "version": version}
+
+    async def get_many(self, order_ids: list) -> dict:
+        return {i: dict(self._orders[i]) for i in order_ids if i in self._orders}
+
+    async def refund(self, order_id: str, reason: str):
+        order = self._orders.get(order_id)
+        if order is None:
+            return None
+        if order["status"] == "refunded":
+            raise AlreadyRefundedError(order_id)
+        self.refunds.append((order_id, reason, order["total"], time.time()))
+        order["status"] = "refunded"
+        order["version"] += 1
+        return dict(order)
+
+    async def add_orders(self, orders: dict):
+        self._upsert(orders)
+
+
+class SQLiteOrderStore(OrderStore):
+    """
+    SQLite-backed store for orders and refunds, shared by every process that opens `path`.
+
+    WAL mode lets readers run alongside the single writer, and lookups go through the
+    orders primary key. sqlite3 is blocking, so each query borrows a connection from a
+    fixed pool and runs on a worker thread via asyncio.to_thread.
+    """
+
+    def __init__(self, path: str = ORDER_DB_PATH, pool_size: int = ORDER_DB_POOL_SIZE, seed: dict = None):
+        self.path = path
+        self._pool = queue.Queue()
+        for _ in range(pool_size):
+            self._pool.put(self._connect())
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+            # Databases created before orders were versioned
+            if "version" not in {row["name"] for row in conn.execute("PRAGMA table_info(orders)")}:
+                conn.execute("ALTER TABLE orders ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+            # Seeding never overwrites existing rows, so persisted refunds survive restarts
+            conn.executemany(
+                "INSERT OR IGNORE INTO orders (order_id, status, customer, total) VALUES (?, ?, ?, ?)",
+                [(k, v["status"], v["customer"], v["total"]) for k, v in (seed or SEED_ORDERS).items()],
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")   # durable at checkpoints, much cheaper commits in WAL
+        conn.execute("PRAGMA foreign_keys=ON")
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        conn = self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    # --- blocking queries (run on worker threads) ---
+
+    def _get_many(self, order_ids: list) -> dict:
+        if not order_ids:
+            return {}
+        placeholders = ",".join("?" * len(order_ids))
+        with self._connection() as conn:
+            rows = conn.execute(
+                f"SELECT order_id, status, customer, total, version FROM orders WHERE order_id IN ({placeholders})",
+                list(order_ids),
+            ).fetchall()
+        return {row["order_id"]: {"status": row["status"], "customer": row["customer"], "total": row["total"],
+                                  "version": row["version"]}
+                for row in rows}
+
+    def _refund(self, order_id: str, reason: str):
+        with self._connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # The status check is part of the write, so two concurrent refunds can't both pass it
+                updated = conn.execute(
+                    "UPDATE orders SET status = 'refunded', version = version + 1 "
+                    "WHERE order_id = ? AND status != 'refunded'", (order_id,)
+                ).rowcount
+                row = conn.execute(
+                    "SELECT customer, total, version FROM orders WHERE order_id = ?", (order_id,)
+                ).fetchone()
+                if updated:
+                    conn.execute(
+                        "INSERT INTO refunds (order_id, reason, amount, created_at) VALUES (?, ?, ?, ?)",
+                        (order_id, reason, row["total"], time.time()),
+                    )
+                    conn.execute("COMMIT")
+                else:
+                    conn.execute("ROLLBACK")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        if not updated:
+            if row is None:
+                return None
+            raise AlreadyRefundedError(order_id)
+        return {"status": "refunded", "customer": row["customer"], "total": row["total"],
+                "version": row["version"]}
+
+    def _add_orders(self, orders: dict):
+        with self._connection() as conn:
+            conn.execute("BEGIN")
+            try:
+                conn.executemany(
+                    "INSERT INTO orders (order_id, status, customer, total) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(order_id) DO UPDATE SET status = excluded.status, customer = excluded.customer, "
+                    "total = excluded.total, version = orders.version + 1",
+                    [(k, v["status"], v["customer"], v["total"]) for k, v in orders.items()],
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                # Don't hand a connection with an open transaction back to the pool
+                conn.execute("ROLLBACK")
+                raise
+
+    # --- async interface ---
+
+    async def get_many(self, order_ids: list) -> dict:
+        return await asyncio.to_thread(self._get_many, list(dict.fromkeys(order_ids)))
+
+    async def refund(self, order_id: str, reason: str):
+        return await asyncio.to_thread(self._refund, order_id, reason)
+
+    async def add_orders(self, orders: dict):
+        await asyncio.to_thread(self._add_orders, orders)
+
+    def close(self):
+        while not self._pool.empty():
+            self._pool.get_nowait().close()
+
+
+def create_order_store(backend: str = ORDER_STORE, path: str = ORDER_DB_PATH) -> OrderStore:
+    if backend == "memory":
+        return MemoryOrderStore()
+    if backend == "sqlite":
+        return SQLiteOrderStore(path)
+    raise ValueError(f"Unknown ORDER_STORE backend: {backend}")
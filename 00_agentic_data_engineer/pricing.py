@@ -0,0 +1,10 @@
+# USD per 1M (input, output) tokens, shared by model_router.py and 01_stochastic_cpu/llm_benchmark.py.
+# Anything not listed (local models, the stub) is free.
+PRICING = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+
+
+def price(model: str) -> tuple:
+    return PRICING.get(model, (0.0, 0.0))
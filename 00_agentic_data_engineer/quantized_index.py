@@ -0,0 +1,236 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+# --- CONFIGURATIONS ---
+# Candidates per query taken from the int8 scan and reranked with the float32 vectors
+RERANK_CANDIDATES = int(os.getenv("QUANTIZED_RERANK_CANDIDATES", "100"))
+SCAN_ROWS = 32_768          # int8 rows converted per matrix product, bounds the scratch memory
+BUILD_PAGE = 50_000         # vectors fetched from Chroma per page while building
+# How often a RefreshingIndex checks the collection for a re-ingest
+REFRESH_CHECK_S = float(os.getenv("QUANTIZED_REFRESH_CHECK_S", "5"))
+
+# Files inside the index directory. meta.json is written last, so it marks a finished build.
+META_FILE = "meta.json"
+IDS_FILE = "ids.json"
+CODES_FILE = "vectors.i8"      # (count, dim) int8, scanned on every query
+SCALES_FILE = "scales.f32"     # (count,) per-vector dequantization scale
+NORMS_FILE = "norms.f32"       # (count,) squared L2 norm of the original vector
+VECTORS_FILE = "vectors.f32"   # (count, dim) float32, only the reranked rows are read
+
+
+def quantize(vectors: np.ndarray) -> tuple:
+    """Symmetric per-vector int8 quantization. Returns (codes, scales) with vectors ~= codes * scales."""
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def _write_atomic(path: str, data: bytes):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class QuantizedIndex:
+    """
+    In-process vector index over a snapshot of the Chroma collection.
+
+    Every vector is stored twice, memory-mapped: int8-quantized (a quarter of the
+    float32 size) and at full precision. A search scans all int8 codes with one
+    matrix product per SCAN_ROWS block, keeps the `rerank` closest candidates per
+    query and reranks only those with their float32 vectors, so the full-precision
+    file is paged in a few rows at a time. Distances are squared L2, like the
+    collection's default space, so results are comparable with Chroma's.
+
+    The index is a snapshot: build() it again after a re-ingest (see load_or_build),
+    or wrap it in a RefreshingIndex to have a running server do that by itself.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, META_FILE), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        with open(os.path.join(path, IDS_FILE), "r", encoding="utf-8") as f:
+            self.ids = json.load(f)
+        self.count, self.dim = self.meta["count"], self.meta["dim"]
+        shape = (self.count, self.dim)
+        if self.count:
+            self._codes = np.memmap(os.path.join(path, CODES_FILE), dtype=np.int8, mode="r", shape=shape)
+            self._vectors = np.memmap(os.path.join(path, VECTORS_FILE), dtype=np.float32, mode="r", shape=shape)
+            self._scales = np.fromfile(os.path.join(path, SCALES_FILE), dtype=np.float32)
+            self._norms = np.fromfile(os.path.join(path, NORMS_FILE), dtype=np.float32)
+
+    @classmethod
+    def build(cls, collection, path: str, source_version=None) -> "QuantizedIndex":
+        """Quantizes every vector in `collection` into `path`, replacing any previous index."""
+        os.makedirs(path, exist_ok=True)
+        count = collection.count()
+        ids, scales, norms = [], [], []
+        codes_out = vectors_out = None
+        dim = 0
+        while len(ids) < count:
+            page = collection.get(include=["embeddings"], limit=BUILD_PAGE, offset=len(ids))
+            if not len(page["ids"]):
+                break
+            vectors = np.asarray(page["embeddings"], dtype=np.float32)
+            if codes_out is None:
+                dim = vectors.shape[1]
+                codes_out = open(os.path.join(path, CODES_FILE + ".tmp"), "wb")
+                vectors_out = open(os.path.join(path, VECTORS_FILE + ".tmp"), "wb")
+            codes, page_scales = quantize(vectors)
+            codes_out.write(codes.tobytes())
+            vectors_out.write(vectors.tobytes())
+            scales.append(page_scales)
+            norms.append((vectors ** 2).sum(axis=1))
+            ids += page["ids"]
+
+        if codes_out is not None:
+            codes_out.close()
+            vectors_out.close()
+            os.replace(codes_out.name, os.path.join(path, CODES_FILE))
+            os.replace(vectors_out.name, os.path.join(path, VECTORS_FILE))
+            _write_atomic(os.path.join(path, SCALES_FILE), np.concatenate(scales).astype(np.float32).tobytes())
+            _write_atomic(os.path.join(path, NORMS_FILE), np.concatenate(norms).astype(np.float32).tobytes())
+        _write_atomic(os.path.join(path, IDS_FILE), json.dumps(ids).encode("utf-8"))
+        meta = {"count": len(ids), "dim": dim, "source_version": source_version, "built_at": time.time()}
+        _write_atomic(os.path.join(path, META_FILE), json.dumps(meta).encode("utf-8"))
+        return cls(path)
+
+    def search(self, query_vectors, k: int, rerank: int = RERANK_CANDIDATES) -> list:
+        """Top-k per query as [[(id, squared_l2_distance)]], closest first."""
+        queries = np.atleast_2d(np.asarray(query_vectors, dtype=np.float32))
+        if not self.count:
+            return [[] for _ in queries]
+        k = min(k, self.count)
+        rerank = min(max(rerank, k), self.count)
+
+        # 1. Candidate scan over the int8 codes. |q|^2 is the same for every row of a
+        #    query, so ranking by |x|^2 - 2 * scale * (codes . q) is enough here.
+        best_idx = np.empty((len(queries), 0), dtype=np.int64)
+        best_dist = np.empty((len(queries), 0), dtype=np.float32)
+        for start in range(0, self.count, SCAN_ROWS):
+            stop = min(start + SCAN_ROWS, self.count)
+            dots = queries @ self._codes[start:stop].astype(np.float32).T
+            dist = self._norms[start:stop] - 2 * self._scales[start:stop] * dots
+            dist = np.concatenate([best_dist, dist], axis=1)
+            idx = np.concatenate([best_idx, np.broadcast_to(np.arange(start, stop), (len(queries), stop - start))],
+                                 axis=1)
+            if dist.shape[1] > rerank:
+                keep = np.argpartition(dist, rerank - 1, axis=1)[:, :rerank]
+                dist, idx = np.take_along_axis(dist, keep, axis=1), np.take_along_axis(idx, keep, axis=1)
+            best_dist, best_idx = dist, idx
+
+        # 2. Exact rerank of the candidates with the full-precision vectors
+        results = []
+        for query, candidates in zip(queries, best_idx):
+            candidates = np.sort(candidates)    # sequential reads from the memory-mapped file
+            exact = ((self._vectors[candidates] - query) ** 2).sum(axis=1)
+            order = np.argsort(exact)[:k]
+            results.append([(self.ids[candidates[i]], float(exact[i])) for i in order])
+        return results
+
+    def memory_bytes(self) -> dict:
+        """Bytes scanned on every query vs the full-precision file that is only paged in for reranking."""
+        return {
+            "scan_bytes": self.count * self.dim + 8 * self.count,     # int8 codes + scales + norms
+            "rerank_file_bytes": self.count * self.dim * 4,
+            # The ids are held as a Python list of str, which usually outweighs the int8 codes
+            "ids_bytes": sys.getsizeof(self.ids) + sum(sys.getsizeof(i) for i in self.ids),
+            "vectors": self.count,
+        }
+
+
+def load_or_build(collection, path: str, source_version=None) -> QuantizedIndex:
+    """Opens the index at `path`, rebuilding it if it is missing or was built from another ingest."""
+    try:
+        index = QuantizedIndex(path)
+        if index.meta.get("source_version") == source_version and index.count == collection.count():
+            return index
+    except (FileNotFoundError, json.JSONDecodeError, KeyError, ValueError):
+        pass
+    return QuantizedIndex.build(collection, path, source_version)
+
+
+class RefreshingIndex:
+    """
+    A QuantizedIndex that follows re-ingests while the server keeps running.
+
+    At most every `check_s` seconds a search compares the collection count and
+    `source_version()` (e.g. the ingest manifest's mtime) with what the index was
+    built from. On a change the index is rebuilt on a background thread and swapped
+    in when done; searches keep using the old snapshot until then. The old snapshot's
+    memory maps stay valid because build() replaces files rather than rewriting them.
+    """
+
+    def __init__(self, collection, path: str, source_version, check_s: float = REFRESH_CHECK_S):
+        self.collection = collection
+        self.path = path
+        self.source_version = source_version
+        self.check_s = check_s
+        self.index = load_or_build(collection, path, source_version())
+        self.rebuilds = 0
+        self._checked_at = time.monotonic()
+        self._rebuilding = False
+        self._lock = threading.Lock()
+
+    def _maybe_rebuild(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._rebuilding or now - self._checked_at < self.check_s:
+                return
+            self._checked_at = now
+            version = self.source_version()
+            if version == self.index.meta.get("source_version") and self.collection.count() == self.index.count:
+                return
+            self._rebuilding = True
+        threading.Thread(target=self._rebuild, args=(version,), name="quantized-rebuild", daemon=True).start()
+
+    def _rebuild(self, version):
+        try:
+            start_ts = time.perf_counter()
+            self.index = QuantizedIndex.build(self.collection, self.path, version)
+            self.rebuilds += 1
+            print(f"🗜️ Quantized index rebuilt after a re-ingest in {time.perf_counter() - start_ts:.2f}s: "
+                  f"{self.index.memory_bytes()}")
+        except Exception as e:
+            print(f"⚠️ Quantized index rebuild failed, still serving the previous one: {e}")
+        finally:
+            with self._lock:
+                self._rebuilding = False
+                self._checked_at = time.monotonic()
+
+    def search(self, query_vectors, k: int, rerank: int = RERANK_CANDIDATES) -> list:
+        self._maybe_rebuild()
+        return self.index.search(query_vectors, k, rerank)
+
+    def memory_bytes(self) -> dict:
+        return self.index.memory_bytes()
+
+
+if __name__ == "__main__":
+    import chromadb
+
+    from tool_cache import file_version
+
+    parser = argparse.ArgumentParser(description="Build the quantized vector index from the Chroma collection.")
+    parser.add_argument("--db-path", default="./chroma_db")
+    parser.add_argument("--collection", default="company_policies")
+    parser.add_argument("--output", default=None, help="Index directory (default: <db-path>/quantized_index).")
+    args = parser.parse_args()
+
+    collection = chromadb.PersistentClient(path=args.db_path).get_collection(args.collection)
+    start_ts = time.perf_counter()
+    # Stamped with the ingest manifest's mtime, like the index mcp_server.py builds itself
+    manifest_version = file_version(os.path.join(args.db_path, "ingest_manifest.json"))()
+    index = QuantizedIndex.build(collection, args.output or os.path.join(args.db_path, "quantized_index"),
+                                 source_version=manifest_version)
+    print(f"🗜️ Quantized {index.count} vectors ({index.dim} dims) in {time.perf_counter() - start_ts:.2f}s: "
+          f"{index.memory_bytes()}")
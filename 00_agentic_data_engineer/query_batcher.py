@@ -0,0 +1,77 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+
+class QueryBatcher:
+    """
+    Coalesces concurrent async requests into batched calls on a worker pool.
+
+    Each `submit()` parks the caller on a future. The first request of a batch opens
+    a short window (`window_ms`); everything that arrives before it closes, or until
+    `max_batch_size` is reached, is handed to `batch_fn` in one call on a worker
+    thread. The event loop is never blocked, and N concurrent queries cost one
+    embedding pass and one vector search instead of N.
+
+    `batch_fn(items: list) -> list` must return one result per item, in order.
+    """
+
+    def __init__(self, batch_fn, max_batch_size: int = 16, window_ms: float = 5.0, workers: int = 4):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.window_s = window_ms / 1000.0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="query-batcher")
+        self._pending = []   # [(item, future)]
+        self._timer = None
+
+        self.batches = 0
+        self.items = 0
+
+    async def submit(self, item):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window_s, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending[:self.max_batch_size], self._pending[self.max_batch_size:]
+        if self._pending:
+            # More than one batch worth arrived inside the window: keep draining
+            self._timer = asyncio.get_running_loop().call_soon(self._flush)
+        if not batch:
+            return
+
+        # Identical queries inside a window are only searched once
+        unique = list(dict.fromkeys(item for item, _ in batch))
+        self.batches += 1
+        self.items += len(batch)
+
+        loop = asyncio.get_running_loop()
+        task = loop.run_in_executor(self._executor, self.batch_fn, unique)
+        task.add_done_callback(lambda t: self._resolve(t, unique, batch))
+
+    @staticmethod
+    def _resolve(task, unique: list, batch: list):
+        if task.exception() is not None:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(task.exception())
+            return
+        by_item = dict(zip(unique, task.result()))
+        for item, future in batch:
+            if not future.done():
+                future.set_result(by_item[item])
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "queries": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+        }
@@ -0,0 +1,155 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from embedding_cache import get_embedding_function
+
+# --- CONFIGURATIONS ---
+# Opt-in with SEMANTIC_CACHE=1; the clients only import this module (and chromadb) then
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_TTL_S = float(os.getenv("SEMANTIC_CACHE_TTL_S", "600"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "1000"))
+
+# Tools with side effects: a response that calls one of these is never cached
+SIDE_EFFECT_TOOLS = {"process_refund"}
+# "ORD-123"-style identifiers must match exactly, no matter how similar the wording is
+ENTITY_RE = re.compile(r"\b[A-Z]{2,}-\d+\b")
+
+
+def normalize_text(text: str) -> str:
+    return " ".join((text or "").lower().split())
+
+
+def _normalize_messages(messages: list) -> list:
+    """Role, content and tool calls of each message, without the random tool-call ids."""
+    normalized = []
+    for m in messages:
+        calls = [(c["function"]["name"], normalize_text(c["function"]["arguments"]))
+                 for c in m.get("tool_calls") or []]
+        normalized.append((m["role"], normalize_text(m.get("content")), calls))
+    return normalized
+
+
+def cache_context(model: str, tools: list, messages: list, user_index: int) -> str:
+    """
+    Normalized, exact-match part of the cache key: the model that answers, system
+    prompt, tool names, a digest of the earlier turns and everything that happened in
+    this turn after the user query (tool calls + results). A follow-up such as "and
+    the other one?" means something different in every conversation, so it only hits
+    after the same history; first questions still hit across sessions.
+    """
+    earlier = messages[:user_index]
+    system = []
+    if earlier and earlier[0]["role"] == "system":
+        system, earlier = [normalize_text(earlier[0]["content"])], earlier[1:]
+    history = (hashlib.sha256(json.dumps(_normalize_messages(earlier)).encode("utf-8")).hexdigest()
+               if earlier else None)
+    in_turn = _normalize_messages(messages[user_index + 1:])
+    tool_names = sorted(t["function"]["name"] for t in tools or [])
+    return json.dumps([model, system, tool_names, history, in_turn])
+
+
+def is_cacheable(message: dict) -> bool:
+    """Responses that trigger side-effecting tools must always come from the model."""
+    return not any(c["function"]["name"] in SIDE_EFFECT_TOOLS for c in message.get("tool_calls") or [])
+
+
+class SemanticCache:
+    """
+    Semantic cache for LLM responses.
+
+    An entry matches when the context (see cache_context) and the identifiers in the
+    query are exactly equal and the MiniLM embedding of the user query is within
+    `threshold` cosine similarity. Entries expire after `ttl_s` and the least recently
+    used ones are evicted beyond `max_entries`.
+    """
+
+    def __init__(self, threshold: float = SEMANTIC_CACHE_THRESHOLD, ttl_s: float = SEMANTIC_CACHE_TTL_S,
+                 max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES, embed_fn=None):
+        self.threshold = threshold
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        # Same MiniLM model (and on-disk vector cache) as the knowledge base
+        self.embed_fn = embed_fn or get_embedding_function()
+        self._entries = OrderedDict()   # entry_id -> (partition, vector, message, latency_s, created)
+        self._partitions = {}           # partition -> set(entry_id)
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.saved_s = 0.0
+
+    @staticmethod
+    def _partition(query: str, context: str) -> str:
+        entities = sorted(set(ENTITY_RE.findall(query)))
+        return hashlib.sha256(json.dumps([context, entities]).encode("utf-8")).hexdigest()
+
+    def _embed(self, query: str) -> np.ndarray:
+        vector = np.asarray(self.embed_fn([normalize_text(query)])[0], dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def _drop(self, entry_id: int):
+        partition = self._entries.pop(entry_id)[0]
+        ids = self._partitions[partition]
+        ids.discard(entry_id)
+        if not ids:
+            del self._partitions[partition]
+
+    def lookup(self, query: str, context: str):
+        """Returns (assistant_message_dict, similarity) on a hit, or None."""
+        start_ts = time.perf_counter()
+        partition = self._partition(query, context)
+        vector = self._embed(query)
+        now = time.time()
+
+        with self._lock:
+            best_id, best_sim = None, -1.0
+            for entry_id in list(self._partitions.get(partition, ())):
+                _, entry_vector, _, _, created = self._entries[entry_id]
+                if now - created > self.ttl_s:
+                    self._drop(entry_id)
+                    continue
+                sim = float(entry_vector @ vector)
+                if sim > best_sim:
+                    best_id, best_sim = entry_id, sim
+
+            if best_id is None or best_sim < self.threshold:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(best_id)
+            message, latency_s = self._entries[best_id][2], self._entries[best_id][3]
+            self.hits += 1
+            self.saved_s += max(latency_s - (time.perf_counter() - start_ts), 0.0)
+            return dict(message), best_sim
+
+    def store(self, query: str, context: str, message: dict, latency_s: float):
+        if not is_cacheable(message):
+            return
+        partition = self._partition(query, context)
+        vector = self._embed(query)
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (partition, vector, dict(message), latency_s, time.time())
+            self._partitions.setdefault(partition, set()).add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "saved_latency_s": round(self.saved_s, 3),
+            "entries": len(self._entries),
+        }
+
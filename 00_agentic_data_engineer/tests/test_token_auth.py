@@ -0,0 +1,42 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import token_auth
+from token_auth import InvalidToken, TokenVerifier, _b64encode, mint_token
+
+
+def forge(header, claims: dict = None) -> str:
+    """An unsigned token with an arbitrary (possibly non-object) header."""
+    parts = [json.dumps(header), json.dumps(claims or {"exp": 2**31})]
+    return ".".join(_b64encode(p.encode("utf-8")) for p in parts) + "." + _b64encode(b"sig")
+
+
+@pytest.mark.parametrize("header", [
+    {"alg": "HS256", "kid": ["a", "list"]},
+    {"alg": "HS256", "kid": {"an": "object"}},
+    ["not", "an", "object"],
+    "a string",
+])
+def test_forged_headers_are_invalid_tokens(tmp_path, header):
+    mint_token("alice", ["read:orders"], path=str(tmp_path / "keys.json"))
+    verifier = TokenVerifier(str(tmp_path / "keys.json"))
+    with pytest.raises(InvalidToken):
+        verifier.verify(forge(header))
+
+
+def test_bad_keyset_keeps_previous_keys(tmp_path, monkeypatch):
+    monkeypatch.setattr(token_auth, "KEYSET_CHECK_INTERVAL_S", 0.0)
+    path = str(tmp_path / "keys.json")
+    token = mint_token("alice", ["read:orders"], path=path)
+    verifier = TokenVerifier(path)
+    assert verifier.verify(token)["user"] == "alice"
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"active": "k1", "keys": {"k1": {"alg"')     # a half-written rotation
+    os.utime(path, ns=(1, 1))
+    assert verifier.verify_uncached(token)["user"] == "alice"
@@ -0,0 +1,57 @@
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from tool_cache import ToolResultCache
+
+
+def make_tools(cache: ToolResultCache, orders: dict, read_started: threading.Event, finish_read: threading.Event):
+    @cache.read_only(tags=lambda order_id: [f"order:{order_id}"])
+    def get_order(order_id: str) -> str:
+        status = orders[order_id]
+        read_started.set()
+        finish_read.wait(timeout=5)    # hold the read open while a refund goes through
+        return status
+
+    @cache.mutating(invalidates=lambda order_id: [f"order:{order_id}"])
+    def process_refund(order_id: str) -> str:
+        orders[order_id] = "refunded"
+        return "ok"
+
+    return get_order, process_refund
+
+
+def test_read_overlapping_a_refund_is_not_cached():
+    cache = ToolResultCache(ttl_s=60)
+    orders = {"ORD-1": "delivered"}
+    read_started, finish_read = threading.Event(), threading.Event()
+    get_order, process_refund = make_tools(cache, orders, read_started, finish_read)
+
+    results = []
+    reader = threading.Thread(target=lambda: results.append(get_order("ORD-1")))
+    reader.start()
+    assert read_started.wait(timeout=5)
+    process_refund("ORD-1")            # lands after the read saw the old status
+    finish_read.set()
+    reader.join(timeout=5)
+
+    assert results == ["delivered"]    # the in-flight read still returns what it saw...
+    assert get_order("ORD-1") == "refunded"     # ...but did not poison the cache
+    assert cache.stats()["tools"]["get_order"]["hits"] == 0
+
+
+def test_reads_are_cached_until_a_refund():
+    cache = ToolResultCache(ttl_s=60)
+    orders = {"ORD-1": "delivered"}
+    finish_read = threading.Event()
+    finish_read.set()
+    get_order, process_refund = make_tools(cache, orders, threading.Event(), finish_read)
+
+    assert get_order("ORD-1") == "delivered"
+    orders["ORD-1"] = "changed behind the cache's back"
+    assert get_order("ORD-1") == "delivered"
+    process_refund("ORD-1")
+    assert get_order("ORD-1") == "refunded"
+    assert cache.stats()["tools"]["get_order"] == {"hits": 1, "misses": 2, "invalidations": 0, "hit_rate": 0.333}
@@ -0,0 +1,297 @@
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import padding, rsa
+    from cryptography.exceptions import InvalidSignature
+except ImportError:  # RS256 is optional; HS256 only needs the standard library
+    rsa = None
+
+# --- CONFIGURATIONS ---
+JWT_KEYSET_PATH = os.getenv("JWT_KEYSET_PATH", "./jwt_keys.json")
+JWT_CACHE_SIZE = int(os.getenv("JWT_CACHE_SIZE", "10000"))
+JWT_LEEWAY_S = 30               # tolerated clock skew for exp/nbf
+KEYSET_CHECK_INTERVAL_S = 1.0   # how often the keyset file is checked for rotation
+
+# Every scope the API knows gets one bit, so a permission check is a single AND
+SCOPES = ("read:orders", "write:refunds")
+SCOPE_BITS = {scope: 1 << i for i, scope in enumerate(SCOPES)}
+
+
+class InvalidToken(Exception):
+    pass
+
+
+def scope_mask(scopes) -> int:
+    """Bitmask for `scopes`. Unknown scopes raise, so a typo in has_scope() fails at startup."""
+    mask = 0
+    for scope in scopes:
+        if scope not in SCOPE_BITS:
+            raise ValueError(f"Unknown scope: {scope}")
+        mask |= SCOPE_BITS[scope]
+    return mask
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+# --- KEYSET ---
+# {"active": "<kid>", "keys": {"<kid>": {"alg": "HS256", "secret": "..."}
+#                              | {"alg": "RS256", "public_key": "<PEM>", "private_key": "<PEM>"}}}
+# Services that only verify tokens can be given a keyset without private keys.
+
+def load_keyset(path: str = JWT_KEYSET_PATH) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_keyset(keyset: dict, path: str = JWT_KEYSET_PATH):
+    tmp_path = f"{path}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(keyset, f, indent=2)
+    # Atomic replace, so a verifier never reads a half-written keyset
+    os.replace(tmp_path, path)
+
+
+def new_key(alg: str = "HS256") -> dict:
+    if alg == "HS256":
+        return {"alg": "HS256", "secret": secrets.token_urlsafe(32)}
+    if alg == "RS256":
+        if rsa is None:
+            raise RuntimeError("RS256 needs the 'cryptography' package: pip install cryptography")
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        return {
+            "alg": "RS256",
+            "private_key": private_key.private_bytes(
+                serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+            ).decode("ascii"),
+            "public_key": private_key.public_key().public_bytes(
+                serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+            ).decode("ascii"),
+        }
+    raise ValueError(f"Unsupported algorithm: {alg}")
+
+
+def rotate_keys(path: str = JWT_KEYSET_PATH, alg: str = "HS256", keep: int = 2) -> str:
+    """
+    Adds a new signing key and makes it active. The newest `keep` keys stay valid,
+    so tokens signed before the rotation keep working until they expire.
+    Returns the new key id.
+    """
+    keyset = load_keyset(path) if os.path.exists(path) else {"active": None, "keys": {}}
+    kid = f"{time.strftime('%Y%m%d%H%M%S')}-{secrets.token_hex(2)}"
+    keyset["keys"][kid] = new_key(alg)
+    keyset["active"] = kid
+    for old_kid in list(keyset["keys"])[:-keep]:
+        del keyset["keys"][old_kid]
+    save_keyset(keyset, path)
+    return kid
+
+
+def mint_token(user: str, scopes: list, ttl_s: float = 3600, path: str = JWT_KEYSET_PATH) -> str:
+    """Signs a token with the active key, creating a keyset on first use."""
+    if not os.path.exists(path):
+        rotate_keys(path)
+    keyset = load_keyset(path)
+    kid = keyset["active"]
+    key = keyset["keys"][kid]
+    now = int(time.time())
+
+    header = {"alg": key["alg"], "typ": "JWT", "kid": kid}
+    claims = {"sub": user, "scope": " ".join(scopes), "iat": now, "exp": now + int(ttl_s)}
+    signing_input = (_b64encode(json.dumps(header, separators=(",", ":")).encode("utf-8")) + "." +
+                     _b64encode(json.dumps(claims, separators=(",", ":")).encode("utf-8"))).encode("ascii")
+
+    if key["alg"] == "HS256":
+        signature = hmac.new(key["secret"].encode("utf-8"), signing_input, hashlib.sha256).digest()
+    else:
+        if rsa is None:
+            raise RuntimeError("RS256 needs the 'cryptography' package: pip install cryptography")
+        private_key = serialization.load_pem_private_key(key["private_key"].encode("ascii"), password=None)
+        signature = private_key.sign(signing_input, padding.PKCS1v15(), hashes.SHA256())
+    return signing_input.decode("ascii") + "." + _b64encode(signature)
+
+
+# --- VERIFICATION ---
+
+class TokenVerifier:
+    """
+    Verifies HS256/RS256 JWTs against a local keyset file.
+
+    Signature checks are the expensive part, so validated tokens are kept in a bounded
+    LRU until they expire. The verified identity is returned as
+    {"user", "scopes", "scope_mask", "exp"}.
+
+    The keyset file is re-read when its mtime changes (checked at most every
+    KEYSET_CHECK_INTERVAL_S), so keys can be rotated without a restart. A reload also
+    clears the cache, which means tokens signed with a removed key stop working at once.
+    """
+
+    def __init__(self, keyset_path: str = JWT_KEYSET_PATH, cache_size: int = JWT_CACHE_SIZE,
+                 leeway_s: float = JWT_LEEWAY_S):
+        self.keyset_path = keyset_path
+        self.cache_size = cache_size
+        self.leeway_s = leeway_s
+        self._keys = {}            # kid -> (alg, hmac secret bytes | RSA public key)
+        self._keyset_mtime = None
+        self._next_check = 0.0
+        self._cache = OrderedDict()  # token -> identity
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + KEYSET_CHECK_INTERVAL_S
+        try:
+            mtime = os.stat(self.keyset_path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._keyset_mtime:
+            return
+
+        keys = {}
+        try:
+            if mtime is not None:
+                for kid, key in load_keyset(self.keyset_path)["keys"].items():
+                    if key["alg"] == "HS256":
+                        keys[kid] = ("HS256", key["secret"].encode("utf-8"))
+                    elif key["alg"] == "RS256" and rsa is not None:
+                        keys[kid] = ("RS256", serialization.load_pem_public_key(key["public_key"].encode("ascii")))
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            # A malformed or half-written rotation: keep verifying with the previous keys.
+            # Its mtime is remembered, so the file is read again once it is rewritten.
+            print(f"⚠️ Could not load keyset {self.keyset_path}, keeping the previous keys: {e}")
+            self._keyset_mtime = mtime
+            return
+        with self._lock:
+            self._keys = keys
+            self._keyset_mtime = mtime
+            self._cache.clear()
+            self.reloads += 1
+
+    def verify(self, token: str) -> dict:
+        """Returns the token's identity, from the cache when possible. Raises InvalidToken."""
+        self._maybe_reload()
+        now = time.time()
+        with self._lock:
+            identity = self._cache.get(token)
+            if identity is not None:
+                if now <= identity["exp"] + self.leeway_s:
+                    self._cache.move_to_end(token)
+                    self.hits += 1
+                    return identity
+                del self._cache[token]
+            self.misses += 1
+            generation = self.reloads
+
+        identity = self.verify_uncached(token, now)
+        with self._lock:
+            # Don't cache a result checked against a keyset that was replaced meanwhile
+            if generation != self.reloads:
+                return identity
+            self._cache[token] = identity
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return identity
+
+    def verify_uncached(self, token: str, now: float = None) -> dict:
+        """Full verification: structure, key id, algorithm, signature and time claims."""
+        self._maybe_reload()
+        now = time.time() if now is None else now
+        try:
+            header_b64, claims_b64, signature_b64 = token.split(".")
+            header = json.loads(_b64decode(header_b64))
+            signature = _b64decode(signature_b64)
+            signing_input = f"{header_b64}.{claims_b64}".encode("ascii")
+        except ValueError:
+            raise InvalidToken("Malformed token")
+        if not isinstance(header, dict):
+            raise InvalidToken("Malformed token")
+
+        kid = header.get("kid")
+        if not isinstance(kid, str):
+            raise InvalidToken("Malformed token")
+        key = self._keys.get(kid)
+        if key is None:
+            raise InvalidToken("Unknown signing key")
+        alg, key_material = key
+        # The key decides the algorithm, never the token (prevents algorithm-confusion attacks)
+        if header.get("alg") != alg:
+            raise InvalidToken("Algorithm mismatch")
+
+        if alg == "HS256":
+            expected = hmac.new(key_material, signing_input, hashlib.sha256).digest()
+            if not hmac.compare_digest(expected, signature):
+                raise InvalidToken("Bad signature")
+        else:
+            try:
+                key_material.verify(signature, signing_input, padding.PKCS1v15(), hashes.SHA256())
+            except InvalidSignature:
+                raise InvalidToken("Bad signature")
+
+        try:
+            claims = json.loads(_b64decode(claims_b64))
+        except ValueError:
+            raise InvalidToken("Malformed token")
+        if not isinstance(claims, dict):
+            raise InvalidToken("Malformed token")
+        # Signed, but the claims still decide types below; reject anything that isn't a JWT's
+        if (not isinstance(claims.get("exp", 0), (int, float)) or not isinstance(claims.get("nbf", 0), (int, float))
+                or not isinstance(claims.get("scope", ""), str)):
+            raise InvalidToken("Malformed token")
+        if "exp" not in claims or now > claims["exp"] + self.leeway_s:
+            raise InvalidToken("Token expired")
+        if now + self.leeway_s < claims.get("nbf", 0):
+            raise InvalidToken("Token not yet valid")
+
+        scopes = claims.get("scope", "").split()
+        return {
+            "user": claims.get("sub"),
+            "scopes": scopes,
+            # Scopes this API doesn't know grant nothing
+            "scope_mask": scope_mask(s for s in scopes if s in SCOPE_BITS),
+            "exp": claims["exp"],
+        }
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "cached": len(self._cache), "reloads": self.reloads}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage signing keys and mint API tokens.")
+    parser.add_argument("--keyset", default=JWT_KEYSET_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    mint = commands.add_parser("mint", help="Print a signed token.")
+    mint.add_argument("--user", required=True)
+    mint.add_argument("--scopes", default="read:orders", help="Comma-separated, e.g. read:orders,write:refunds")
+    mint.add_argument("--ttl", type=float, default=3600, help="Lifetime in seconds.")
+
+    rotate = commands.add_parser("rotate", help="Add a new active signing key.")
+    rotate.add_argument("--alg", choices=["HS256", "RS256"], default="HS256")
+    rotate.add_argument("--keep", type=int, default=2, help="Newest keys that stay valid.")
+    args = parser.parse_args()
+
+    if args.command == "mint":
+        print(mint_token(args.user, [s for s in args.scopes.split(",") if s], args.ttl, args.keyset))
+    else:
+        print(f"🔑 Active key is now {rotate_keys(args.keyset, args.alg, args.keep)}")
@@ -0,0 +1,180 @@
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# --- CONFIGURATIONS ---
+TOOL_CACHE_TTL_S = float(os.getenv("TOOL_CACHE_TTL_S", "30"))
+TOOL_CACHE_MAX_ENTRIES = int(os.getenv("TOOL_CACHE_MAX_ENTRIES", "1024"))
+
+
+def file_version(path: str):
+    """A version function that changes whenever `path` is rewritten (None if it doesn't exist)."""
+    def version():
+        try:
+            return os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+    return version
+
+
+class ToolResultCache:
+    """
+    Declarative result cache for MCP tools.
+
+    Tools are marked with one of two decorators, placed under @mcp.tool():
+
+        @mcp.tool()
+        @tool_cache.read_only(tags=lambda order_id: [f"order:{order_id}"])
+        def get_order(order_id: str) -> str: ...
+
+        @mcp.tool()
+        @tool_cache.mutating(invalidates=lambda order_id, reason: [f"order:{order_id}"])
+        def process_refund(order_id: str, reason: str) -> str: ...
+
+    Read-only results are cached per argument tuple for `ttl_s`, with at most
+    `max_entries` entries (least recently used are evicted first). A mutating tool
+    drops every entry carrying one of the tags it returns, after it has run, and
+    bumps those tags' generation: a read that was already running when the write
+    happened may have seen the old data, so its result is returned but not cached.
+    A read-only tool can also pass `version=`, a cheap callable such as
+    file_version(); entries cached under an older version are treated as misses.
+    """
+
+    def __init__(self, ttl_s: float = TOOL_CACHE_TTL_S, max_entries: int = TOOL_CACHE_MAX_ENTRIES):
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._entries = OrderedDict()   # (tool, args) -> (result, version, expires_at, tags)
+        self._tagged = {}               # tag -> set((tool, args))
+        self._generations = {}          # tag -> number of invalidations so far
+        self._stats = {}                # tool -> {"hits", "misses", "invalidations"}
+        self._lock = threading.Lock()
+
+    # --- decorators ---
+
+    def read_only(self, tags=None, version=None):
+        def decorator(fn):
+            signature = inspect.signature(fn)
+
+            def lookup(args, kwargs):
+                bound = signature.bind(*args, **kwargs)
+                bound.apply_defaults()
+                key = (fn.__name__, json.dumps(bound.arguments, sort_keys=True, default=str))
+                entry_tags = tuple(tags(**bound.arguments)) if tags else ()
+                current = version() if version else None
+                # Snapshot the tags' generations before running the tool, see _put()
+                generations = self._tag_generations(entry_tags)
+                return key, entry_tags, generations, current, self._get(fn.__name__, key, current)
+
+            if inspect.iscoroutinefunction(fn):
+                @functools.wraps(fn)
+                async def wrapper(*args, **kwargs):
+                    key, entry_tags, generations, current, hit = lookup(args, kwargs)
+                    if hit is not None:
+                        return hit
+                    result = await fn(*args, **kwargs)
+                    self._put(key, result, current, entry_tags, generations)
+                    return result
+            else:
+                @functools.wraps(fn)
+                def wrapper(*args, **kwargs):
+                    key, entry_tags, generations, current, hit = lookup(args, kwargs)
+                    if hit is not None:
+                        return hit
+                    result = fn(*args, **kwargs)
+                    self._put(key, result, current, entry_tags, generations)
+                    return result
+            return wrapper
+        return decorator
+
+    def mutating(self, invalidates):
+        def decorator(fn):
+            signature = inspect.signature(fn)
+
+            def invalidate(args, kwargs):
+                bound = signature.bind(*args, **kwargs)
+                bound.apply_defaults()
+                self.invalidate(invalidates(**bound.arguments), tool=fn.__name__)
+
+            if inspect.iscoroutinefunction(fn):
+                @functools.wraps(fn)
+                async def wrapper(*args, **kwargs):
+                    try:
+                        return await fn(*args, **kwargs)
+                    finally:
+                        invalidate(args, kwargs)
+            else:
+                @functools.wraps(fn)
+                def wrapper(*args, **kwargs):
+                    try:
+                        return fn(*args, **kwargs)
+                    finally:
+                        invalidate(args, kwargs)
+            return wrapper
+        return decorator
+
+    # --- storage ---
+
+    def _tool_stats(self, tool: str) -> dict:
+        return self._stats.setdefault(tool, {"hits": 0, "misses": 0, "invalidations": 0})
+
+    def _get(self, tool: str, key: tuple, current_version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                result, entry_version, expires_at, _ = entry
+                if entry_version == current_version and time.monotonic() < expires_at:
+                    self._entries.move_to_end(key)
+                    self._tool_stats(tool)["hits"] += 1
+                    return result
+                self._drop(key)
+            self._tool_stats(tool)["misses"] += 1
+            return None
+
+    def _tag_generations(self, tags: tuple) -> tuple:
+        with self._lock:
+            return tuple(self._generations.get(tag, 0) for tag in tags)
+
+    def _put(self, key: tuple, result, entry_version, tags: tuple, generations: tuple):
+        with self._lock:
+            if generations != tuple(self._generations.get(tag, 0) for tag in tags):
+                return   # a mutating tool ran while this result was computed; it may be stale
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (result, entry_version, time.monotonic() + self.ttl_s, tags)
+            for tag in tags:
+                self._tagged.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def _drop(self, key: tuple):
+        for tag in self._entries.pop(key)[3]:
+            keys = self._tagged.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tagged[tag]
+
+    def invalidate(self, tags, tool: str = None):
+        """Drops every entry carrying one of `tags`. Returns how many were dropped."""
+        tags = list(tags)
+        with self._lock:
+            for tag in tags:
+                self._generations[tag] = self._generations.get(tag, 0) + 1
+            keys = set().union(*(self._tagged.get(tag, ()) for tag in tags))
+            for key in keys:
+                self._drop(key)
+            if tool:
+                self._tool_stats(tool)["invalidations"] += len(keys)
+            return len(keys)
+
+    def stats(self) -> dict:
+        with self._lock:
+            tools = {}
+            for tool, counts in self._stats.items():
+                lookups = counts["hits"] + counts["misses"]
+                tools[tool] = {**counts, "hit_rate": round(counts["hits"] / lookups, 3) if lookups else 0.0}
+            return {"entries": len(self._entries), "tools": tools}
@@ -0,0 +1,163 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+from tabulate import tabulate
+
+# The CRM API lives with the Week 0 agent; load-test exactly the app main.py serves
+AGENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "00_agentic_data_engineer")
+sys.path.insert(0, os.path.abspath(AGENT_DIR))
+
+from llm_benchmark import percentile
+
+# --- CONFIGURATIONS ---
+NUM_ORDERS = 10_000
+USERS = 32              # concurrent virtual users, locust-style
+DURATION_S = 10.0
+ORDERS_PER_TASK = 10    # orders each user resolves per task
+
+
+def synthetic_orders(n: int, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    return {
+        f"ORD-{100000 + i}": {
+            "status": rng.choice(["processing", "shipped", "delivered"]),
+            "customer": f"Customer {rng.randint(1, n // 3 + 1)}",
+            "total": round(rng.uniform(5, 500), 2),
+        }
+        for i in range(n)
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextlib.contextmanager
+def serve(app):
+    """Runs the FastAPI app on a background thread and yields its base URL."""
+    import uvicorn
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning",
+                                           access_log=False))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        thread.join()
+
+
+async def user(http: httpx.AsyncClient, mode: str, order_ids: list, k: int, deadline: float,
+               rng: random.Random, latencies: list, counters: dict):
+    """One virtual user: resolve k random orders per task, until the deadline."""
+    while time.perf_counter() < deadline:
+        wanted = rng.sample(order_ids, k)
+        if mode == "single":
+            requests = [("/orders/" + order_id, None) for order_id in wanted]
+        else:
+            requests = [("/orders", {"ids": ",".join(wanted)})]
+        for url, params in requests:
+            start_ts = time.perf_counter()
+            try:
+                response = await http.get(url, params=params)
+                ok = response.status_code == 200
+            except httpx.HTTPError:
+                ok = False
+            latencies.append(time.perf_counter() - start_ts)
+            counters["requests"] += 1
+            counters["errors"] += 0 if ok else 1
+        counters["orders"] += k
+
+
+async def run_scenario(base_url: str, token: str, mode: str, order_ids: list, args) -> dict:
+    latencies, counters = [], {"requests": 0, "orders": 0, "errors": 0}
+    limits = httpx.Limits(max_connections=args.users, max_keepalive_connections=args.users)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30.0,
+                                 headers={"Authorization": f"Bearer {token}"}) as http:
+        start_ts = time.perf_counter()
+        deadline = start_ts + args.duration
+        await asyncio.gather(*(
+            user(http, mode, order_ids, args.orders_per_task, deadline, random.Random(i), latencies, counters)
+            for i in range(args.users)
+        ))
+        wall_time = time.perf_counter() - start_ts
+
+    return {
+        "req_per_s": round(counters["requests"] / wall_time, 1),
+        "orders_per_s": round(counters["orders"] / wall_time, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "errors": counters["errors"],
+    }
+
+
+def run_load_test(args) -> list:
+    workdir = tempfile.mkdtemp(prefix="api_load_")
+    db_path = os.path.join(workdir, "orders.db")
+    # main.py opens its store and keyset at import time; point them at scratch files
+    os.environ["ORDER_DB_PATH"] = db_path
+    os.environ["JWT_KEYSET_PATH"] = os.path.join(workdir, "jwt_keys.json")
+
+    import main as crm
+    from order_store import create_order_store
+    from token_auth import mint_token
+
+    token = mint_token("load-test", ["read:orders"], path=os.environ["JWT_KEYSET_PATH"])
+
+    orders = synthetic_orders(args.orders)
+    order_ids = list(orders)
+    results = []
+    try:
+        for backend in args.backends.split(","):
+            # Swap the store behind the app; endpoints look it up on every request
+            crm.order_store.close()
+            crm.order_store = create_order_store(backend, db_path)
+            asyncio.run(crm.order_store.add_orders(orders))
+            with serve(crm.app) as base_url:
+                for mode in args.modes.split(","):
+                    print(f"🚀 {backend} store, {mode} lookups: {args.users} users for {args.duration:.0f}s...")
+                    # The endpoints log every request; keep the terminal readable while we hammer them
+                    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                        result = asyncio.run(run_scenario(base_url, token, mode, order_ids, args))
+                    results.append({"store": backend, "lookup": mode, **result})
+    finally:
+        crm.order_store.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Locust-style load test of the CRM API (main.py).")
+    parser.add_argument("--orders", type=int, default=NUM_ORDERS, help="Synthetic orders to seed.")
+    parser.add_argument("--users", type=int, default=USERS, help="Concurrent virtual users.")
+    parser.add_argument("--duration", type=float, default=DURATION_S, help="Seconds per scenario.")
+    parser.add_argument("--orders-per-task", type=int, default=ORDERS_PER_TASK)
+    parser.add_argument("--backends", default="memory,sqlite", help="Comma-separated: memory,sqlite")
+    parser.add_argument("--modes", default="single,batch",
+                        help="single = GET /orders/{id} per order, batch = one GET /orders?ids=...")
+    parser.add_argument("--output", default=None, help="Optional JSON file for the results.")
+    args = parser.parse_args()
+
+    results = run_load_test(args)
+    print(tabulate(results, headers="keys", tablefmt="psql"))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n📄 Results written to {args.output}")
@@ -0,0 +1,85 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from tabulate import tabulate
+
+# The security layer lives with the Week 0 CRM API; benchmark exactly what main.py runs
+AGENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "00_agentic_data_engineer")
+sys.path.insert(0, os.path.abspath(AGENT_DIR))
+
+from token_auth import TokenVerifier, mint_token, rotate_keys, rsa, scope_mask
+
+# --- CONFIGURATIONS ---
+ITERATIONS = 20_000
+SCOPES = ["read:orders", "write:refunds"]
+
+
+def per_op_us(fn, items: list, iterations: int) -> float:
+    """Mean microseconds per call of fn(item), cycling through `items`."""
+    n = len(items)
+    start_ns = time.perf_counter_ns()
+    for i in range(iterations):
+        fn(items[i % n])
+    return (time.perf_counter_ns() - start_ns) / iterations / 1000
+
+
+def bench_algorithm(alg: str, workdir: str, iterations: int) -> list:
+    keyset_path = os.path.join(workdir, f"keys_{alg}.json")
+    rotate_keys(keyset_path, alg=alg)
+    # Distinct tokens, so the uncached path never benefits from anything cached
+    tokens = [mint_token(f"agent-{i}", SCOPES, path=keyset_path) for i in range(256)]
+    verifier = TokenVerifier(keyset_path)
+    for token in tokens:
+        verifier.verify(token)
+
+    # RSA verification is ~100x slower than HMAC; keep the RS256 runs short
+    uncached_iterations = iterations if alg == "HS256" else max(iterations // 20, 100)
+    return [
+        {"path": f"{alg} uncached (signature check)",
+         "us_per_request": per_op_us(verifier.verify_uncached, tokens, uncached_iterations)},
+        {"path": f"{alg} cached (LRU hit)",
+         "us_per_request": per_op_us(verifier.verify, tokens, iterations)},
+    ]
+
+
+def bench_scope_checks(iterations: int) -> list:
+    scopes = ["read:orders", "write:refunds"]
+    required_mask = scope_mask(["write:refunds"])
+    mask = scope_mask(scopes)
+    return [
+        {"path": "scope check: 'write:refunds' in list",
+         "us_per_request": per_op_us(lambda s: "write:refunds" in s, [scopes], iterations)},
+        {"path": "scope check: bitmask AND",
+         "us_per_request": per_op_us(lambda m: m & required_mask == required_mask, [mask], iterations)},
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-request cost of JWT verification and scope checks.")
+    parser.add_argument("--iterations", type=int, default=ITERATIONS)
+    parser.add_argument("--output", default=None, help="Optional JSON file for the results.")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="auth_bench_")
+    try:
+        results = bench_algorithm("HS256", workdir, args.iterations)
+        if rsa is not None:
+            results += bench_algorithm("RS256", workdir, args.iterations)
+        else:
+            print("ℹ️ 'cryptography' is not installed, skipping RS256.")
+        results += bench_scope_checks(args.iterations)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    for row in results:
+        row["us_per_request"] = round(row["us_per_request"], 3)
+    print(tabulate(results, headers="keys", tablefmt="psql"))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n📄 Results written to {args.output}")
@@ -0,0 +1,240 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import sys
+import time
+
+from tabulate import tabulate
+
+# The agent loop lives with the Week 0 host; evaluate exactly what mcp_host_client.py runs
+AGENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "00_agentic_data_engineer")
+sys.path.insert(0, os.path.abspath(AGENT_DIR))
+
+import mcp_host_client as host
+from mcp.client.session import ClientSession
+from mcp.client.sse import sse_client
+from mcp.types import CallToolResult, TextContent
+from model_router import Backend, ModelRouter, create_router
+from openai import AsyncOpenAI
+
+from llm_benchmark import percentile
+
+# --- CONFIGURATIONS ---
+DEFAULT_QUERIES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "eval_queries.jsonl")
+MCP_URL = os.getenv("MCP_URL", "http://localhost:8000/sse")
+CONCURRENCY = 4
+PROGRESS_EVERY = 10
+# Tools that change the order database. mcp_server.py runs them against ORDER_DB_PATH, which
+# other clients share, so an eval only pretends to call them unless --allow-writes is given.
+MUTATING_TOOLS = {"process_refund"}
+
+
+def load_queries(path: str) -> list:
+    """Reads {"id": ..., "query": ...} lines. Lines without an id are numbered by position."""
+    items = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if line.strip():
+                item = json.loads(line)
+                items.append({"id": str(item.get("id", f"line-{line_no}")), "query": item["query"]})
+    return items
+
+
+def completed_ids(path: str) -> set:
+    """Ids that already have a successful result in `path`; failed queries are retried on resume."""
+    done = set()
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue    # a line cut short by an interrupted run
+                if not record.get("error"):
+                    done.add(record["id"])
+    except FileNotFoundError:
+        pass
+    return done
+
+
+class RateLimiter:
+    """Spaces query starts at least 1/rate seconds apart (rate <= 0 means unlimited)."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_start = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.perf_counter()
+            delay = self._next_start - now
+            self._next_start = max(now, self._next_start) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class DryRunSession:
+    """
+    Forwards everything to the MCP session except calls to MUTATING_TOOLS, which are
+    answered locally with a simulated result so the eval leaves the orders untouched.
+    """
+
+    def __init__(self, session: ClientSession):
+        self._session = session
+        self.simulated = 0
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+    async def call_tool(self, name: str, arguments: dict = None):
+        if name not in MUTATING_TOOLS:
+            return await self._session.call_tool(name, arguments=arguments)
+        self.simulated += 1
+        args = ", ".join(f"{key}={value!r}" for key, value in (arguments or {}).items())
+        return CallToolResult(content=[TextContent(
+            type="text", text=f"Done. (Dry run: {name}({args}) was not sent to the server.)")])
+
+
+async def run_query(session: ClientSession, router: ModelRouter, openai_tools: list, item: dict) -> dict:
+    """One fresh conversation through host.run_turn. Returns the result record."""
+    messages = [{"role": "system", "content": host.SYSTEM_PROMPT}, {"role": "user", "content": item["query"]}]
+    prefetcher = host.KnowledgePrefetcher() if host.KB_PREFETCH else None
+    start_ts = time.perf_counter()
+    try:
+        stats = await host.run_turn(session, router, messages, openai_tools,
+                                    asyncio.Semaphore(host.MAX_PARALLEL_TOOLS), prefetcher=prefetcher)
+    except Exception as e:
+        return {"id": item["id"], "query": item["query"], "error": f"{type(e).__name__}: {e}",
+                "latency_s": round(time.perf_counter() - start_ts, 4)}
+
+    tools = [call["function"]["name"] for m in messages[2:] if m.get("role") == "assistant"
+             for call in m.get("tool_calls") or []]
+    return {
+        "id": item["id"],
+        "query": item["query"],
+        "answer": messages[-1].get("content"),
+        "tools": tools,
+        "tool_calls": stats["tool_calls"],
+        "llm_calls": stats["llm_calls"],
+        "latency_s": round(stats["total_s"], 4),
+        "first_token_s": round(stats["first_token_s"], 4) if stats["first_token_s"] is not None else None,
+        "prompt_tokens": stats["prompt_tokens"],
+        "completion_tokens": stats["completion_tokens"],
+        "error": None,
+    }
+
+
+async def run_batch(items: list, args, router: ModelRouter) -> tuple:
+    """Runs `items` with `args.concurrency` workers, appending each record to args.output as it finishes."""
+    limiter = RateLimiter(args.rate)
+    pending = list(reversed(items))
+    records = []
+
+    async with sse_client(args.mcp_url) as (read, write):
+        async with ClientSession(read, write) as session:
+            await session.initialize()
+            openai_tools = await host.ToolSchemaCache().get(session)
+            if not args.allow_writes:
+                session = DryRunSession(session)
+
+            with open(args.output, "a", encoding="utf-8") as out:
+                async def worker():
+                    while pending:
+                        item = pending.pop()
+                        await limiter.wait()
+                        record = await run_query(session, router, openai_tools, item)
+                        # One line per finished query, flushed at once, so an interrupted run loses nothing
+                        out.write(json.dumps(record) + "\n")
+                        out.flush()
+                        records.append(record)
+                        if len(records) % PROGRESS_EVERY == 0 or not pending:
+                            print(f"   ✅ {len(records)}/{len(items)} queries done", file=sys.stderr)
+
+                start_ts = time.perf_counter()
+                await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+                wall_time = time.perf_counter() - start_ts
+            if isinstance(session, DryRunSession) and session.simulated:
+                print(f"   🧪 {session.simulated} {'/'.join(sorted(MUTATING_TOOLS))} calls simulated "
+                      f"(--allow-writes to run them)", file=sys.stderr)
+    return records, wall_time
+
+
+def summarize(records: list, wall_time: float, skipped: int) -> dict:
+    ok = [r for r in records if not r["error"]]
+    latencies = [r["latency_s"] for r in ok]
+    return {
+        "queries": len(records),
+        "skipped": skipped,
+        "errors": len(records) - len(ok),
+        "queries_per_s": round(len(records) / wall_time, 2) if wall_time else 0.0,
+        "p50_s": round(percentile(latencies, 50), 3) if latencies else None,
+        "p90_s": round(percentile(latencies, 90), 3) if latencies else None,
+        "p99_s": round(percentile(latencies, 99), 3) if latencies else None,
+        "tool_calls_per_query": round(sum(r["tool_calls"] for r in ok) / len(ok), 2) if ok else None,
+        "llm_calls": sum(r["llm_calls"] for r in ok),
+        "prompt_tokens": sum(r["prompt_tokens"] for r in ok),
+        "completion_tokens": sum(r["completion_tokens"] for r in ok),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the MCP agent over a JSONL query set.")
+    parser.add_argument("--queries", default=DEFAULT_QUERIES, help='JSONL file of {"id": ..., "query": ...}.')
+    parser.add_argument("--output", default="batch_eval_results.jsonl", help="JSONL results, appended as they finish.")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="Queries in flight at once.")
+    parser.add_argument("--rate", type=float, default=0.0, help="Max queries started per second (0 = unlimited).")
+    parser.add_argument("--mcp-url", default=MCP_URL, help="SSE endpoint of a running mcp_server.py.")
+    parser.add_argument("--base-url", default=None,
+                        help="OpenAI-compatible endpoint. Default: the local deterministic stub (openai_stub.py).")
+    parser.add_argument("--model", default=None, help="Model name sent to --base-url (default: the host's MODEL).")
+    parser.add_argument("--routed", action="store_true",
+                        help="Send LLM calls through model_router.py's configured backends instead.")
+    parser.add_argument("--allow-writes", action="store_true",
+                        help=f"Really run {', '.join(sorted(MUTATING_TOOLS))} on the server instead of simulating it. "
+                             "Start mcp_server.py with ORDER_DB_PATH pointing at a scratch copy first.")
+    parser.add_argument("--restart", action="store_true", help="Discard earlier results instead of resuming.")
+    parser.add_argument("--summary", default=None, help="Optional JSON file for the summary.")
+    args = parser.parse_args()
+
+    if args.restart and os.path.exists(args.output):
+        os.remove(args.output)
+    items = load_queries(args.queries)
+    done = completed_ids(args.output)
+    todo = [item for item in items if item["id"] not in done]
+    print(f"📋 {len(items)} queries, {len(items) - len(todo)} already done, running {len(todo)} "
+          f"(concurrency {args.concurrency}{f', {args.rate}/s' if args.rate > 0 else ''})")
+
+    stub = None
+    if args.routed:
+        router = create_router()
+    else:
+        base_url = args.base_url
+        if base_url is None:
+            from openai_stub import start_stub_server
+            stub, base_url = start_stub_server(tool_calls=True)
+            print(f"🧪 Using the deterministic tool-calling stub at {base_url}")
+        model = args.model or host.MODEL
+        client = AsyncOpenAI(base_url=base_url, api_key=os.getenv("OPENAI_API_KEY") or "not-needed")
+        router = ModelRouter([Backend(model, model, client)])
+
+    try:
+        # The host prints every streamed answer; keep the terminal to progress and the summary
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            records, wall_time = asyncio.run(run_batch(todo, args, router)) if todo else ([], 0.0)
+    finally:
+        if stub:
+            stub.shutdown()
+
+    summary = summarize(records, wall_time, skipped=len(items) - len(todo))
+    print(tabulate([summary], headers="keys", tablefmt="psql"))
+    if args.routed:
+        print(f"🧭 Router: {json.dumps(router.stats(), indent=2)}")
+    print(f"\n📄 Results appended to {args.output}")
+    if args.summary:
+        with open(args.summary, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
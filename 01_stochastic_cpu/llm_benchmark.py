@@ -1,25 +1,57 @@
+import argparse
+import asyncio
+import json
 import time
 import ollama
 import os
+import sys
+from typing import Optional
 from tabulate import tabulate
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 from pydantic import BaseModel
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# USD per 1M (input, output) tokens: the same table model_router.py prices backends with
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "00_agentic_data_engineer"))
+from pricing import price
+
 # 1. Define structured data model for the benchmark results
 class LLMBenchmarkResult(BaseModel):
     model_name: str
     api_provider: str
-    latency: float
-    throughput: float
+    latency: float          # mean end-to-end seconds per request
+    throughput: float       # completed requests per second
     input_tokens: int
     output_tokens: int
-    eval_rate: float
+    eval_rate: float        # tokens per second
     input_cost: float
     output_cost: float
     cost_usd: float
+    # Only filled in by load runs (see benchmark_load)
+    requests: Optional[int] = None
+    concurrency: Optional[int] = None
+    errors: Optional[int] = None
+    ttft: Optional[float] = None
+    inter_token_latency: Optional[float] = None
+    p50_latency: Optional[float] = None
+    p90_latency: Optional[float] = None
+    p99_latency: Optional[float] = None
+
+
+def compute_cost(model: str, input_tokens: int, output_tokens: int) -> tuple:
+    input_price, output_price = price(model)
+    return (input_tokens / 1_000_000) * input_price, (output_tokens / 1_000_000) * output_price
+
+
+def percentile(values: list, pct: float) -> float:
+    """Linear-interpolated percentile (pct in 0..100) of a non-empty list."""
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
 
 # 2. Define the LLM benchmark functions
 
@@ -34,15 +66,13 @@ def benchmark_openai(prompt: str):
     end_ts = time.time()
     input_tokens=response.usage.prompt_tokens
     output_tokens=response.usage.completion_tokens
-    input_cost = (input_tokens / 1_000_000) * 2.50
-    output_cost = (output_tokens / 1_000_000) * 1.25
+    input_cost, output_cost = compute_cost("gpt-4o", input_tokens, output_tokens)
 
-    # GPT-4o costs $2.50 per 1M input tokens and $1.25 per 1M output tokens
     return LLMBenchmarkResult(
         model_name="gpt-4o",
         api_provider="openai",
         latency=end_ts - start_ts,
-        throughput=1,
+        throughput=1 / (end_ts - start_ts),
         input_tokens=input_tokens,
         output_tokens=output_tokens,
         eval_rate=response.usage.total_tokens / (end_ts - start_ts),
@@ -64,14 +94,118 @@ def benchmark_ollama(prompt: str):
         model_name="gpt-oss:20b",
         api_provider="ollama",
         latency=end_ts - start_ts,
-        throughput=1,
+        throughput=1 / (end_ts - start_ts),
         input_tokens=getattr(response, 'prompt_eval_count', 0),
         output_tokens=getattr(response, 'eval_count', 0),
-        eval_rate=getattr(response, 'eval_count', 0) / (end_ts - start_ts), 
+        eval_rate=getattr(response, 'eval_count', 0) / (end_ts - start_ts),
         input_cost=0.0,
         output_cost=0.0,
         cost_usd=0.0
-    )   
+    )
+
+
+async def _timed_stream(client: AsyncOpenAI, model: str, prompt: str) -> dict:
+    """One streaming request; returns its TTFT, inter-token gaps, end-to-end latency and usage."""
+    start_ts = time.perf_counter()
+    first_token_ts = None
+    token_times = []
+    usage = None
+    stream = await client.chat.completions.create(
+        model=model,
+        messages=[{"role": "user", "content": prompt}],
+        stream=True,
+        stream_options={"include_usage": True},
+    )
+    async for chunk in stream:
+        if chunk.usage:
+            usage = chunk.usage
+        if chunk.choices and chunk.choices[0].delta.content:
+            now = time.perf_counter()
+            if first_token_ts is None:
+                first_token_ts = now
+            token_times.append(now)
+    end_ts = time.perf_counter()
+
+    return {
+        "latency": end_ts - start_ts,
+        "ttft": (first_token_ts or end_ts) - start_ts,
+        "gaps": [b - a for a, b in zip(token_times, token_times[1:])],
+        # Some servers don't send usage on streams; fall back to counting content chunks
+        "input_tokens": usage.prompt_tokens if usage else 0,
+        "output_tokens": usage.completion_tokens if usage else len(token_times),
+    }
+
+
+async def benchmark_load(
+    prompt: str,
+    model: str,
+    base_url: str = None,
+    api_key: str = None,
+    api_provider: str = "openai",
+    concurrency: int = 8,
+    duration: float = None,
+    num_requests: int = None,
+) -> LLMBenchmarkResult:
+    """
+    Drives `concurrency` streaming requests in parallel against an OpenAI-compatible
+    endpoint until `duration` seconds have passed or `num_requests` have been sent.
+    """
+    if duration is None and num_requests is None:
+        num_requests = concurrency * 4
+    client = AsyncOpenAI(base_url=base_url, api_key=api_key or os.getenv("OPENAI_API_KEY") or "not-needed")
+    samples = []
+    errors = 0
+    sent = 0
+    start_ts = time.perf_counter()
+    deadline = start_ts + duration if duration is not None else None
+
+    async def worker():
+        nonlocal sent, errors
+        while True:
+            if deadline is not None and time.perf_counter() >= deadline:
+                return
+            if num_requests is not None and sent >= num_requests:
+                return
+            sent += 1
+            try:
+                samples.append(await _timed_stream(client, model, prompt))
+            except Exception as e:
+                errors += 1
+                print(f"   ⚠️ Request failed: {e}")
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall_time = time.perf_counter() - start_ts
+    await client.close()
+
+    if not samples:
+        raise RuntimeError(f"All {errors} requests to {model} failed")
+
+    latencies = [s["latency"] for s in samples]
+    gaps = [g for s in samples for g in s["gaps"]]
+    input_tokens = sum(s["input_tokens"] for s in samples)
+    output_tokens = sum(s["output_tokens"] for s in samples)
+    input_cost, output_cost = compute_cost(model, input_tokens, output_tokens)
+
+    return LLMBenchmarkResult(
+        model_name=model,
+        api_provider=api_provider,
+        latency=sum(latencies) / len(latencies),
+        throughput=len(samples) / wall_time,
+        input_tokens=input_tokens,
+        output_tokens=output_tokens,
+        eval_rate=output_tokens / wall_time,
+        input_cost=input_cost,
+        output_cost=output_cost,
+        cost_usd=input_cost + output_cost,
+        requests=len(samples),
+        concurrency=concurrency,
+        errors=errors,
+        ttft=sum(s["ttft"] for s in samples) / len(samples),
+        inter_token_latency=sum(gaps) / len(gaps) if gaps else 0.0,
+        p50_latency=percentile(latencies, 50),
+        p90_latency=percentile(latencies, 90),
+        p99_latency=percentile(latencies, 99),
+    )
 
 # 3. Run the LLM benchmark functions
 prompt = """Summarize this Anthropic blog post:
@@ -81,24 +215,74 @@ prompt = """Summarize this Anthropic blog post:
 
                 Building a skill for an agent is like putting together an onboarding guide for a new hire. Instead of building fragmented, custom-designed agents for each use case, anyone can now specialize their agents with composable capabilities by capturing and sharing their procedural knowledge. In this article, we explain what Skills are, show how they work, and share best practices for building your own.
                 """
-results = []
 
 
-try:
-    openai_result = benchmark_openai(prompt)
-    results.append(openai_result)
-except Exception as e:
-    print(f"Skipping OpenAI benchmark: {e}")
+def run_single_shot() -> list:
+    results = []
+
+    try:
+        openai_result = benchmark_openai(prompt)
+        results.append(openai_result)
+    except Exception as e:
+        print(f"Skipping OpenAI benchmark: {e}")
+
+    try:
+        ollama_result = benchmark_ollama(prompt)
+        results.append(ollama_result)
+    except Exception as e:
+        print(f"Skipping Ollama benchmark: {e}")
+
+    return results
+
+
+def run_load(args) -> list:
+    stub = None
+    base_url, model, provider = args.base_url, args.model, args.provider
+    if args.stub:
+        from openai_stub import start_stub_server
+        stub, base_url = start_stub_server()
+        model, provider = "stub", "stub"
+        print(f"🧪 Using local OpenAI-compatible stub at {base_url}")
+
+    print(f"🚦 Load test: {model} x{args.concurrency} concurrent "
+          f"({f'{args.duration}s' if args.duration else f'{args.requests} requests'})")
+    try:
+        return [asyncio.run(benchmark_load(
+            prompt,
+            model=model,
+            base_url=base_url,
+            api_provider=provider,
+            concurrency=args.concurrency,
+            duration=args.duration,
+            num_requests=args.requests,
+        ))]
+    finally:
+        if stub:
+            stub.shutdown()
 
-try:
-    ollama_result = benchmark_ollama(prompt)
-    results.append(ollama_result)
-except Exception as e:
-    print(f"Skipping Ollama benchmark: {e}")
 
-# 4. Tabulate and print the results
-data = [result.model_dump() for result in results]
-print(tabulate(data, headers="keys", tablefmt="psql"))
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark LLM latency, throughput and cost.")
+    parser.add_argument("--load", action="store_true",
+                        help="Run N concurrent streaming requests instead of one call per provider.")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=None, help="Seconds to keep the load running.")
+    parser.add_argument("--requests", type=int, default=None, help="Total requests to send (default: 4 x concurrency).")
+    parser.add_argument("--model", default="gpt-4o")
+    parser.add_argument("--provider", default="openai", help="Label for the api_provider column.")
+    parser.add_argument("--base-url", default=None,
+                        help="OpenAI-compatible endpoint, e.g. http://localhost:11434/v1 for Ollama.")
+    parser.add_argument("--stub", action="store_true", help="Benchmark against a local offline stub server.")
+    parser.add_argument("--output", default=None,
+                        help="Optional JSON file for the results, e.g. to seed the agents' model_router.py.")
+    args = parser.parse_args()
 
-    
+    results = run_load(args) if args.load else run_single_shot()
 
+    # 4. Tabulate and print the results
+    data = [result.model_dump() for result in results]
+    print(tabulate(data, headers="keys", tablefmt="psql"))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+        print(f"\n📄 Results written to {args.output}")
@@ -0,0 +1,199 @@
+import argparse
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- CONFIGURATIONS ---
+# A tiny OpenAI-compatible server so the load benchmark runs offline and reproducibly.
+# It "generates" a fixed number of tokens with a fixed delay, so TTFT and
+# inter-token latency are known in advance and regressions in the client show up.
+DEFAULT_OUTPUT_TOKENS = 64
+DEFAULT_TTFT_S = 0.05
+DEFAULT_TOKEN_DELAY_S = 0.01
+
+# --tool-calls: a fixed, rule-based "policy" for the Week 0 agent's tools, so whole
+# agent runs (LLM -> MCP tools -> LLM) are reproducible offline
+ORDER_ID_RE = re.compile(r"\bORD-\d+\b")
+REFUND_LIKE_RE = re.compile(r"\b(refund|return|money back|damaged|broken|defective|lost|destroyed)", re.IGNORECASE)
+# The demo policy only allows full refunds for lost_in_transit / totally_destroyed items
+ELIGIBLE_RE = re.compile(r"\b(lost|destroyed)", re.IGNORECASE)
+
+
+def plan_tool_calls(messages: list, tool_names: set) -> list:
+    """
+    Deterministic tool choice for the current user turn. Returns [(name, arguments)]:
+    first search the policies (refund-like queries) and look up any order ids, then
+    refund the first order if the query names an eligible reason, then answer.
+    """
+    last_user = max((i for i, m in enumerate(messages) if m.get("role") == "user"), default=None)
+    if last_user is None:
+        return []
+    query = str(messages[last_user].get("content") or "")
+    called = {call["function"]["name"] for m in messages[last_user + 1:] if m.get("role") == "assistant"
+              for call in m.get("tool_calls") or []}
+    order_ids = list(dict.fromkeys(ORDER_ID_RE.findall(query)))
+
+    if not called:
+        calls = []
+        if REFUND_LIKE_RE.search(query) and "search_knowledge_base" in tool_names:
+            calls.append(("search_knowledge_base", {"query": query}))
+        if "get_order" in tool_names:
+            calls += [("get_order", {"order_id": order_id}) for order_id in order_ids]
+        return calls
+    if ("search_knowledge_base" in called and "process_refund" not in called and "process_refund" in tool_names
+            and order_ids and ELIGIBLE_RE.search(query)):
+        return [("process_refund", {"order_id": order_ids[0], "reason": query[:200]})]
+    return []
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    output_tokens = DEFAULT_OUTPUT_TOKENS
+    ttft_s = DEFAULT_TTFT_S
+    token_delay_s = DEFAULT_TOKEN_DELAY_S
+    tool_calls = False
+
+    def log_message(self, format, *args):
+        pass  # keep benchmark output clean
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        model = body.get("model", "stub")
+        max_tokens = body.get("max_tokens") or body.get("max_completion_tokens") or self.output_tokens
+        n_tokens = min(self.output_tokens, max_tokens)
+        # Roughly 4 characters per token, like the real tokenizers
+        prompt_tokens = sum(len(str(m.get("content") or "")) for m in body.get("messages", [])) // 4
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": n_tokens,
+                 "total_tokens": prompt_tokens + n_tokens}
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+
+        tool_calls = []
+        if self.tool_calls and body.get("tools") and body.get("tool_choice") != "none":
+            tool_names = {tool["function"]["name"] for tool in body["tools"]}
+            # Ids depend only on the conversation, so reruns produce identical transcripts
+            tool_calls = [
+                {"id": f"call_{len(body['messages'])}_{i}", "type": "function",
+                 "function": {"name": name, "arguments": json.dumps(arguments)}}
+                for i, (name, arguments) in enumerate(plan_tool_calls(body.get("messages", []), tool_names))
+            ]
+        if tool_calls:
+            n_tokens = sum(len(call["function"]["arguments"]) for call in tool_calls) // 4 + 1
+            usage = {"prompt_tokens": prompt_tokens, "completion_tokens": n_tokens,
+                     "total_tokens": prompt_tokens + n_tokens}
+
+        if body.get("stream"):
+            self._stream(completion_id, model, n_tokens, usage, tool_calls,
+                         include_usage=bool((body.get("stream_options") or {}).get("include_usage")))
+            return
+
+        time.sleep(self.ttft_s + self.token_delay_s * max(n_tokens - 1, 0))
+        if tool_calls:
+            message = {"role": "assistant", "content": None, "tool_calls": tool_calls}
+        else:
+            message = {"role": "assistant", "content": " ".join(f"tok{i}" for i in range(n_tokens))}
+        self._send_json({
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": message,
+                "finish_reason": "tool_calls" if tool_calls else "stop",
+            }],
+            "usage": usage,
+        })
+
+    def _send_json(self, payload: dict):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, completion_id: str, model: str, n_tokens: int, usage: dict, tool_calls: list,
+                include_usage: bool):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def chunk(delta: dict, finish_reason=None, usage_payload=None):
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [] if usage_payload else [
+                    {"index": 0, "delta": delta, "finish_reason": finish_reason}
+                ],
+            }
+            if usage_payload:
+                payload["usage"] = usage_payload
+            self._write_chunk(f"data: {json.dumps(payload)}\n\n")
+
+        time.sleep(self.ttft_s)
+        if tool_calls:
+            # One chunk per call, carrying the complete arguments
+            chunk({"role": "assistant", "content": None})
+            for i, call in enumerate(tool_calls):
+                time.sleep(self.token_delay_s)
+                chunk({"tool_calls": [{"index": i, **call}]})
+            chunk({}, finish_reason="tool_calls")
+        else:
+            chunk({"role": "assistant", "content": ""})
+            for i in range(n_tokens):
+                if i:
+                    time.sleep(self.token_delay_s)
+                chunk({"content": f"tok{i} "})
+            chunk({}, finish_reason="stop")
+        if include_usage:
+            chunk({}, usage_payload=usage)
+        self._write_chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, text: str):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+
+def start_stub_server(host: str = "127.0.0.1", port: int = 0, output_tokens: int = DEFAULT_OUTPUT_TOKENS,
+                      ttft_s: float = DEFAULT_TTFT_S, token_delay_s: float = DEFAULT_TOKEN_DELAY_S,
+                      tool_calls: bool = False):
+    """Starts the stub on a background thread. Returns (server, base_url); call server.shutdown() to stop."""
+    handler = type("ConfiguredStubHandler", (StubHandler,), {
+        "output_tokens": output_tokens, "ttft_s": ttft_s, "token_delay_s": token_delay_s,
+        "tool_calls": tool_calls,
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local OpenAI-compatible stub server.")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--output-tokens", type=int, default=DEFAULT_OUTPUT_TOKENS)
+    parser.add_argument("--ttft", type=float, default=DEFAULT_TTFT_S, help="Seconds before the first token.")
+    parser.add_argument("--token-delay", type=float, default=DEFAULT_TOKEN_DELAY_S, help="Seconds between tokens.")
+    parser.add_argument("--tool-calls", action="store_true",
+                        help="Answer agent requests with deterministic calls to the Week 0 MCP tools.")
+    args = parser.parse_args()
+    server, base_url = start_stub_server(port=args.port, output_tokens=args.output_tokens,
+                                         ttft_s=args.ttft, token_delay_s=args.token_delay,
+                                         tool_calls=args.tool_calls)
+    print(f"🧪 OpenAI-compatible stub listening on {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,246 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# The RAG code lives with the Week 0 agent; benchmark it exactly as the MCP server runs it
+AGENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "00_agentic_data_engineer")
+sys.path.insert(0, os.path.abspath(AGENT_DIR))
+
+from llm_benchmark import percentile
+
+# --- CONFIGURATIONS ---
+DEFAULT_SIZES = [1_000, 10_000, 100_000]   # add 1000000 for the full sweep (slow on CPU)
+DOCS_PER_FILE = 1_000
+NUM_QUERIES = 200
+BATCH_SIZE = 32
+TOP_K = 10
+GROUND_TRUTH_PAGE = 50_000
+
+PRODUCTS = ["laptop", "phone", "headphones", "blender", "sofa", "camera", "monitor", "printer",
+            "router", "tablet", "watch", "speaker", "vacuum", "drone", "keyboard", "microwave"]
+ISSUES = ["lost_in_transit", "totally_destroyed", "cosmetic damage", "scratches", "dents",
+          "functional defect", "late delivery", "wrong item", "missing parts", "battery failure"]
+OUTCOMES = ["a full refund", "a 10% partial refund", "a replacement", "store credit",
+            "a repair under warranty", "no refund"]
+CONDITIONS = ["within 30 days of delivery", "with a photo of the damage", "with the original receipt",
+              "if the seal is unbroken", "within the 1-year warranty", "after manager approval"]
+REGIONS = ["EU", "US", "APAC", "LATAM", "UK", "Canada"]
+
+
+def synthetic_policy(rng: random.Random, n: int) -> str:
+    return (
+        f"Policy {n}: In {rng.choice(REGIONS)}, a {rng.choice(PRODUCTS)} reported with "
+        f"{rng.choice(ISSUES)} is eligible for {rng.choice(OUTCOMES)} {rng.choice(CONDITIONS)}. "
+        f"Agents must log reason code RC-{rng.randint(100, 999)} and escalate "
+        f"{rng.choice(['never', 'above $500', 'for repeat customers', 'always'])}."
+    )
+
+
+def synthetic_query(rng: random.Random) -> str:
+    return (f"can I get {rng.choice(OUTCOMES)} for a {rng.choice(PRODUCTS)} "
+            f"with {rng.choice(ISSUES)} in {rng.choice(REGIONS)}?")
+
+
+def write_corpus(root: str, size: int, seed: int) -> int:
+    """Writes `size` policy chunks as Markdown files (one chunk per paragraph)."""
+    rng = random.Random(seed)
+    os.makedirs(root, exist_ok=True)
+    max_len = 0
+    for file_no, start in enumerate(range(0, size, DOCS_PER_FILE)):
+        paragraphs = [synthetic_policy(rng, n) for n in range(start, min(start + DOCS_PER_FILE, size))]
+        max_len = max(max_len, *(len(p) for p in paragraphs))
+        with open(os.path.join(root, f"policies_{file_no:05d}.md"), "w", encoding="utf-8") as f:
+            f.write("\n\n".join(paragraphs))
+    return max_len
+
+
+def exact_top_k(collection, query_vectors: np.ndarray, k: int) -> list:
+    """Brute-force L2 top-k over every vector in the collection, paged to bound memory."""
+    all_ids = []
+    best_idx = np.empty((len(query_vectors), 0), dtype=np.int64)
+    best_dist = np.empty((len(query_vectors), 0), dtype=np.float32)
+    q_sq = (query_vectors ** 2).sum(axis=1, keepdims=True)
+    while True:
+        page = collection.get(include=["embeddings"], limit=GROUND_TRUTH_PAGE, offset=len(all_ids))
+        if not page["ids"]:
+            break
+        vectors = np.asarray(page["embeddings"], dtype=np.float32)
+        dist = q_sq - 2 * query_vectors @ vectors.T + (vectors ** 2).sum(axis=1)
+        page_idx = np.broadcast_to(np.arange(len(all_ids), len(all_ids) + len(vectors)), dist.shape)
+        merged_dist = np.concatenate([best_dist, dist], axis=1)
+        merged_idx = np.concatenate([best_idx, page_idx], axis=1)
+        order = np.argsort(merged_dist, axis=1)[:, :k]
+        best_dist = np.take_along_axis(merged_dist, order, axis=1)
+        best_idx = np.take_along_axis(merged_idx, order, axis=1)
+        all_ids += page["ids"]
+    return [[all_ids[i] for i in row] for row in best_idx]
+
+
+def hnsw_bytes(db_path: str) -> int:
+    """On-disk size of Chroma's HNSW segment files, which are held in memory once the index is loaded."""
+    total = 0
+    for entry in os.scandir(db_path):
+        if entry.is_dir() and entry.name != "quantized_index":
+            total += sum(os.path.getsize(os.path.join(root, name))
+                         for root, _, names in os.walk(entry.path) for name in names)
+    return total
+
+
+def latency_summary(latencies: list, wall_time: float) -> dict:
+    return {
+        "queries": len(latencies),
+        "qps": round(len(latencies) / wall_time, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p90_ms": round(percentile(latencies, 90) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+async def measure_search(kb, single_queries: list, batched_queries: list, batch_size: int) -> dict:
+    """
+    Latency of KnowledgeBase.search, one query at a time and `batch_size` at a time.
+
+    The two phases use different queries so the second one isn't served by the
+    embedding cache that the first one just warmed.
+    """
+    single = []
+    start_ts = time.perf_counter()
+    for query in single_queries:
+        t0 = time.perf_counter()
+        await kb.search(query)
+        single.append(time.perf_counter() - t0)
+    single_wall = time.perf_counter() - start_ts
+
+    async def timed(query):
+        t0 = time.perf_counter()
+        await kb.search(query)
+        return time.perf_counter() - t0
+
+    batched = []
+    start_ts = time.perf_counter()
+    for i in range(0, len(batched_queries), batch_size):
+        batched += await asyncio.gather(*(timed(q) for q in batched_queries[i:i + batch_size]))
+    batched_wall = time.perf_counter() - start_ts
+
+    return {
+        "single": latency_summary(single, single_wall),
+        "batched": {**latency_summary(batched, batched_wall), "concurrency": batch_size},
+    }
+
+
+def run_size(size: int, workdir: str, args) -> dict:
+    import chromadb
+    import ingest_knowledge
+    from embedding_cache import get_embedding_function
+    from embedding_pool import EmbeddingPool
+    from knowledge_base import KnowledgeBase
+    from quantized_index import QuantizedIndex
+
+    print(f"\n📏 Corpus size: {size:,} chunks")
+    corpus_dir = os.path.join(workdir, f"corpus_{size}")
+    db_path = os.path.join(workdir, f"db_{size}")
+    # Windows just larger than the longest paragraph, so the chunker splits on paragraph breaks
+    chunk_size = write_corpus(corpus_dir, size, seed=size) + 2
+
+    # 1. Ingest throughput (the real ingest_data path: process pool -> queue -> upserts)
+    ingest = ingest_knowledge.ingest_data(
+        sources=[corpus_dir], workers=args.workers, chunk_size=chunk_size, overlap=0, db_path=db_path,
+    )
+
+    # 2. Query latency through the same KnowledgeBase the MCP server uses, per vector backend
+    client = chromadb.PersistentClient(path=db_path)
+    embed_fn = get_embedding_function()
+    collection = client.get_collection(ingest_knowledge.COLLECTION_NAME, embedding_function=embed_fn)
+    # --embed-workers: embed in forked processes sharing one model, as `mcp_server.py --workers` does
+    pool = EmbeddingPool(args.embed_workers).start() if args.embed_workers else None
+    rng = random.Random(size + 1)
+    # 3. recall@k of each backend against exact brute force over the stored vectors
+    query_vectors = np.asarray(embed_fn([synthetic_query(rng) for _ in range(args.queries)]), dtype=np.float32)
+    truth = exact_top_k(collection, query_vectors, args.k)
+
+    backends = {}
+    try:
+        for backend in args.backends.split(","):
+            vector_index, footprint = None, {}
+            if backend == "quantized":
+                start_ts = time.perf_counter()
+                vector_index = QuantizedIndex.build(collection, os.path.join(db_path, "quantized_index"))
+                footprint = {"build_s": round(time.perf_counter() - start_ts, 2), **vector_index.memory_bytes()}
+                approx = [[doc_id for doc_id, _ in row] for row in vector_index.search(query_vectors, args.k)]
+            elif backend == "chroma":
+                footprint = {"hnsw_bytes": hnsw_bytes(db_path)}
+                approx = collection.query(query_embeddings=query_vectors.tolist(), n_results=args.k)["ids"]
+            else:
+                raise ValueError(f"Unknown backend: {backend}")
+            recall = float(np.mean([len(set(a) & set(t)) / len(t) for a, t in zip(approx, truth)]))
+
+            embedder = pool.embed if pool else (embed_fn if vector_index else None)
+            kb = KnowledgeBase(collection, bm25_path=os.path.join(db_path, ingest_knowledge.BM25_FILE),
+                               workers=max(4, args.embed_workers), query_embedder=embedder,
+                               vector_index=vector_index)
+            # Fresh queries per backend, so none of them is served by the embedding cache
+            queries = [synthetic_query(rng) for _ in range(args.queries)]
+            batched_queries = [synthetic_query(rng) for _ in range(args.queries)]
+            search = asyncio.run(measure_search(kb, queries, batched_queries, args.batch_size))
+            backends[backend] = {"search": search, "memory": footprint, f"recall_at_{args.k}": round(recall, 4)}
+            print(f"   ✅ {backend}: single p50 {search['single']['p50_ms']}ms | "
+                  f"batched {search['batched']['qps']} qps | recall@{args.k} {recall:.3f} | {footprint}")
+    finally:
+        if pool:
+            pool.shutdown()
+
+    result = {
+        "size": size,
+        "ingest": ingest,
+        "embed_workers": args.embed_workers,
+        "backends": backends,
+    }
+    print(f"   ✅ ingest {ingest['chunks_per_s']} chunks/s")
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the knowledge-base (RAG) path.")
+    parser.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES),
+                        help="Comma-separated corpus sizes in chunks, e.g. 1000,10000,100000,1000000")
+    parser.add_argument("--queries", type=int, default=NUM_QUERIES)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Concurrent queries per batch.")
+    parser.add_argument("--k", type=int, default=TOP_K, help="k for recall@k.")
+    parser.add_argument("--workers", type=int, default=None, help="Ingest worker processes.")
+    parser.add_argument("--embed-workers", type=int, default=0,
+                        help="Query-embedding worker processes (0 = in-process), to measure scaling.")
+    parser.add_argument("--backends", default="chroma,quantized",
+                        help="Comma-separated vector backends: chroma (HNSW), quantized (int8 scan + rerank).")
+    parser.add_argument("--output", default="retrieval_benchmark.json")
+    parser.add_argument("--workdir", default=None, help="Keep corpora and DBs here instead of a temp dir.")
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="retrieval_bench_")
+    # Cold embedding cache per run, otherwise we would be benchmarking the cache
+    os.environ.setdefault("EMBED_CACHE_DIR", os.path.join(workdir, "embedding_cache"))
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {"queries": args.queries, "batch_size": args.batch_size, "k": args.k,
+                   "backends": args.backends},
+        "results": [],
+    }
+    try:
+        for size in (int(s) for s in args.sizes.split(",")):
+            report["results"].append(run_size(size, workdir, args))
+            # Write after every size so a long sweep still leaves partial results behind
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"\n📄 Results written to {args.output}")